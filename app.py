@@ -1,61 +1,176 @@
+import io
 import os
+import uuid
 from datetime import timedelta, datetime, timezone
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
-from flask_session import Session
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from sqlalchemy.orm import Session as DBSession
-from sqlalchemy.sql import func
+from flask import Flask, Response, current_app, request, jsonify, render_template, stream_template, session, redirect, url_for
+from session_store import ServerSideSessionInterface, create_store
+from sqlalchemy.orm import Session as DBSession, joinedload
 from dotenv import load_dotenv
-from models import Role, User, Content
-from utils import get_db, is_valid_password, is_valid_email, hash_password, check_password, get_current_user, check_permission, handle_error
+from models import Role, User, Content, Job
+import passwords
+from passwords import verify_and_update
+from permissions import role_map
+from principals import Principal, principal_cache
+import user_directory
+from authors import author_name, count_change, display_name
+from archive import content_cli, find_archived, restore_content
+from audit import audit_cli, audit_log, content_state
+from search import search_quotes, result_to_json
+from feed import fetch_page, stream_feed, row_to_json, with_capabilities
+from database import migrate_cli
+from internal import internal
+from jobs import enqueue, jobs_cli
+from rate_limit import limiter, limit_login, limit_register, mutation_limit, too_many_requests
+import instrumentation
+from events import content_changed
+from page_cache import cached_feed, render_quote_card
+from live_feed import stream_events
+import quote_io
+from records import QuoteFormRecord, quote_form_select
+from moderation import ModerationError, moderate, submit as submit_moderation
+from utils import get_db, close_db, is_valid_password, is_valid_email, hash_password, get_current_user, handle_error, inject_permissions, login_required, permission_required, remember_writes, replica_reads
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "mysecretkey")  # Secret key for sessions
-app.config["SESSION_TYPE"] = "filesystem"
-app.config['SESSION_PERMANENT'] = True # Session should last even after browser is closed
-Session(app)  # Initialize session management
-
-# Initialize Limiter
-limiter = Limiter(key_func=get_remote_address)
-limiter.init_app(app)
-
-@app.route("/", methods=["GET"])
+# Views are collected here and added to the app by create_app, endpoint names are the function names
+routes = []
+
+def route(rule, **options):
+    def decorator(view):
+        routes.append((rule, view, options))
+        return view
+    return decorator
+
+# Application factory, used by `flask`, gunicorn (wsgi.py) and the benchmarks.
+# Building the app doesn't connect to the database, the engine is created on the first query
+def create_app():
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "mysecretkey")  # Secret key for sessions
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=30)
+    # Server-side sessions, stored in SQLite or Redis (SESSION_BACKEND), see session_store.py
+    app.session_interface = ServerSideSessionInterface(create_store())
+
+    # Schema migrations: `flask db upgrade`, `flask db migrate -m "..."`
+    app.cli.add_command(migrate_cli)
+
+    # Quote cards are rendered once and reused, see page_cache.py
+    app.jinja_env.globals["quote_card"] = render_quote_card
+
+    # `permissions` of the logged in user in every template, from the role map (permissions.py)
+    app.context_processor(inject_permissions)
+
+    # One database session per request, closed when the request ends
+    app.teardown_appcontext(close_db)
+    # Clients that just wrote read from the primary, not from a replica that may be behind (DB_REPLICA_URLS)
+    app.after_request(remember_writes)
+
+    # Internal endpoints (pool statistics, ...)
+    app.register_blueprint(internal)
+
+    # Per-request timings, /internal/metrics and Server-Timing headers, see instrumentation.py
+    instrumentation.init_app(app)
+
+    # Bulk import/export: `flask quotes import|export ...`, see quote_io.py
+    app.cli.add_command(quote_io.quotes_cli)
+
+    # History of quote and role changes: `flask audit replay`, see audit.py
+    app.cli.add_command(audit_cli)
+
+    # Archival of deleted quotes and the monthly content partitions: `flask content archive|partitions`, see archive.py
+    app.cli.add_command(content_cli)
+
+    # Background jobs: `flask jobs work|stats|retry|purge`, see jobs.py
+    app.cli.add_command(jobs_cli)
+
+    # Rate limits shared by all workers (RATELIMIT_STORAGE_URI), see rate_limit.py
+    limiter.init_app(app)
+    app.register_error_handler(429, too_many_requests)
+
+    for rule, view, options in routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
+# Work that every worker would otherwise repeat on its first requests. With gunicorn's preload_app it runs once
+# in the master before the fork, so the workers share the result (see gunicorn.conf.py)
+def warm_up(app):
+    # Compile every template into the Jinja cache
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+    # Build the argon2 context and load the role permissions
+    passwords.get_context()
+    role_map.get()
+
+@route("/", methods=["GET"])
+@replica_reads
+@cached_feed()
 def index():
-    db: Session = next(get_db())
-    contents = (
-        db.query(
-            Content.id,
-            Content.quote,
-            Content.status,
-            Content.created_by,
-            Content.created_at,
-            func.concat(User.first_name, " ", User.last_name).label("posts_by")
-        )
-        .join(User, Content.created_by == User.id)  # Join Content with User based on created_by
-        .filter(Content.status != "Inactive")  # Exclude inactive content
-        .order_by(Content.created_at.desc())
-        .all()
-    )
-    contents_list = [{"id": content.id, "quote": content.quote, "status": content.status, "created_by": content.created_by, "posts_by": content.posts_by} for content in contents]
-    users = db.query(User).all()
-    db.close()
-    print(contents_list)
-    return render_template("index.html", contents=contents_list, users=users)
+    cursor = request.args.get("cursor")
+    db: DBSession = get_db()
 
-@app.route("/session", methods=["GET"])
+    # Streaming mode: render the feed while rows are still being read from a server-side cursor
+    if request.args.get("stream"):
+        try:
+            contents = with_capabilities(stream_feed(db, cursor), get_current_user())
+        except ValueError as e:
+            return handle_error(str(e))
+        return Response(stream_template("index.html", contents=contents))
+
+    try:
+        contents_list, next_cursor = fetch_page(db, cursor, request.args.get("limit", type=int))
+    except ValueError as e:
+        return handle_error(str(e))
+    contents_list = list(with_capabilities(contents_list, get_current_user()))
+    return render_template("index.html", contents=contents_list, next_cursor=next_cursor)
+
+@route("/api/quotes", methods=["GET"])
+@replica_reads
+@cached_feed(anonymous_only=False)
+def api_quotes():
+    db: DBSession = get_db()
+    try:
+        contents_list, next_cursor = fetch_page(db, request.args.get("cursor"), request.args.get("limit", type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [row_to_json(content) for content in contents_list], "next_cursor": next_cursor})
+
+# Server-sent events with the quote changes, for the open feed pages (see live_feed.py).
+# Serve it from the ASGI app when there are many viewers, here every stream holds a thread
+@route("/api/feed/stream", methods=["GET"])
+def feed_stream():
+    events = stream_events(request.headers.get("Last-Event-ID"))
+    if events is None:
+        return jsonify({"error": "Too many live feed streams, try again later."}), 503, {"Retry-After": "30"}
+    return Response(events, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@route("/search", methods=["GET"])
+@replica_reads
+def search():
+    q = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, has_next = search_quotes(get_db(), q, page)
+    return render_template("search.html", q=q, results=results, page=page, has_next=has_next)
+
+@route("/api/search", methods=["GET"])
+@replica_reads
+def api_search():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "Query parameter q is required."}), 400
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, has_next = search_quotes(get_db(), q, page)
+    return jsonify({"items": [result_to_json(result) for result in results], "page": page, "next_page": page + 1 if has_next else None})
+
+@route("/session", methods=["GET"])
 def check_session():
     user = get_current_user()
     if user:
         return jsonify({"message": f"User is logged in with ID {user.id}"})
     return jsonify({"message": "No user is logged in"}), 401
 
-@app.route("/login", methods=["GET", "POST"])
-@limiter.limit("5 per minute")
+@route("/login", methods=["GET", "POST"])
+@limit_login
 def login():
     if request.method == "POST":
         # Get data from the form    
@@ -66,21 +181,27 @@ def login():
             return render_template("login.html", error="Email and password are required.")
 
         # Check if the email exists in the database
-        db: DBSession = next(get_db())
+        db: DBSession = get_db()
         user = db.query(User).filter(User.email == email).first()
 
         # If the user is found and password matches
-        if user and check_password(password, user.password_hash):
+        verified, new_hash = verify_and_update(password, user.password_hash) if user else (False, None)
+        if verified:
+            # Argon2 parameters changed since this hash was made, store the upgraded hash
+            if new_hash:
+                user.password_hash = new_hash
+                db.commit()
+
+            # A new session id for the logged in session, the one from before the login is deleted
+            session.regenerate()
             session.permanent = True
             # Store user ID in session
             session["user_id"] = user.id
             session["role"] = user.role.name
-            session["permissions"] = user.role.permissions
-            print(session["permissions"])
+            principal_cache.put(user.id, Principal.from_user(user))
 
             # Set session expiry (30 days)
-            app.permanent_session_lifetime = timedelta(days=30)
-            print("Login successful")
+            current_app.permanent_session_lifetime = timedelta(days=30)
             return redirect(url_for("index"))
 
         # If email or password does not match
@@ -88,14 +209,14 @@ def login():
 
     return render_template("login.html")
 
-@app.route("/logout", methods=["POST"])
+@route("/logout", methods=["POST"])
 def logout():
     # Clear session data
     session.clear()
-    print("logout successful")
     return redirect(url_for("index"))
 
-@app.route("/register", methods=["GET", "POST"])
+@route("/register", methods=["GET", "POST"])
+@limit_register
 def register():
     if request.method == "POST":
         # Get data from the form
@@ -138,7 +259,7 @@ def register():
         # Hash password
         password_hash = hash_password(password)
 
-        db: DBSession = next(get_db())
+        db: DBSession = get_db()
 
         try:
             existing_email = db.query(User).filter(User.email == email).first()
@@ -156,6 +277,7 @@ def register():
             new_user = User(
                 first_name=first_name,
                 last_name=last_name,
+                display_name=display_name(first_name, last_name),
                 bio=bio,
                 email=email,
                 password_hash=password_hash,
@@ -164,89 +286,98 @@ def register():
             db.add(new_user)
             db.commit()
 
+            # Signing up logs in, with a new session id as at login
+            session.regenerate()
             session.permanent = True
             session["user_id"] = new_user.id
-            app.permanent_session_lifetime = timedelta(days=30)
+            current_app.permanent_session_lifetime = timedelta(days=30)
             return redirect(url_for("index"))
 
         except Exception as e:
             db.rollback()
             return handle_error(f"Error: {str(e)}")
-        finally:
-            db.close()
 
     # Handle GET request
     return render_template("register.html", data={})
 
-@app.route("/createquote", methods=["GET", "POST"])
+@route("/createquote", methods=["GET", "POST"])
+@mutation_limit
+@permission_required("create_own_content", "Unauthorized to create content.")
 def create_content():
-    # User must be logged in to create content
     user = get_current_user()
-    if not user:
-        return redirect(url_for("login"))
-    
-    if not check_permission(user, "create_own_content"):
-        return handle_error("Unauthorized to create content.")
-    
+
     if request.method == "POST":
         # Quote required
         quote = request.form.get("quote", "").strip()
         if not quote:
             return render_template("index.html", error="Quote is required.")
     
-        db: Session = next(get_db())
+        db: DBSession = get_db()
     
         try:
             # Create new content
             new_content = Content(
+                id=uuid.uuid4(),
                 quote=quote,
                 status="Active",
                 created_by=user.id,
                 created_at=datetime.now(timezone.utc),
                 updated_at=datetime.now(timezone.utc),
+                author_name=author_name(user.id),
             )
 
             db.add(new_content)
+            # The author's quote counts are updated by a background job, see jobs.py
+            enqueue(db, "authors.recount", {"author_id": str(user.id)}, idempotency_key=f"content.created:{new_content.id}")
+            after = content_state(new_content)
             db.commit()
-            print("Content created successfully")
+            content_changed.send(current_app._get_current_object(), content_id=new_content.id, action="created")
+            audit_log.record("content", new_content.id, "created", None, after, actor_id=user.id)
             return redirect(url_for("index"))
             
         except Exception as e:
             db.rollback()  # Rollback on error
             return handle_error(f"Error: {str(e)}")
-        finally:
-            db.close()  # Close the session after the operation
 
     # If the method is GET
     return render_template("createquote.html")
 
-@app.route("/content/<content_id>/edit", methods=["GET", "POST"])
+@route("/content/<uuid:content_id>/edit", methods=["GET", "POST"])
+@mutation_limit
+@permission_required("update_own_content", "Unauthorized to update content.")
 def update_content(content_id):
-    # User must be logged in to update content
     user = get_current_user()
-    if not user:
-        return redirect(url_for("login"))
-    
-    db: Session = next(get_db())
-
-    if not check_permission(user, "update_own_content"):
-        return handle_error("Unauthorized to update content.")
-
-    content = db.query(Content).filter(Content.id == content_id).first()
-    if not content:
+    db: DBSession = get_db()
+
+    if request.method == "GET":
+        # The form only shows the quote, read as a record (records.py) from content or content_archive
+        row = db.execute(quote_form_select(content_id)).first()
+        shown = QuoteFormRecord.from_row(row) if row else None
+        content = archived = None
+    else:
+        # Locked until the commit, like delete and ban: two concurrent unbans can't both count the status change
+        content = db.query(Content).filter(Content.id == content_id).with_for_update().first()
+        # A long banned quote may have been moved to content_archive (archive.py), it comes back when edited
+        archived = find_archived(db, content_id) if not content else None
+        shown = content or archived
+    if not shown:
         return handle_error("Content not found.")
 
-    # Check if the user is authorized to update this content
-    if content.created_by != user.id:
+    # Check if the user is authorized to update this content (the record's ids are strings)
+    if str(shown.created_by) != str(user.id):
         return handle_error("You do not have permission to edit this content.")
         
-    if content.status == "Inactive":
+    if shown.status == "Inactive":
         return handle_error("This Quote is inactive.")
 
     if request.method == "POST":
         try:
+            if archived:
+                content = restore_content(db, archived)
             # Get the new quote from the form; if not provided, use the current quote
             new_quote = request.form.get("quote", "").strip()
+            old_status = content.status
+            before = content_state(content)
             if content.status == "Ban":
                 content.status = "Active"
                 content.updated_at = datetime.now(timezone.utc)
@@ -256,28 +387,29 @@ def update_content(content_id):
                 content.quote = new_quote if new_quote else content.quote
                 content.updated_at = datetime.now(timezone.utc)
 
+            if content.status != old_status:
+                db.execute(count_change(content.created_by, old_status, content.status))
+            after = content_state(content)
             db.commit()
-            print("Content update successful")
+            content_changed.send(current_app._get_current_object(), content_id=content.id, action="updated")
+            audit_log.record("content", content.id, "updated", before, after, actor_id=user.id)
             return redirect(url_for("index"))
         except Exception as e:
             db.rollback()  # Rollback on error
             return handle_error(f"Error: {str(e)}")
-        finally:
-            db.close()  # Close the session after the operation
     
     # If the method is GET, render the update form
-    return render_template("updatequote.html", content=content)
+    return render_template("updatequote.html", content=shown)
 
-@app.route("/content/<content_id>/delete", methods=["GET"])
+@route("/content/<uuid:content_id>/delete", methods=["GET"])
+@mutation_limit
+@login_required
 def delete_content(content_id):
-    # User must be logged in to create content
     user = get_current_user()
-    if not user:
-        return redirect(url_for("login"))
-    
-    db: Session = next(get_db())
+    db: DBSession = get_db()
     try:
-        content = db.query(Content).filter(Content.id == content_id).first()
+        # Locked until the commit, so two concurrent requests can't both count the same status change
+        content = db.query(Content).filter(Content.id == content_id).with_for_update().first()
         if not content:
             return handle_error("Content not found.")
         
@@ -288,32 +420,28 @@ def delete_content(content_id):
         if content.status == "Inactive":
             return handle_error("This Quote was not found.")
         
+        before = content_state(content)
+        db.execute(count_change(content.created_by, content.status, "Inactive"))
         content.status = "Inactive"
         content.updated_at = datetime.now(timezone.utc)
+        after = content_state(content)
 
         db.commit()
-        print("delete content successful")
+        content_changed.send(current_app._get_current_object(), content_id=content.id, action="deleted")
+        audit_log.record("content", content_id, "deleted", before, after, actor_id=user.id)
         return redirect(url_for("index"))
             
     except Exception as e:
         db.rollback()  # Rollback on error
         return handle_error(f"Error: {str(e)}")
-    finally:
-        db.close()  # Close the session after the operation
 
-@app.route("/content/<content_id>/ban", methods=["GET"])
+@route("/content/<uuid:content_id>/ban", methods=["GET"])
+@mutation_limit
+@permission_required("ban", "Unauthorized to ban content.")
 def ban_content(content_id):
-    # User must be logged in to create content
-    user = get_current_user()
-    if not user:
-        return redirect(url_for("login"))
-
-    if not check_permission(user, "ban"):
-        return handle_error("Unauthorized to ban content.")
-    
-    db: Session = next(get_db())
+    db: DBSession = get_db()
     try:
-        content = db.query(Content).filter(Content.id == content_id).first()
+        content = db.query(Content).filter(Content.id == content_id).with_for_update().first()
         if not content:
             return handle_error("Content not found.")
         
@@ -321,30 +449,31 @@ def ban_content(content_id):
         if content.status == "Inactive" or content.status == "Ban":
             return handle_error("This content is already archived or baded and cannot be banned.")
         
-        content.status = "Ban" if content.status == "Active" else "Inactive"
+        before = content_state(content)
+        new_status = "Ban" if content.status == "Active" else "Inactive"
+        db.execute(count_change(content.created_by, content.status, new_status))
+        content.status = new_status
         content.updated_at = datetime.now(timezone.utc)
+        after = content_state(content)
 
         db.commit()
-        print("ban content successful")
+        content_changed.send(current_app._get_current_object(), content_id=content.id, action="banned")
+        audit_log.record("content", content_id, "banned", before, after, actor_id=get_current_user().id)
+        # Drop the author's cached principal so their next request reloads it
+        principal_cache.invalidate(content.created_by)
         return redirect(url_for("index"))
             
     except Exception as e:
         db.rollback()  # Rollback on error
         return handle_error(f"Error: {str(e)}")
-    finally:
-        db.close()  # Close the session after the operation
 
-@app.route("/managerole", methods=["GET", "POST"])
+@route("/managerole", methods=["GET", "POST"])
+@replica_reads
+@permission_required("updateadmin", "Unauthorized to change user role.")
 def managerole():
-    # Ensure user is logged in
     user = get_current_user()
-    if not user:
-        return redirect(url_for("login"))
-
-    if not check_permission(user, "updateadmin"):
-        return handle_error("Unauthorized to change user role.")
 
-    db: Session = next(get_db())
+    db: DBSession = get_db()
 
     if request.method == "POST":
         # Handle the role update logic here
@@ -356,9 +485,10 @@ def managerole():
             return handle_error("Invalid role.")
 
         try:
-            target_user = db.query(User).filter(User.id == target_user_id).first()
+            target_user = db.query(User).options(joinedload(User.role)).filter(User.id == target_user_id).first()
             if not target_user:
                 return handle_error("User not found.")
+            before = {"role": target_user.role.name if target_user.role else None}
 
             role = db.query(Role).filter(Role.name == new_role).first()
             if not role:
@@ -366,19 +496,109 @@ def managerole():
 
             target_user.role_id = role.id
             db.commit()
+            # The user's cached role is stale now
+            principal_cache.invalidate(target_user.id)
+            audit_log.record("user_role", target_user_id, "role_changed", before, {"role": new_role}, actor_id=user.id)
             return redirect(url_for("index"))
 
         except Exception as e:
             db.rollback()
             return handle_error(f"Error: {str(e)}")
 
-    # GET request: fetch users for role management
-    users = db.query(User).filter(User.id != user.id).join(Role).filter(Role.name != 'superadmin').all()
+    # GET request: one page of users for role management, optionally filtered by ?q=
+    search = request.args.get("q", "").strip()
+    users, next_cursor = user_directory.fetch_page(
+        db, request.args.get("cursor"), exclude_user_id=user.id, search=search
+    )
+
+    return render_template("managerole.html", users=users, search=search, next_cursor=next_cursor)
 
-    db.close()
-    return render_template("managerole.html", users=users)
+@route("/api/users", methods=["GET"])
+@replica_reads
+@permission_required("updateadmin", "Unauthorized to list users.", api=True)
+def api_users():
+    user = get_current_user()
+    users, next_cursor = user_directory.fetch_page(
+        get_db(),
+        request.args.get("cursor"),
+        request.args.get("limit", type=int),
+        exclude_user_id=user.id,
+        search=request.args.get("q", "").strip(),
+    )
+    return jsonify({"items": [user_directory.row_to_json(row) for row in users], "next_cursor": next_cursor})
+
+# Bulk import of a JSONL or CSV upload (form field "file") or request body, authors matched by author_email
+@route("/api/quotes/import", methods=["POST"])
+@mutation_limit
+@permission_required("updateadmin", "Unauthorized to import quotes.", api=True)
+def api_import_quotes():
+    upload = request.files.get("file")
+    fmt = request.args.get("format") or quote_io.format_from_filename(upload.filename if upload else None)
+    if fmt not in quote_io.FORMATS:
+        return jsonify({"error": "format must be jsonl or csv."}), 400
+
+    # Read as a stream, the upload is never loaded in memory as a whole
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding="utf-8", newline="")
+    result = quote_io.import_quotes(get_db(), stream, fmt)
+    return jsonify(result.to_dict())
+
+@route("/api/quotes/export", methods=["GET"])
+@replica_reads
+@permission_required("updateadmin", "Unauthorized to export quotes.", api=True)
+def api_export_quotes():
+    fmt = request.args.get("format", "jsonl")
+    status = request.args.get("status")
+    if fmt not in quote_io.FORMATS or (status and status not in quote_io.STATUSES):
+        return jsonify({"error": "format must be jsonl or csv, status Active, Inactive or Ban."}), 400
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = Response(quote_io.export_quotes(fmt, status), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=quotes.{fmt}"
+    return response
+
+# Ban or restore many quotes in one transaction:
+#   {"action": "ban"|"restore", "ids": [...]} or {"action": ..., "filters": {"author", "created_from", "created_to", "text"}}
+# With "async": true the job is queued and its result is read from /api/moderation/jobs/<id>
+@route("/api/moderation", methods=["POST"])
+@mutation_limit
+@permission_required("ban", "Unauthorized to moderate content.", api=True)
+def api_moderation():
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    filters = data.get("filters")
+    if (ids is not None and not isinstance(ids, list)) or (filters is not None and not isinstance(filters, dict)):
+        return jsonify({"error": "ids must be a list and filters an object."}), 400
+
+    actor_id = get_current_user().id
+    try:
+        if data.get("async"):
+            db = get_db()
+            job_id = submit_moderation(db, data.get("action"), ids, filters, actor_id)
+            db.commit()
+            return jsonify({"job_id": str(job_id), "status": "queued"}), 202
+        result = moderate(get_db(), data.get("action"), ids, filters, actor_id)
+    except ModerationError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result.to_dict())
+
+@route("/api/moderation/jobs/<job_id>", methods=["GET"])
+@permission_required("ban", "Unauthorized to moderate content.", api=True)
+def api_moderation_job(job_id):
+    try:
+        job_id = uuid.UUID(job_id)
+    except ValueError:
+        return jsonify({"error": "Job not found."}), 404
+    job = get_db().query(Job).filter(Job.id == job_id, Job.name == "moderation.run").first()
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    status = {"id": str(job.id), "status": job.status}
+    if job.status == "done":
+        status["result"] = job.result
+    elif job.last_error:
+        status["error"] = job.last_error
+    return jsonify(status)
 
 if __name__ == "__main__":
     # Get the port from the .env file
     port = int(os.getenv("Port", 5000)) # default to 5000 if PORT is not set
-    app.run(debug=True, host="0.0.0.0", port=port)
\ No newline at end of file
+    create_app().run(debug=True, host="0.0.0.0", port=port)
\ No newline at end of file
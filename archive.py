@@ -0,0 +1,140 @@
+# archive.py
+# Moves deleted (Inactive) quotes, and optionally quotes banned long ago, out of content into
+# content_archive, so the hot table and its indexes only hold the quotes the feed can show.
+# Batches are small, each is its own short transaction, and on Postgres rows locked by a request are
+# skipped until the next run. Run it from cron: `flask content archive`
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import click
+from dotenv import load_dotenv
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, insert, literal, or_, select, text
+from authors import count_change, recount_authors
+from database import SessionLocal, month_partition_ddl
+from events import content_changed
+from models import ACTIVE, BANNED, INACTIVE, Content, ContentArchive
+
+# Load environment variables from .env file
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))  # quotes moved per transaction
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", 0.1))  # seconds between batches, leaves room for the requests
+# Banned quotes not edited for this many days are archived too, 0 keeps every banned quote in content
+ARCHIVE_BANNED_AFTER_DAYS = int(os.getenv("ARCHIVE_BANNED_AFTER_DAYS", 0))
+CONTENT_PARTITIONS_AHEAD = int(os.getenv("CONTENT_PARTITIONS_AHEAD", 3))  # months of content partitions made in advance
+
+COLUMNS = ("id", "quote", "status", "created_by", "created_at", "updated_at", "author_name")
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Postgres: the monthly partitions of content up to `ahead` months from now. New quotes then never land in
+# content_default, whose rows would block creating the partition of their month
+def ensure_content_partitions(db, ahead=CONTENT_PARTITIONS_AHEAD):
+    if db.get_bind().dialect.name != "postgresql":
+        return 0
+    now = utcnow()
+    created = 0
+    for offset in range(ahead + 1):
+        year, month = divmod(now.year * 12 + now.month - 1 + offset, 12)
+        try:
+            with db.begin_nested():
+                db.execute(text(month_partition_ddl("content", year, month + 1)))
+            created += 1
+        except Exception:
+            log.exception("Could not create the content partition for %04d-%02d", year, month + 1)
+    db.commit()
+    return created
+
+# The status != 'Active' term is the predicate of the partial index ix_content_archivable, spelled out so
+# SQLite picks the index too (Postgres infers it from the rest)
+def archivable(banned_before=None):
+    condition = Content.status == INACTIVE
+    if banned_before is not None:
+        condition = or_(condition, and_(Content.status == BANNED, Content.updated_at < banned_before))
+    return and_(Content.status != ACTIVE, condition)
+
+# Moves one batch, returns the statuses of the moved quotes
+def archive_batch(db, batch_size=ARCHIVE_BATCH_SIZE, banned_before=None):
+    rows = db.execute(
+        select(Content.id, Content.created_by, Content.status)
+        .where(archivable(banned_before))
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        return []
+    ids = [row.id for row in rows]
+    columns = [getattr(Content, name) for name in COLUMNS]
+    db.execute(insert(ContentArchive).from_select(
+        [*COLUMNS, "archived_at"],
+        select(*columns, literal(utcnow()).label("archived_at")).where(Content.id.in_(ids)),
+    ))
+    db.execute(delete(Content).where(Content.id.in_(ids)).execution_options(synchronize_session=False))
+    # Banned quotes leave their author's quote_count, deleted ones were never in it
+    recount_authors(db, {row.created_by for row in rows if row.status == BANNED})
+    db.commit()
+    return [row.status for row in rows]
+
+def archive_content(db, batch_size=ARCHIVE_BATCH_SIZE, banned_days=ARCHIVE_BANNED_AFTER_DAYS, pause=ARCHIVE_PAUSE, max_batches=None):
+    banned_before = utcnow() - timedelta(days=banned_days) if banned_days > 0 else None
+    moved = {INACTIVE: 0, BANNED: 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        statuses = archive_batch(db, batch_size, banned_before)
+        if not statuses:
+            break
+        for status in statuses:
+            moved[status] += 1
+        batches += 1
+        if len(statuses) < batch_size:
+            break
+        time.sleep(pause)
+    # Deleted quotes aren't on any page, banned ones are: the feed caches start over
+    if moved[BANNED]:
+        content_changed.send(None, content_id=None, action="archived")
+    return moved
+
+def find_archived(db, content_id):
+    return db.query(ContentArchive).filter(ContentArchive.id == content_id).first()
+
+# Statements moving an archived quote back into content, for the sync and the async sessions. The author's
+# counts take it back in its archived status
+def restore_statements(archived):
+    columns = [getattr(ContentArchive, name) for name in COLUMNS]
+    return [
+        insert(Content).from_select(COLUMNS, select(*columns).where(ContentArchive.id == archived.id)),
+        delete(ContentArchive).where(ContentArchive.id == archived.id).execution_options(synchronize_session=False),
+        count_change(archived.created_by, None, archived.status),
+    ]
+
+# Moves the quote back in the caller's transaction and returns it as a Content
+def restore_content(db, archived):
+    for statement in restore_statements(archived):
+        db.execute(statement)
+    return db.query(Content).filter(Content.id == archived.id).one()
+
+content_cli = AppGroup("content", help="Quote storage maintenance.")
+
+@content_cli.command("archive", help="Move deleted, and optionally long banned, quotes to content_archive.")
+@click.option("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, show_default=True)
+@click.option("--banned-days", type=int, default=ARCHIVE_BANNED_AFTER_DAYS, show_default=True, help="Archive banned quotes not edited for this many days, 0 keeps them.")
+@click.option("--pause", type=float, default=ARCHIVE_PAUSE, show_default=True, help="Seconds between batches.")
+@click.option("--max-batches", type=int, default=None, help="Stop after this many batches.")
+def archive_command(batch_size, banned_days, pause, max_batches):
+    with SessionLocal() as db:
+        ensure_content_partitions(db)
+        started = time.perf_counter()
+        moved = archive_content(db, batch_size, banned_days, pause, max_batches)
+    click.echo(f"Archived {moved[INACTIVE]} deleted and {moved[BANNED]} banned quotes in {time.perf_counter() - started:.1f}s")
+
+@content_cli.command("partitions", help="Create the monthly content partitions ahead of time (Postgres).")
+@click.option("--ahead", type=int, default=CONTENT_PARTITIONS_AHEAD, show_default=True, help="Months after the current one.")
+def partitions_command(ahead):
+    with SessionLocal() as db:
+        created = ensure_content_partitions(db, ahead)
+    click.echo(f"{created} monthly partitions checked")
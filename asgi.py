@@ -0,0 +1,560 @@
+# asgi.py
+# Async serving mode: the same pages as app.py on an ASGI server, with an async SQLAlchemy engine.
+#
+#   hypercorn asgi:app --workers 2 --bind 0.0.0.0:5000
+#   uvicorn asgi:app --workers 2 --port 5000
+#
+# Needs the packages of requirements-asgi.txt: quart and an async driver (asyncpg for Postgres, aiosqlite for SQLite).
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from dotenv import load_dotenv
+from limits import parse
+from limits.aio.strategies import STRATEGIES
+from limits.storage import storage_from_string
+from quart import Quart, Response, g, jsonify, redirect, render_template, request, session, url_for
+from quart.sessions import SessionInterface
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+import rate_limit
+import user_directory
+from archive import restore_statements
+from audit import audit_log, content_state
+from authors import author_name, count_change, display_name
+from database import get_async_sessionmaker
+from events import content_changed
+from feed import build_page, clamp_page_size, feed_select, row_to_json, with_capabilities
+from jobs import enqueue_async
+from live_feed import stream_events_async
+from models import ACTIVE, BANNED, INACTIVE, Content, ContentArchive, Role, User
+from page_cache import MemoryVersionStore, feed_version, make_etag, page_cache, render_quote_card
+from passwords import hash_password, verify_and_update
+from permissions import role_map
+from principals import Principal, principal_cache
+from records import QuoteFormRecord, quote_form_select
+from session_store import ServerSideSessionInterface, create_store
+from utils import check_permission, is_valid_email, is_valid_password
+
+# Load environment variables from .env file
+load_dotenv()
+
+# The sync session store runs in a thread so it never blocks the event loop
+class AsyncServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.sync = ServerSideSessionInterface(store)
+
+    async def open_session(self, app, request):
+        return await asyncio.to_thread(self.sync.open_session, app, request)
+
+    async def save_session(self, app, session, response):
+        await asyncio.to_thread(self.sync.save_session, app, session, response)
+
+app = Quart(__name__)
+app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "mysecretkey")  # Secret key for sessions
+app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=30)
+app.session_interface = AsyncServerSideSessionInterface(create_store())
+app.jinja_env.globals["quote_card"] = render_quote_card
+
+# check_permission and the templates read the role map (permissions.py), which loads it with a sync session
+# when it has expired: that load runs in a thread before the request instead of on the event loop
+@app.before_serving
+@app.before_request
+async def load_role_map():
+    if role_map.stale():
+        await asyncio.to_thread(role_map.get)
+
+@app.context_processor
+async def inject_permissions():
+    user = await get_current_user()
+    return {"permissions": user.role.permissions if user else frozenset()}
+
+# Same limits and storage as the WSGI workers, see rate_limit.py
+rate_limiter = STRATEGIES[rate_limit.RATELIMIT_STRATEGY](storage_from_string(rate_limit.async_storage_uri()))
+LOGIN_LIMIT = parse(rate_limit.LOGIN_LIMIT)
+LOGIN_ACCOUNT_LIMIT = parse(rate_limit.LOGIN_ACCOUNT_LIMIT)
+REGISTER_LIMIT = parse(rate_limit.REGISTER_LIMIT)
+MUTATION_LIMIT = parse(rate_limit.MUTATION_LIMIT)
+
+async def throttled(limit, *identifiers):
+    return not await rate_limiter.hit(limit, "lovequotes", *identifiers)
+
+async def too_many_requests():
+    return await handle_error("Too many requests, try again later."), 429
+
+# Async database session for the current request, closed on teardown
+async def get_db():
+    if "db" not in g:
+        g.db = get_async_sessionmaker()()
+    return g.db
+
+@app.teardown_appcontext
+async def close_db(exception=None):
+    db = g.pop("db", None)
+    if db is not None:
+        if exception is not None:
+            await db.rollback()
+        await db.close()
+
+async def get_current_user():
+    user_id = session.get("user_id")
+    if not user_id:
+        return None
+
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    db = await get_db()
+    result = await db.execute(select(User).options(joinedload(User.role)).where(User.id == user_id))
+    user = result.scalars().first()
+    if not user:
+        return None
+
+    principal = Principal.from_user(user)
+    principal_cache.put(user_id, principal)
+    return principal
+
+async def handle_error(error_message):
+    return await render_template("error.html", message=error_message)
+
+# for_update locks the row until the commit, so two concurrent requests can't both count the same status change
+async def get_content(content_id, for_update=False):
+    db = await get_db()
+    query = select(Content).where(Content.id == content_id)
+    result = await db.execute(query.with_for_update() if for_update else query)
+    return result.scalars().first()
+
+async def get_archived(content_id):
+    db = await get_db()
+    result = await db.execute(select(ContentArchive).where(ContentArchive.id == content_id))
+    return result.scalars().first()
+
+# The receivers (page cache version, search index, live feed) are sync and may query the database or Redis
+async def send_content_changed(content_id, action):
+    await asyncio.to_thread(content_changed.send, app, content_id=content_id, action=action)
+
+# The SQLite and Redis version stores do I/O
+async def get_feed_version():
+    if isinstance(feed_version, MemoryVersionStore):
+        return feed_version.get()
+    return await asyncio.to_thread(feed_version.get)
+
+# Argon2 is CPU bound, run it in the default executor so the event loop keeps serving
+async def run_hashing(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+# Same as page_cache.cached_feed, for the async views
+def cached_feed(anonymous_only=True):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if anonymous_only and session.get("user_id"):
+                return await view(*args, **kwargs)
+
+            version = await get_feed_version()
+            etag = make_etag(version, request.full_path)
+            if etag in request.if_none_match:
+                response = Response("", status=304)
+                response.set_etag(etag)
+                return response
+
+            key = (version, request.full_path)
+            cached = page_cache.get(key)
+            if cached is None:
+                response = await app.make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cached = (await response.get_data(), response.mimetype)
+                page_cache.put(key, cached)
+
+            response = Response(cached[0], mimetype=cached[1])
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
+
+async def fetch_feed_page(cursor, limit):
+    limit = clamp_page_size(limit)
+    db = await get_db()
+    result = await db.execute(feed_select(cursor).limit(limit + 1))
+    return build_page(result, limit)
+
+@app.route("/", methods=["GET"])
+@cached_feed()
+async def index():
+    try:
+        contents_list, next_cursor = await fetch_feed_page(request.args.get("cursor"), request.args.get("limit", type=int))
+    except ValueError as e:
+        return await handle_error(str(e))
+    contents_list = list(with_capabilities(contents_list, await get_current_user()))
+    return await render_template("index.html", contents=contents_list, next_cursor=next_cursor)
+
+@app.route("/api/quotes", methods=["GET"])
+@cached_feed(anonymous_only=False)
+async def api_quotes():
+    try:
+        contents_list, next_cursor = await fetch_feed_page(request.args.get("cursor"), request.args.get("limit", type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [row_to_json(content) for content in contents_list], "next_cursor": next_cursor})
+
+# Server-sent events with the quote changes, an idle viewer is a queue and a heartbeat on the event loop
+@app.route("/api/feed/stream", methods=["GET"])
+async def feed_stream():
+    response = Response(
+        stream_events_async(request.headers.get("Last-Event-ID")),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.timeout = None  # open for as long as the viewer stays
+    return response
+
+@app.route("/session", methods=["GET"])
+async def check_session():
+    user = await get_current_user()
+    if user:
+        return jsonify({"message": f"User is logged in with ID {user.id}"})
+    return jsonify({"message": "No user is logged in"}), 401
+
+@app.route("/login", methods=["GET", "POST"])
+async def login():
+    if request.method == "POST":
+        if await throttled(LOGIN_LIMIT, "login", request.remote_addr or ""):
+            return await too_many_requests()
+
+        form = await request.form
+        email = form.get("email", "").strip().lower()
+        password = form.get("password", "").strip()
+
+        if not email or not password:
+            return await render_template("login.html", error="Email and password are required.")
+
+        # Checked before the argon2 verification, only failed logins are counted
+        if not await rate_limiter.test(LOGIN_ACCOUNT_LIMIT, "lovequotes", "login-account", email):
+            return await too_many_requests()
+
+        db = await get_db()
+        result = await db.execute(select(User).options(joinedload(User.role)).where(User.email == email))
+        user = result.scalars().first()
+
+        verified, new_hash = await run_hashing(verify_and_update, password, user.password_hash) if user else (False, None)
+        if verified:
+            # Argon2 parameters changed since this hash was made, store the upgraded hash
+            if new_hash:
+                user.password_hash = new_hash
+                await db.commit()
+
+            # A new session id for the logged in session, the one from before the login is deleted
+            session.regenerate()
+            session.permanent = True
+            session["user_id"] = user.id
+            session["role"] = user.role.name
+            principal_cache.put(user.id, Principal.from_user(user))
+            return redirect(url_for("index"))
+
+        await rate_limiter.hit(LOGIN_ACCOUNT_LIMIT, "lovequotes", "login-account", email)
+        return await render_template("login.html", error="Your email or password did not match.")
+
+    return await render_template("login.html")
+
+@app.route("/logout", methods=["POST"])
+async def logout():
+    session.clear()
+    return redirect(url_for("index"))
+
+@app.route("/register", methods=["GET", "POST"])
+async def register():
+    if request.method == "POST":
+        if await throttled(REGISTER_LIMIT, "register", request.remote_addr or ""):
+            return await too_many_requests()
+
+        form = await request.form
+        first_name = form.get("first_name", "").strip()
+        last_name = form.get("last_name", "").strip()
+        bio = form.get("bio", "").strip()
+        email = form.get("email", "").strip().lower()
+        password = form.get("password", "").strip()
+        password_confirm = form.get("password_confirm", "").strip()
+
+        # Validation
+        if not is_valid_password(password):
+            error = "Invalid password. Password must be at least 8 characters, with 1 uppercase and 1 symbol."
+        elif password != password_confirm:
+            error = "Password and Confirm Password do not match."
+        elif not all([first_name, last_name, email, password]):
+            error = "All fields are required."
+        elif not is_valid_email(email):
+            error = "Invalid email address."
+        else:
+            error = None
+        if error:
+            return await render_template("register.html", error=error, data=form)
+
+        password_hash = await run_hashing(hash_password, password)
+
+        db = await get_db()
+        try:
+            existing_email = (await db.execute(select(User.id).where(User.email == email))).first()
+            if existing_email:
+                return await render_template("register.html", error="Email already registered.", data=form)
+
+            role = (await db.execute(select(Role).where(Role.name == "user"))).scalars().first()
+            if not role:
+                return await render_template("error.html", message="Role not found.")
+
+            new_user = User(
+                first_name=first_name,
+                last_name=last_name,
+                display_name=display_name(first_name, last_name),
+                bio=bio,
+                email=email,
+                password_hash=password_hash,
+                role_id=role.id,
+            )
+            db.add(new_user)
+            await db.commit()
+
+            # Signing up logs in, with a new session id as at login
+            session.regenerate()
+            session.permanent = True
+            session["user_id"] = new_user.id
+            return redirect(url_for("index"))
+
+        except Exception as e:
+            await db.rollback()
+            return await handle_error(f"Error: {str(e)}")
+
+    return await render_template("register.html", data={})
+
+@app.route("/createquote", methods=["GET", "POST"])
+async def create_content():
+    user = await get_current_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    if not check_permission(user, "create_own_content"):
+        return await handle_error("Unauthorized to create content.")
+
+    if request.method == "POST":
+        if await throttled(MUTATION_LIMIT, "mutations", str(user.id)):
+            return await too_many_requests()
+        quote = (await request.form).get("quote", "").strip()
+        if not quote:
+            return await render_template("index.html", error="Quote is required.")
+
+        db = await get_db()
+        try:
+            new_content = Content(
+                id=uuid.uuid4(),
+                quote=quote,
+                status=ACTIVE,
+                created_by=user.id,
+                created_at=datetime.now(timezone.utc),
+                updated_at=datetime.now(timezone.utc),
+                author_name=author_name(user.id),
+            )
+            db.add(new_content)
+            # The author's quote counts are updated by a background job, see jobs.py
+            await enqueue_async(db, "authors.recount", {"author_id": str(user.id)}, idempotency_key=f"content.created:{new_content.id}")
+            after = content_state(new_content)
+            await db.commit()
+            await send_content_changed(new_content.id, "created")
+            audit_log.record("content", new_content.id, "created", None, after, actor_id=user.id)
+            return redirect(url_for("index"))
+
+        except Exception as e:
+            await db.rollback()
+            return await handle_error(f"Error: {str(e)}")
+
+    return await render_template("createquote.html")
+
+@app.route("/content/<uuid:content_id>/edit", methods=["GET", "POST"])
+async def update_content(content_id):
+    user = await get_current_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    if not check_permission(user, "update_own_content"):
+        return await handle_error("Unauthorized to update content.")
+
+    if request.method == "GET":
+        # The form only shows the quote, read as a record (records.py) from content or content_archive
+        db = await get_db()
+        row = (await db.execute(quote_form_select(content_id))).first()
+        shown = QuoteFormRecord.from_row(row) if row else None
+        content = archived = None
+    else:
+        content = await get_content(content_id, for_update=True)
+        # A long banned quote may have been moved to content_archive (archive.py), it comes back when edited
+        archived = await get_archived(content_id) if not content else None
+        shown = content or archived
+    if not shown:
+        return await handle_error("Content not found.")
+
+    # The record's ids are strings
+    if str(shown.created_by) != str(user.id):
+        return await handle_error("You do not have permission to edit this content.")
+
+    if shown.status == INACTIVE:
+        return await handle_error("This Quote is inactive.")
+
+    if request.method == "POST":
+        if await throttled(MUTATION_LIMIT, "mutations", str(user.id)):
+            return await too_many_requests()
+        db = await get_db()
+        try:
+            if archived:
+                for statement in restore_statements(archived):
+                    await db.execute(statement)
+                content = await get_content(content_id)
+            new_quote = (await request.form).get("quote", "").strip()
+            old_status = content.status
+            before = content_state(content)
+            if content.status == BANNED:
+                content.status = ACTIVE
+                content.updated_at = datetime.now(timezone.utc)
+                if not new_quote:
+                    return await render_template("index.html", error="New quote is required.")
+            else:
+                content.quote = new_quote if new_quote else content.quote
+                content.updated_at = datetime.now(timezone.utc)
+
+            if content.status != old_status:
+                await db.execute(count_change(content.created_by, old_status, content.status))
+            after = content_state(content)
+            await db.commit()
+            await send_content_changed(content.id, "updated")
+            audit_log.record("content", content_id, "updated", before, after, actor_id=user.id)
+            return redirect(url_for("index"))
+        except Exception as e:
+            await db.rollback()
+            return await handle_error(f"Error: {str(e)}")
+
+    return await render_template("updatequote.html", content=shown)
+
+@app.route("/content/<uuid:content_id>/delete", methods=["GET"])
+async def delete_content(content_id):
+    user = await get_current_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    if await throttled(MUTATION_LIMIT, "mutations", str(user.id)):
+        return await too_many_requests()
+
+    db = await get_db()
+    try:
+        content = await get_content(content_id, for_update=True)
+        if not content:
+            return await handle_error("Content not found.")
+
+        if content.created_by != user.id:
+            return await handle_error("You do not have permission to delete this content.")
+
+        if content.status == INACTIVE:
+            return await handle_error("This Quote was not found.")
+
+        before = content_state(content)
+        await db.execute(count_change(content.created_by, content.status, INACTIVE))
+        content.status = INACTIVE
+        content.updated_at = datetime.now(timezone.utc)
+        after = content_state(content)
+
+        await db.commit()
+        await send_content_changed(content.id, "deleted")
+        audit_log.record("content", content_id, "deleted", before, after, actor_id=user.id)
+        return redirect(url_for("index"))
+
+    except Exception as e:
+        await db.rollback()
+        return await handle_error(f"Error: {str(e)}")
+
+@app.route("/content/<uuid:content_id>/ban", methods=["GET"])
+async def ban_content(content_id):
+    user = await get_current_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    if not check_permission(user, "ban"):
+        return await handle_error("Unauthorized to ban content.")
+
+    if await throttled(MUTATION_LIMIT, "mutations", str(user.id)):
+        return await too_many_requests()
+
+    db = await get_db()
+    try:
+        content = await get_content(content_id, for_update=True)
+        if not content:
+            return await handle_error("Content not found.")
+
+        if content.status in (INACTIVE, BANNED):
+            return await handle_error("This content is already archived or baded and cannot be banned.")
+
+        before = content_state(content)
+        await db.execute(count_change(content.created_by, content.status, BANNED))
+        content.status = BANNED
+        content.updated_at = datetime.now(timezone.utc)
+        after = content_state(content)
+
+        await db.commit()
+        await send_content_changed(content.id, "banned")
+        principal_cache.invalidate(content.created_by)
+        audit_log.record("content", content_id, "banned", before, after, actor_id=user.id)
+        return redirect(url_for("index"))
+
+    except Exception as e:
+        await db.rollback()
+        return await handle_error(f"Error: {str(e)}")
+
+@app.route("/managerole", methods=["GET", "POST"])
+async def managerole():
+    user = await get_current_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    if not check_permission(user, "updateadmin"):
+        return await handle_error("Unauthorized to change user role.")
+
+    db = await get_db()
+
+    if request.method == "POST":
+        form = await request.form
+        target_user_id = form.get("user_id")
+        new_role = form.get("role", "").strip()
+
+        if new_role not in ["user", "admin"]:
+            return await handle_error("Invalid role.")
+
+        try:
+            target_user = (
+                await db.execute(select(User).options(joinedload(User.role)).where(User.id == target_user_id))
+            ).scalars().first()
+            if not target_user:
+                return await handle_error("User not found.")
+            before = {"role": target_user.role.name if target_user.role else None}
+
+            role = (await db.execute(select(Role).where(Role.name == new_role))).scalars().first()
+            if not role:
+                return await handle_error("Role not found.")
+
+            target_user.role_id = role.id
+            await db.commit()
+            principal_cache.invalidate(target_user.id)
+            audit_log.record("user_role", target_user_id, "role_changed", before, {"role": new_role}, actor_id=user.id)
+            return redirect(url_for("index"))
+
+        except Exception as e:
+            await db.rollback()
+            return await handle_error(f"Error: {str(e)}")
+
+    search = request.args.get("q", "").strip()
+    cursor = request.args.get("cursor")
+    query = user_directory.directory_select(exclude_user_id=user.id, search=search)
+    if cursor:
+        query = query.filter(User.email > cursor)
+    limit = user_directory.DEFAULT_PAGE_SIZE
+    users, next_cursor = user_directory.build_page(await db.execute(query.limit(limit + 1)), limit)
+
+    return await render_template("managerole.html", users=users, search=search, next_cursor=next_cursor)
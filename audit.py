@@ -0,0 +1,334 @@
+# audit.py
+# Append-only log of quote status changes and user role changes: who, when, state before and after.
+# Requests only queue the event, a background thread writes them in batches (write-behind), so the
+# audited routes don't wait for a second write. `flask audit replay` rebuilds the current state from the log
+import atexit
+import glob
+import heapq
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import click
+from dotenv import load_dotenv
+from flask.cli import AppGroup
+from sqlalchemy import insert, select, text, update
+from archive import find_archived, restore_statements
+from authors import author_name, recount_authors
+from database import SessionLocal, month_partition_ddl
+from events import content_changed
+from models import ACTIVE, AuditEvent, Content, ContentArchive, Role, User
+
+# Load environment variables from .env file
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+# "file": append-only JSONL segment files in AUDIT_LOG_DIR, one open segment per worker process.
+# "database": the audit_events table (migration 0006), partitioned by month on Postgres. "off" records nothing
+AUDIT_BACKEND = os.getenv("AUDIT_BACKEND", "file")
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit_log")
+AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", 64 * 1024 * 1024))  # a new segment is started past this size
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))  # events waiting to be written, bounds the memory
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))  # events per write
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))  # seconds an event can wait for a batch
+# When the queue is full a request waits this long for room, then writes its event itself (backpressure, nothing is dropped)
+AUDIT_PUT_TIMEOUT = float(os.getenv("AUDIT_PUT_TIMEOUT", 0.1))  # seconds
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def event(entity, entity_id, action, before, after, actor_id=None):
+    return {
+        "id": str(uuid.uuid4()),
+        "at": utcnow().isoformat(),
+        "actor_id": str(actor_id) if actor_id else None,
+        "entity": entity,
+        "entity_id": str(entity_id),
+        "action": action,
+        "before": before,
+        "after": after,
+    }
+
+# The audited state of a quote. Batch moderation only knows the new status, its events carry part of it
+def content_state(content):
+    return {
+        "status": content.status,
+        "quote": content.quote,
+        "created_by": str(content.created_by) if content.created_by else None,
+        "updated_at": content.updated_at.isoformat() if content.updated_at else None,
+    }
+
+class FileAuditStore:
+    def __init__(self, directory=AUDIT_LOG_DIR, segment_bytes=AUDIT_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.file = None
+        self.pid = None
+
+    # Segments are never modified once written, a process only appends to the one it opened
+    def open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"audit-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{os.getpid()}.jsonl"
+        self.file = open(os.path.join(self.directory, name), "a", encoding="utf-8")
+        self.pid = os.getpid()
+
+    def write(self, events):
+        # A forked worker starts its own segment rather than appending to its parent's
+        if self.file is None or self.pid != os.getpid() or self.file.tell() >= self.segment_bytes:
+            self.close()
+            self.open_segment()
+        self.file.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events))
+        self.file.flush()
+        os.fsync(self.file.fileno())  # durable once write() returns
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    # Every event of every segment in time order. A segment is sorted on its own, then the segments are merged
+    def read(self):
+        def segment(path):
+            with open(path, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            return sorted(events, key=lambda e: e["at"])
+
+        paths = sorted(glob.glob(os.path.join(self.directory, "audit-*.jsonl")))
+        return heapq.merge(*(segment(path) for path in paths), key=lambda e: e["at"])
+
+class DatabaseAuditStore:
+    def __init__(self):
+        self.partitions = set()  # months this process has made sure exist
+
+    # Postgres: one partition per month, created before the first event of the month is written.
+    # Events that can't get their partition land in audit_events_default
+    def ensure_partitions(self, db, events):
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        for month in {e["at"][:7] for e in events} - self.partitions:
+            try:
+                with db.begin_nested():
+                    db.execute(text(month_partition_ddl("audit_events", int(month[:4]), int(month[5:7]))))
+            except Exception:
+                log.exception("Could not create the audit partition for %s", month)
+            self.partitions.add(month)
+
+    def write(self, events):
+        with SessionLocal() as db:
+            self.ensure_partitions(db, events)
+            db.execute(insert(AuditEvent), [
+                {
+                    "id": uuid.UUID(e["id"]),
+                    "at": datetime.fromisoformat(e["at"]),
+                    "actor_id": uuid.UUID(e["actor_id"]) if e["actor_id"] else None,
+                    "entity": e["entity"],
+                    "entity_id": uuid.UUID(e["entity_id"]),
+                    "action": e["action"],
+                    "before": e["before"],
+                    "after": e["after"],
+                }
+                for e in events
+            ])
+            db.commit()
+
+    def close(self):
+        pass
+
+    def read(self):
+        with SessionLocal() as db:
+            rows = db.execute(select(AuditEvent).order_by(AuditEvent.at, AuditEvent.id).execution_options(yield_per=1000))
+            for row in rows.scalars():
+                yield {
+                    "id": str(row.id),
+                    "at": row.at.isoformat(),
+                    "actor_id": str(row.actor_id) if row.actor_id else None,
+                    "entity": row.entity,
+                    "entity_id": str(row.entity_id),
+                    "action": row.action,
+                    "before": row.before,
+                    "after": row.after,
+                }
+
+def create_store(backend=AUDIT_BACKEND):
+    if backend == "database":
+        return DatabaseAuditStore()
+    return FileAuditStore()
+
+class AuditLog:
+    def __init__(self, store, enabled=True):
+        self.store = store
+        self.enabled = enabled
+        self.write_lock = threading.Lock()  # the flusher and the requests writing under backpressure
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.recorded = 0
+        self.written = 0
+        self.direct_writes = 0  # events written by the request itself because the queue was full
+        self.failed = 0
+        self.last_error = None
+        atexit.register(self.close)
+
+    # The flusher thread is started on the first event of each process: with gunicorn's preload_app
+    # the workers are forked from a master whose threads don't survive the fork
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+            self.thread = threading.Thread(target=self.run, name="audit-writer", daemon=True)
+            self.pid = os.getpid()
+            self.thread.start()
+
+    def record(self, entity, entity_id, action, before, after, actor_id=None):
+        if not self.enabled:
+            return
+        self.start()
+        item = event(entity, entity_id, action, before, after, actor_id)
+        self.recorded += 1
+        try:
+            self.queue.put(item, timeout=AUDIT_PUT_TIMEOUT)
+        except queue.Full:
+            self.direct_writes += 1
+            self.write([item])
+
+    def write(self, events):
+        with self.write_lock:
+            try:
+                self.store.write(events)
+                self.written += len(events)
+            except Exception as e:
+                # The change itself is already committed, a failed audit write must not fail the request
+                self.failed += len(events)
+                self.last_error = str(e)
+                log.exception("Audit events not written")
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+            stop = False
+            while len(batch) < AUDIT_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self.write(batch)
+            if stop:
+                return
+
+    # Called at exit: the queued events are written before the process ends
+    def close(self):
+        with self.lock:
+            if self.pid != os.getpid() or self.thread is None:
+                return
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.pid = None
+        self.store.close()
+
+    def stats(self):
+        return {
+            "backend": AUDIT_BACKEND,
+            "recorded": self.recorded,
+            "written": self.written,
+            "queued": self.queue.qsize() if self.queue is not None and self.pid == os.getpid() else 0,
+            "direct_writes": self.direct_writes,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
+
+audit_log = AuditLog(create_store(), enabled=AUDIT_BACKEND != "off")
+
+# Folds the events into the last known state of every entity: {(entity, id): state}.
+# Events of batch moderation carry only the fields they changed, so the states are merged in time order
+def replay(events, until=None):
+    states = {}
+    for item in events:
+        if until and item["at"] > until:
+            break
+        key = (item["entity"], item["entity_id"])
+        state = states.setdefault(key, {})
+        state.update(item["after"] or {})
+        state["at"] = item["at"]
+    return states
+
+# Writes the replayed state back: quote status and text, user roles. An archived quote (archive.py) is
+# updated in content_archive, and moved back to content first when it replays as Active. Quotes missing
+# from both tables are recreated when their creation was logged
+def apply_states(db, states):
+    changed = {"content": 0, "user_role": 0}
+    authors = set()
+    role_ids = dict(db.execute(select(Role.name, Role.id)).all())
+    for (entity, entity_id), state in states.items():
+        if entity == "content":
+            values = {key: state[key] for key in ("status", "quote") if key in state}
+            if "updated_at" in state and state["updated_at"]:
+                values["updated_at"] = datetime.fromisoformat(state["updated_at"])
+            content_id = uuid.UUID(entity_id)
+            archived = find_archived(db, content_id)
+            if archived is not None and values.get("status", archived.status) != ACTIVE:
+                db.execute(update(ContentArchive).where(ContentArchive.id == content_id).values(**values))
+                authors.add(archived.created_by)
+                changed["content"] += 1
+                continue
+            if archived is not None:
+                for statement in restore_statements(archived):
+                    db.execute(statement)
+            result = db.execute(update(Content).where(Content.id == content_id).values(**values).returning(Content.created_by))
+            created_by = result.scalar()
+            if created_by is None and state.get("created_by") and "quote" in values:
+                created_by = uuid.UUID(state["created_by"])
+                db.execute(insert(Content).values(
+                    id=content_id, created_by=created_by, author_name=author_name(created_by),
+                    created_at=values.get("updated_at"), **values,
+                ))
+            if created_by is not None:
+                authors.add(created_by)
+                changed["content"] += 1
+        elif entity == "user_role" and state.get("role") in role_ids:
+            result = db.execute(update(User).where(User.id == uuid.UUID(entity_id)).values(role_id=role_ids[state["role"]]))
+            changed["user_role"] += result.rowcount
+    recount_authors(db, authors)
+    db.commit()
+    content_changed.send(None, content_id=None, action="replayed")
+    return changed
+
+audit_cli = AppGroup("audit", help="Audit log of quote and role changes.")
+
+@audit_cli.command("replay", help="Rebuild the current state of quotes and roles from the audit log.")
+@click.option("--until", help="Stop at this ISO 8601 time (UTC), to see the state at that moment.")
+@click.option("--output", type=click.File("w"), help="Write the states as JSONL.")
+@click.option("--apply", is_flag=True, help="Write the replayed states to the database.")
+def replay_command(until, output, apply):
+    if until:
+        parsed = datetime.fromisoformat(until)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        until = parsed.isoformat()
+    states = replay(create_store().read(), until)
+    if output:
+        for (entity, entity_id), state in states.items():
+            output.write(json.dumps({"entity": entity, "id": entity_id, **state}) + "\n")
+    entities = {}
+    for entity, _ in states:
+        entities[entity] = entities.get(entity, 0) + 1
+    click.echo(f"{len(states)} entities replayed: " + ", ".join(f"{count} {name}" for name, count in sorted(entities.items())))
+    if apply:
+        with SessionLocal() as db:
+            changed = apply_states(db, states)
+        click.echo(f"Applied: {changed['content']} quotes, {changed['user_role']} user roles")
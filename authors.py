@@ -0,0 +1,49 @@
+# authors.py
+# Denormalized author data, so the feed and author pages read one table instead of joining users:
+# users.display_name (copied to content.author_name) and the per-author quote counts.
+# Every change is written in the same transaction as the change it follows
+from sqlalchemy import func, select, update
+from models import ACTIVE, INACTIVE, Content, User
+
+RECOUNT_BATCH_SIZE = 1000  # authors per recount UPDATE
+
+def display_name(first_name, last_name):
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+# Value for Content.author_name of a new quote, read by the INSERT itself rather than by a query first
+def author_name(author_id):
+    return select(User.display_name).where(User.id == author_id).scalar_subquery()
+
+# What a quote with this status adds to (quote_count, active_quote_count), deleted quotes aren't counted
+def counted(status):
+    if status is None or status == INACTIVE:
+        return 0, 0
+    return 1, int(status == ACTIVE)
+
+# UPDATE moving the author's counts for one quote going from old_status to new_status (None when created).
+# The counts are incremented in SQL so concurrent changes don't overwrite each other
+def count_change(author_id, old_status, new_status):
+    old_quotes, old_active = counted(old_status)
+    new_quotes, new_active = counted(new_status)
+    return (
+        update(User)
+        .where(User.id == author_id)
+        .values(
+            quote_count=User.quote_count + (new_quotes - old_quotes),
+            active_quote_count=User.active_quote_count + (new_active - old_active),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+# Counts the quotes of the authors again, after bulk changes (import, batch moderation, seeding).
+# None recounts every user
+def recount_authors(db, author_ids=None):
+    quotes = select(func.count()).where(Content.created_by == User.id, Content.status != INACTIVE).scalar_subquery()
+    active = select(func.count()).where(Content.created_by == User.id, Content.status == ACTIVE).scalar_subquery()
+    statement = update(User).values(quote_count=quotes, active_quote_count=active).execution_options(synchronize_session=False)
+    if author_ids is None:
+        db.execute(statement)
+        return
+    author_ids = list(author_ids)
+    for start in range(0, len(author_ids), RECOUNT_BATCH_SIZE):
+        db.execute(statement.where(User.id.in_(author_ids[start:start + RECOUNT_BATCH_SIZE])))
@@ -0,0 +1,128 @@
+# Requests/sec and p99 latency of the WSGI app (app.py on gunicorn) against the ASGI app (asgi.py on
+# hypercorn), with the same number of workers and the same database connection budget.
+#
+#   python benchmarks/bench_asgi_vs_wsgi.py --workers 2 --connections 64 --duration 20
+#
+# Both servers run against SUPABASE_URL with DB_POOL_SIZE/DB_MAX_OVERFLOW from the environment, so
+# --workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) is the connection budget of either mode. The clients share one
+# login as the superadmin from .env, so the feed is rendered per request instead of coming from the page cache,
+# and the login rate limit (RATELIMIT_LOGIN) is hit once per mode rather than once per client.
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import SUPERADMIN_EMAIL, SUPERADMIN_PASSWORD
+
+PATHS = ["/", "/api/quotes", "/managerole"]
+
+def server_command(mode, port, workers):
+    if mode == "wsgi":
+        return ["gunicorn", "wsgi:app", "--workers", str(workers), "--threads", "8", "--bind", f"127.0.0.1:{port}"]
+    return ["hypercorn", "asgi:app", "--workers", str(workers), "--bind", f"127.0.0.1:{port}"]
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/session")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+def login(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    body = urlencode({"email": SUPERADMIN_EMAIL, "password": SUPERADMIN_PASSWORD})
+    conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    cookie = response.getheader("Set-Cookie")
+    if response.status != 302 or not cookie:
+        raise RuntimeError("Superadmin login failed, check SUPERADMIN_EMAIL and SUPERADMIN_PASSWORD.")
+    return cookie.split(";", 1)[0]
+
+def client(port, cookie, deadline, results, errors, index):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Cookie": cookie}
+    latencies = []
+    i = index
+    while time.monotonic() < deadline:
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.append(latencies)
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+def run(mode, args):
+    server = subprocess.Popen(server_command(mode, args.port, args.workers), cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(args.port)
+        cookie = login(args.port)
+        results, errors = [], []
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=client, args=(args.port, cookie, deadline, results, errors, i))
+                   for i in range(args.connections)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    # A client thread that died would make the mode look faster than it is under the requested load
+    if len(results) < args.connections:
+        sys.exit(f"{mode}: only {len(results)} of {args.connections} clients ran to the end, see the errors above")
+    ms = [v * 1000 for latencies in results for v in latencies]
+    if not ms:
+        print(f"{mode}: no successful requests, {len(errors)} errors")
+        return
+    print(f"{mode}: {len(ms) / elapsed:.0f} req/s, p50 {percentile(ms, 50):.1f} ms, "
+          f"p99 {percentile(ms, 99):.1f} ms, {len(ms)} ok, {len(errors)} errors")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the WSGI and ASGI apps under the same load.")
+    parser.add_argument("--mode", choices=["wsgi", "asgi", "both"], default="both")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=64, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per mode")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    pool = int(os.getenv("DB_POOL_SIZE", 5)) + int(os.getenv("DB_MAX_OVERFLOW", 5))
+    print(f"{args.workers} workers, {args.connections} clients, {args.workers * pool} database connections at most")
+    for mode in (["wsgi", "asgi"] if args.mode == "both" else [args.mode]):
+        run(mode, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Seed a Postgres database with quotes and show how the feed query is planned.
+#
+#   python benchmarks/bench_feed_index.py --quotes 1000000
+#
+# Runs against SUPABASE_URL (use a scratch database, rows are inserted for real).
+# Apply the migrations first with `flask db upgrade`.
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import SessionLocal, engine
+from feed import feed_query, encode_cursor, DEFAULT_PAGE_SIZE
+from models import Role
+
+BENCH_EMAIL = "bench-%@example.com"
+
+def seed(db, quotes, users):
+    role_id = db.query(Role.id).filter(Role.name == "user").scalar()
+    if role_id is None:
+        sys.exit("Role 'user' not found, run `python database.py` first.")
+
+    started = time.perf_counter()
+    db.execute(text("""
+        INSERT INTO users (id, first_name, last_name, display_name, bio, email, password_hash, role_id)
+        SELECT gen_random_uuid(), 'Bench', 'User ' || g, 'Bench User ' || g, '', 'bench-' || g || '@example.com', 'x', :role_id
+        FROM generate_series(1, :users) AS g
+    """), {"role_id": role_id, "users": users})
+
+    # 10% Inactive and 2% Ban so the partial index has something to skip
+    db.execute(text("""
+        WITH authors AS (
+            SELECT id, display_name, row_number() OVER () - 1 AS rn FROM users WHERE email LIKE :email
+        )
+        INSERT INTO content (id, quote, status, created_by, author_name, created_at, updated_at)
+        SELECT
+            gen_random_uuid(),
+            'Bench quote number ' || g,
+            CASE WHEN g % 10 = 0 THEN 'Inactive' WHEN g % 50 = 1 THEN 'Ban' ELSE 'Active' END,
+            authors.id,
+            authors.display_name,
+            now() - g * interval '1 second',
+            now() - g * interval '1 second'
+        FROM generate_series(1, :quotes) AS g
+        JOIN authors ON authors.rn = g % :users
+    """), {"email": BENCH_EMAIL, "quotes": quotes, "users": users})
+    db.commit()
+    db.execute(text("ANALYZE content"))
+    db.execute(text("ANALYZE users"))
+    db.commit()
+    print(f"Seeded {quotes} quotes from {users} users in {time.perf_counter() - started:.1f}s")
+
+def reset(db):
+    db.execute(text("""
+        DELETE FROM content WHERE created_by IN (SELECT id FROM users WHERE email LIKE :email)
+    """), {"email": BENCH_EMAIL})
+    db.execute(text("DELETE FROM users WHERE email LIKE :email"), {"email": BENCH_EMAIL})
+    db.commit()
+
+def explain(db, query):
+    compiled = query.statement.compile(dialect=engine.dialect)
+    plan = db.connection().exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + str(compiled), compiled.params
+    ).scalar()
+    return plan[0]
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def report(name, plan):
+    nodes = list(plan_nodes(plan["Plan"]))
+    scans = [f"{n['Node Type']} on {n.get('Relation Name')} using {n.get('Index Name')}" for n in nodes if "Scan" in n["Node Type"]]
+    print(f"\n{name}: {plan['Execution Time']:.2f} ms")
+    for scan in scans:
+        print(f"  {scan}")
+    uses_feed_index = any(n.get("Index Name") == "ix_content_feed" for n in nodes)
+    print(f"  ix_content_feed used: {uses_feed_index}")
+    return uses_feed_index
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed quotes and EXPLAIN the feed query.")
+    parser.add_argument("--quotes", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse rows from a previous run")
+    parser.add_argument("--reset", action="store_true", help="Delete the benchmark rows and exit")
+    parser.add_argument("--json", action="store_true", help="Print the raw plans as JSON")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("This benchmark needs Postgres (generate_series, EXPLAIN FORMAT JSON).")
+
+    # psycopg2 needs to know how to send uuid.UUID parameters
+    import psycopg2.extras
+    psycopg2.extras.register_uuid()
+
+    db = SessionLocal()
+    try:
+        if args.reset:
+            reset(db)
+            return
+        if not args.no_seed:
+            seed(db, args.quotes, args.users)
+
+        first_page = explain(db, feed_query(db).limit(DEFAULT_PAGE_SIZE + 1))
+
+        # A page deep into the feed, keyset pagination should cost the same as the first page
+        middle = feed_query(db).offset(args.quotes // 2).limit(1).first()
+        cursor = encode_cursor(middle.created_at, middle.id)
+        deep_page = explain(db, feed_query(db, cursor).limit(DEFAULT_PAGE_SIZE + 1))
+
+        ok = report("First page", first_page) & report("Page from the middle of the feed", deep_page)
+        if args.json:
+            print(json.dumps([first_page, deep_page], indent=2, default=str))
+        if not ok:
+            sys.exit("Feed query is not using ix_content_feed, check `flask db current`.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Memory and allocations per feed row: the records of records.py against the dicts and ORM entities used before.
+#
+#   python benchmarks/bench_feed_memory.py --quotes 100000
+#
+# Fills a temporary SQLite file with --quotes quotes and reads the whole feed at once, as one very long page,
+# three ways. tracemalloc gives the peak while the page is built and what the page keeps afterwards, per row.
+# "dicts" is the former feed.build_page: the fetched rows plus a dict per row. The times include the overhead
+# of tracemalloc, compare them with each other only. Doesn't touch SUPABASE_URL.
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from database import Base
+from feed import build_page, feed_query
+from models import ACTIVE, BANNED, Content, User
+
+# SQLite gives a column declared UUID numeric affinity: a hex id made only of digits and one "e" would be
+# stored as a number. Rare, but not among 100k ids
+def new_id():
+    while True:
+        value = uuid.uuid4()
+        if any(c in "abcdf" for c in value.hex):
+            return value
+
+def seed(engine, quotes, authors=100):
+    author_ids = [new_id() for _ in range(authors)]
+    started = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": author_id, "first_name": "Bench", "last_name": f"User {n}", "display_name": f"Bench User {n}", "email": f"bench-{n}@example.com"}
+            for n, author_id in enumerate(author_ids)
+        ])
+        for start in range(0, quotes, 10000):
+            conn.execute(insert(Content), [
+                {
+                    "id": new_id(),
+                    "quote": f"Bench quote number {n}, love is patient and kind.",
+                    "status": BANNED if n % 50 == 1 else ACTIVE,
+                    "created_by": author_ids[n % authors],
+                    "author_name": f"Bench User {n % authors}",
+                    "created_at": started + timedelta(seconds=n),
+                    "updated_at": started + timedelta(seconds=n),
+                }
+                for n in range(start, min(start + 10000, quotes))
+            ])
+
+# How feed.build_page turned rows into dicts before records.py, with both lists alive until it returned
+def dicts_page(db, limit):
+    rows = feed_query(db).limit(limit + 1).all()
+    page = [
+        {"id": row.id, "quote": row.quote, "status": row.status, "created_by": row.created_by, "created_at": row.created_at, "posts_by": row.posts_by}
+        for row in rows[:limit]
+    ]
+    return page, rows
+
+def entities_page(db, limit):
+    return db.query(Content).filter(Content.status != "Inactive").order_by(Content.created_at.desc(), Content.id.desc()).limit(limit).all(), None
+
+def records_page(db, limit):
+    return build_page(feed_query(db).limit(limit + 1), limit)[0], None
+
+VARIANTS = {"dicts": dicts_page, "entities": entities_page, "records": records_page}
+
+def measure(engine, variant, quotes):
+    with Session(engine) as db:
+        # Warms up the connection and the compiled query cache, so only the page is measured
+        VARIANTS[variant](db, 10)
+        db.expunge_all()
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        before = tracemalloc.take_snapshot()
+        started = time.perf_counter()
+        page, rows = VARIANTS[variant](db, quotes)
+        seconds = time.perf_counter() - started
+        del rows  # the page is what the template keeps
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+        tracemalloc.stop()
+        count = len(page)
+    return {
+        "variant": variant,
+        "rows": count,
+        "seconds": round(seconds, 3),
+        "peak_per_row": (peak - baseline) / count,
+        "kept_per_row": (current - baseline) / count,
+        "blocks_per_row": blocks / count,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per row of a feed page: dicts, ORM entities and records.")
+    parser.add_argument("--quotes", type=int, default=100000)
+    parser.add_argument("--variants", default="dicts,entities,records", help="Comma separated: dicts, entities, records.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="feed-memory-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        started = time.perf_counter()
+        seed(engine, args.quotes)
+        print(f"Seeded {args.quotes} quotes in {time.perf_counter() - started:.1f}s")
+
+        print(f"{'variant':<10} {'rows':>8} {'seconds':>8} {'peak B/row':>11} {'kept B/row':>11} {'blocks/row':>11}")
+        for variant in args.variants.split(","):
+            result = measure(engine, variant.strip(), args.quotes)
+            print(
+                f"{result['variant']:<10} {result['rows']:>8} {result['seconds']:>8.3f} {result['peak_per_row']:>11.0f} "
+                f"{result['kept_per_row']:>11.0f} {result['blocks_per_row']:>11.1f}"
+            )
+        engine.dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Measure argon2 hashes per second, on one core and through the hashing process pool.
+#
+#   ARGON2_TIME_COST=3 ARGON2_MEMORY_COST=65536 python benchmarks/bench_password_hash.py
+#
+# Use it to pick argon2 costs (aim for a hash time your login latency budget allows)
+# and PASSWORD_HASH_WORKERS (hashes/sec scales with the workers up to the core count).
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords
+
+PASSWORD = "Benchmark-Passw0rd!"
+
+def single_core(count):
+    passwords.get_context()  # build the context outside the timing
+    started = time.perf_counter()
+    for _ in range(count):
+        passwords._hash(PASSWORD)
+    return count / (time.perf_counter() - started)
+
+def pooled(count, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Warm up every worker so process start-up isn't measured
+        list(pool.map(passwords._hash, [PASSWORD] * workers))
+        started = time.perf_counter()
+        list(pool.map(passwords._hash, [PASSWORD] * count))
+        return count / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="argon2 hashing throughput.")
+    parser.add_argument("--count", type=int, default=50, help="Hashes per measurement")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes for the pooled run")
+    args = parser.parse_args()
+
+    print(f"argon2 time_cost={passwords.ARGON2_TIME_COST} memory_cost={passwords.ARGON2_MEMORY_COST} KiB "
+          f"parallelism={passwords.ARGON2_PARALLELISM}")
+
+    rate = single_core(args.count)
+    print(f"1 process: {rate:.1f} hashes/sec ({1000 / rate:.1f} ms per hash)")
+
+    rate = pooled(args.count * args.workers, args.workers)
+    print(f"{args.workers} processes: {rate:.1f} hashes/sec ({rate / args.workers:.1f} per process)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Session load/save latency with several worker processes sharing one session store.
+#
+#   python benchmarks/bench_sessions.py --backend sqlite --workers 8
+#   python benchmarks/bench_sessions.py --backend redis --redis-url redis://localhost:6379/0
+#
+# Each worker does a request-like cycle: load a session, and every --write-every cycles save it.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import RedisSessionStore, SQLiteSessionStore
+
+def make_store(args):
+    if args.backend == "sqlite":
+        return SQLiteSessionStore(args.sqlite_path)
+    return RedisSessionStore(url=args.redis_url, prefix="bench-session:")
+
+def sample_session():
+    return {
+        "_permanent": True,
+        "user_id": uuid.uuid4(),
+        "role": "user",
+        "permissions": ["create_own_content", "update_own_content", "delete_own_content"],
+    }
+
+def worker(job):
+    args, worker_id = job
+    store = make_store(args)
+    sids = [f"w{worker_id}-{i}" for i in range(args.sessions)]
+    for sid in sids:
+        store.save(sid, sample_session(), 3600)
+
+    loads, saves = [], []
+    for cycle in range(args.cycles):
+        sid = random.choice(sids)
+        started = time.perf_counter()
+        data = store.load(sid)
+        loads.append(time.perf_counter() - started)
+        if cycle % args.write_every == 0:
+            started = time.perf_counter()
+            store.save(sid, data, 3600)
+            saves.append(time.perf_counter() - started)
+
+    for sid in sids:
+        store.delete(sid)
+    return loads, saves
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+def report(name, values, elapsed):
+    ms = [v * 1000 for v in values]
+    print(f"{name}: {len(ms)} ops, {len(ms) / elapsed:.0f} ops/sec, "
+          f"p50 {percentile(ms, 50):.3f} ms, p99 {percentile(ms, 99):.3f} ms, "
+          f"mean {statistics.mean(ms):.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Session store latency under concurrent workers.")
+    parser.add_argument("--backend", choices=["sqlite", "redis"], default="sqlite")
+    parser.add_argument("--sqlite-path", default=os.path.join(tempfile.gettempdir(), "bench_sessions.sqlite3"))
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--sessions", type=int, default=200, help="Sessions per worker")
+    parser.add_argument("--cycles", type=int, default=5000, help="Requests per worker")
+    parser.add_argument("--write-every", type=int, default=10, help="Save the session every N requests")
+    args = parser.parse_args()
+
+    make_store(args)  # create the schema before the workers start
+    started = time.perf_counter()
+    with Pool(args.workers) as pool:
+        results = pool.map(worker, [(args, i) for i in range(args.workers)])
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.backend} backend, {args.workers} workers")
+    report("load", [v for loads, _ in results for v in loads], elapsed)
+    report("save", [v for _, saves in results for v in saves], elapsed)
+
+if __name__ == "__main__":
+    main()
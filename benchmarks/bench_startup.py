@@ -0,0 +1,112 @@
+# Cold start of a worker: interpreter start, `import app`, create_app(), warm-up and the first requests,
+# each run in a fresh Python process. Also lists the imports of app.py that cost the most (python -X importtime).
+#
+#   python benchmarks/bench_startup.py --runs 10
+#   python benchmarks/bench_startup.py --runs 10 --warm-up   # with the gunicorn preload warm-up (app.warm_up)
+#
+# The first request connects to SUPABASE_URL, use a local database (see benchmarks/seed.py).
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child process, prints the phase timings as one JSON line
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+if WARM_UP:
+    app.warm_up(flask_app)
+warmed = time.perf_counter()
+client = flask_app.test_client()
+first = client.get(PATH)
+first_done = time.perf_counter()
+second = client.get(PATH)
+second_done = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "warm_up": warmed - created,
+    "first_request": first_done - warmed,
+    "second_request": second_done - first_done,
+    "status": first.status_code,
+}))
+"""
+
+PHASES = ["process", "import", "create_app", "warm_up", "first_request", "second_request"]
+
+def run_once(args):
+    code = PROBE.replace("WARM_UP", repr(args.warm_up)).replace("PATH", repr(args.path))
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=False,
+    )
+    elapsed = time.perf_counter() - started
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        sys.exit(result.stderr[-2000:])
+    timings = json.loads(lines[-1])
+    timings["process"] = elapsed
+    return timings, parse_importtime(result.stderr)
+
+# Cumulative microseconds of the modules imported directly by app.py
+def parse_importtime(stderr):
+    modules = {}
+    stack = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        # Children are printed before their parent, so a module's children are the lines one level deeper above it
+        stack.append((level, name, int(cumulative)))
+        if name == "app" and level == 0:
+            for child_level, child_name, child_cumulative in stack:
+                if child_level == 1:
+                    modules[child_name] = child_cumulative
+        if level == 0:
+            stack = []
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start latency of the WSGI app.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/", help="Path of the first requests")
+    parser.add_argument("--warm-up", action="store_true", help="Run app.warm_up before the first request")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports of app.py to list")
+    args = parser.parse_args()
+
+    timings = defaultdict(list)
+    imports = defaultdict(list)
+    for _ in range(args.runs):
+        run, modules = run_once(args)
+        if run["status"] >= 500:
+            sys.exit(f"{args.path} answered {run['status']}, check SUPABASE_URL.")
+        for phase in PHASES:
+            timings[phase].append(run[phase])
+        for name, cumulative in modules.items():
+            imports[name].append(cumulative)
+
+    print(f"{args.runs} runs, warm-up {'on' if args.warm_up else 'off'}, median (min-max)")
+    for phase in PHASES:
+        ms = [value * 1000 for value in timings[phase]]
+        print(f"  {phase:<15} {statistics.median(ms):8.1f} ms  ({min(ms):.1f}-{max(ms):.1f})")
+
+    print(f"Slowest imports of app.py (cumulative, median):")
+    slowest = sorted(imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+    for name, values in slowest:
+        print(f"  {name:<30} {statistics.median(values) / 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
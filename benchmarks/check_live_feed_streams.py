@@ -0,0 +1,77 @@
+# Check that the live feed stream slots of a WSGI worker (LIVE_FEED_MAX_STREAMS) come back however a
+# stream ends: HEAD requests whose body is never read, a GET closed before its first chunk, and a GET
+# closed after reading some of it.
+#
+#   python benchmarks/check_live_feed_streams.py
+#
+# Calls the WSGI app the way a server does, close() on the body without iterating it for HEAD. Uses a
+# SQLite file in a temporary directory, doesn't touch SUPABASE_URL. Exits 1 when a slot was kept.
+import io
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_STREAMS = 2
+
+def configure(directory):
+    # Before the app modules are imported, they read the environment (and .env, which doesn't override these)
+    os.environ.update(
+        SUPABASE_URL=f"sqlite:///{os.path.join(directory, 'live.db')}",
+        SESSION_BACKEND="sqlite",
+        SESSION_SQLITE_PATH=os.path.join(directory, "sessions.sqlite3"),
+        PAGE_CACHE_VERSION_BACKEND="memory",
+        AUDIT_BACKEND="off",
+        RATELIMIT_STORAGE_URI="memory://",
+        LIVE_FEED_TRANSPORT="local",
+        LIVE_FEED_MAX_STREAMS=str(MAX_STREAMS),
+    )
+
+# Status of the response, the body is read for `chunks` items (0 leaves it unread) and closed
+def request(app, method, chunks=0):
+    from werkzeug.test import EnvironBuilder
+    environ = EnvironBuilder(path="/api/feed/stream", method=method).get_environ()
+    status = []
+    body = app.wsgi_app(environ, lambda code, headers, exc_info=None: status.append(int(code.split()[0])))
+    try:
+        iterator = iter(body)
+        for _ in range(chunks):
+            next(iterator)
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return status[0]
+
+def main():
+    directory = tempfile.mkdtemp(prefix="live-feed-")
+    configure(directory)
+    try:
+        from flask import Flask
+        from database import init_db
+        from live_feed import live_feed
+        with redirect_stdout(io.StringIO()):
+            with Flask(__name__).app_context():
+                init_db()
+            from app import create_app
+            app = create_app()
+
+        failures = 0
+        cases = [
+            ("HEAD, body never read", "HEAD", 0),
+            ("GET closed before the first chunk", "GET", 0),
+            ("GET closed after the first chunk", "GET", 1),
+        ]
+        for name, method, chunks in cases:
+            statuses = [request(app, method, chunks) for _ in range(MAX_STREAMS + 2)]
+            ok = statuses == [200] * len(statuses) and live_feed.threaded_streams == 0
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: statuses {statuses}, {live_feed.threaded_streams} slots held")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
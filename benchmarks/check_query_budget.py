@@ -0,0 +1,66 @@
+# Fail when a route runs more queries than its budget, or reads a whole table.
+#
+#   python benchmarks/check_query_budget.py
+#
+# Runs the routes in-process against SUPABASE_URL (a scratch or local database) and exits 1 on a
+# regression, so it can run in CI. Logs in as the superadmin from .env for the admin routes.
+import io
+import os
+import re
+import sys
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SUPERADMIN_EMAIL, SUPERADMIN_PASSWORD, count_queries
+
+# (path, logged in, max queries)
+BUDGETS = [
+    ("/", False, 1),
+    ("/?stream=1", False, 1),
+    ("/api/quotes", False, 1),
+    ("/", True, 1),
+    ("/managerole", True, 1),
+    ("/api/users", True, 1),
+    ("/api/users?q=a", True, 1),
+]
+
+# SELECT on a big table with neither WHERE nor LIMIT reads the whole table
+FULL_SCAN = re.compile(r"^\s*SELECT\b(?!.*\bWHERE\b)(?!.*\bLIMIT\b).*\bFROM (users|content)\b", re.S | re.I)
+
+def main():
+    with redirect_stdout(io.StringIO()):
+        from app import create_app, warm_up
+        app = create_app()
+        # As gunicorn does before the first request: the role permissions are loaded here, not by the routes
+        warm_up(app)
+
+    anonymous = app.test_client()
+    admin = app.test_client()
+    with redirect_stdout(io.StringIO()):
+        response = admin.post("/login", data={"email": SUPERADMIN_EMAIL, "password": SUPERADMIN_PASSWORD})
+    if response.status_code != 302:
+        sys.exit("Superadmin login failed, check SUPERADMIN_EMAIL and SUPERADMIN_PASSWORD.")
+
+    failures = 0
+    for path, logged_in, budget in BUDGETS:
+        client = admin if logged_in else anonymous
+        with count_queries() as queries, redirect_stdout(io.StringIO()):
+            response = client.get(path)
+            response.get_data()  # streamed pages run their queries while the body is read
+            status = response.status_code
+
+        full_scans = [s for s in queries.statements if FULL_SCAN.search(s)]
+        ok = status == 200 and queries.count <= budget and not full_scans
+        failures += not ok
+        who = "admin" if logged_in else "anonymous"
+        print(f"{'ok  ' if ok else 'FAIL'} {path} ({who}): {queries.count}/{budget} queries, status {status}")
+        if not ok:
+            for statement in queries.statements:
+                marker = "  full table read:" if statement in full_scans else "  "
+                print(marker, " ".join(statement.split())[:200])
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
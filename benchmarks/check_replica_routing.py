@@ -0,0 +1,160 @@
+# Check which database the routes read from when read replicas are configured (DB_REPLICA_URLS).
+#
+#   python benchmarks/check_replica_routing.py
+#
+# Uses two local SQLite files in a temporary directory, a primary and a copy of it standing in for the
+# replica. The copy doesn't follow the primary, so a read that wrongly goes to the replica after a write
+# also misses the new quote. The page cache is on, as in production: the anonymous feed is filled from the
+# primary and then served without queries. Every statement is counted per engine, exits 1 when a request
+# went to the wrong one. Doesn't touch SUPABASE_URL or the .env databases.
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "Replica-passw0rd!"
+
+def configure(directory):
+    # Before the app modules are imported, they read the environment (and .env, which doesn't override these)
+    os.environ.update(
+        SUPABASE_URL=f"sqlite:///{os.path.join(directory, 'primary.db')}",
+        DB_REPLICA_URLS=f"sqlite:///{os.path.join(directory, 'replica.db')}",
+        DB_REPLICA_CHECK_INTERVAL="3600",  # checks are run by the script
+        SUPERADMIN_EMAIL="replica-admin@example.com",
+        SUPERADMIN_PASSWORD=PASSWORD,
+        SESSION_BACKEND="sqlite",
+        SESSION_SQLITE_PATH=os.path.join(directory, "sessions.sqlite3"),
+        PAGE_CACHE_VERSION_BACKEND="memory",
+        AUDIT_BACKEND="off",
+        JOB_WORKERS="0",  # a job worker polling the primary would be counted with the requests
+        RATELIMIT_STORAGE_URI="memory://",
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the read replica routing on two local SQLite databases.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary databases.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="replica-routing-")
+    configure(directory)
+    try:
+        failures = run(directory)
+    finally:
+        if args.keep:
+            print(f"Databases kept in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+# Ends the client's read-your-writes window (utils.READ_PRIMARY_SECONDS) as if it had passed
+def forget_writes(client):
+    with client.session_transaction() as session:
+        session["read_primary_until"] = time.time() - 1
+
+def run(directory):
+    from flask import Flask
+    import database
+    from database import count_queries, get_engine, init_db, replica_router
+
+    primary_path = os.path.join(directory, "primary.db")
+    replica_path = os.path.join(directory, "replica.db")
+
+    with redirect_stdout(io.StringIO()):
+        with Flask(__name__).app_context():
+            init_db()
+        from app import create_app
+        app = create_app()
+
+    writer = app.test_client()
+    writer.post("/register", data={
+        "first_name": "Rea", "last_name": "Plica", "email": "writer@example.com", "bio": "",
+        "password": PASSWORD, "password_confirm": PASSWORD,
+    })
+    writer.post("/login", data={"email": "writer@example.com", "password": PASSWORD})
+    writer.post("/createquote", data={"quote": "Written before the replica was copied."})
+    admin = app.test_client()
+    admin.post("/login", data={"email": "replica-admin@example.com", "password": PASSWORD})
+    anonymous = app.test_client()
+    for client in (writer, admin):
+        forget_writes(client)
+
+    # The replica starts as an exact copy of the primary
+    get_engine().dispose()
+    shutil.copy(primary_path, replica_path)
+    replica_router.start()
+    replica = replica_router.replicas[0]
+
+    failures = 0
+
+    def expect(name, client, method, path, route, contains=None, missing=None, data=None):
+        nonlocal failures
+        with ExitStack() as stack:
+            on_primary = stack.enter_context(count_queries(get_engine()))
+            on_replica = stack.enter_context(count_queries(replica.engine))
+            stack.enter_context(redirect_stdout(io.StringIO()))
+            response = client.open(path, method=method, data=data)
+            body = response.get_data(as_text=True)
+        if not on_primary.count and not on_replica.count:
+            actual = "cache"
+        else:
+            actual = "primary" if not on_replica.count else "replica" if not on_primary.count else "both"
+        ok = actual == route and response.status_code in (200, 302)
+        if contains and contains not in body:
+            ok = False
+        if missing and missing in body:
+            ok = False
+        failures += not ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {name}: {method} {path} read from {actual} "
+            f"(expected {route}), {on_primary.count} primary / {on_replica.count} replica queries, status {response.status_code}"
+        )
+
+    new_quote = "Written after the replica was copied."
+    # Pages kept in the page cache, and named by its ETags, come from the primary
+    expect("anonymous feed", anonymous, "GET", "/", "primary")
+    expect("anonymous feed again", anonymous, "GET", "/", "cache")
+    expect("logged in feed", admin, "GET", "/", "replica")
+    expect("user listing", admin, "GET", "/managerole", "replica")
+    expect("create a quote", writer, "POST", "/createquote", "primary", data={"quote": new_quote})
+    expect("feed after own write", writer, "GET", "/", "primary", contains=new_quote)
+    expect("feed of another client", admin, "GET", "/", "replica", missing=new_quote)
+    # The write bumped the feed version, the page cached under it has the new quote
+    expect("anonymous feed after the write", anonymous, "GET", "/", "primary", contains=new_quote)
+    expect("anonymous feed after the write again", anonymous, "GET", "/", "cache", contains=new_quote)
+
+    # Past the read-your-writes window the writer is back on the replica
+    forget_writes(writer)
+    expect("writer after the window", writer, "GET", "/", "replica")
+
+    # A replica further behind than DB_REPLICA_MAX_LAG is left out
+    measure_lag = replica.measure_lag
+    replica.measure_lag = lambda conn: database.DB_REPLICA_MAX_LAG + 1
+    replica_router.check()
+    expect("lagging replica", admin, "GET", "/", "primary")
+    replica.measure_lag = measure_lag
+
+    # So is one that can't be reached
+    replica.engine.dispose()
+    os.remove(replica_path)
+    os.mkdir(replica_path)
+    replica_router.check()
+    expect("unreachable replica", admin, "GET", "/", "primary")
+
+    # And it is used again once it is back and caught up
+    os.rmdir(replica_path)
+    get_engine().dispose()
+    shutil.copy(primary_path, replica_path)
+    replica_router.check()
+    expect("replica back", admin, "GET", "/", "replica", contains=new_quote)
+
+    print(f"Replica checks: {replica_router.stats()['replicas'][0]}, fallbacks to the primary: {replica_router.fallbacks}")
+    return failures
+
+if __name__ == "__main__":
+    main()
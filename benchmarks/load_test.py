@@ -0,0 +1,233 @@
+# Concurrent load test of the real routes against a seeded database (benchmarks/seed.py).
+#
+#   SUPABASE_URL=sqlite:///bench.db python benchmarks/load_test.py --threads 16 --duration 30
+#
+# Every thread is a logged in seeded user (and an admin for the bans) running a weighted mix of the feed,
+# login, create, edit and ban routes in-process. Reports throughput, latency percentiles and database
+# queries per request for each route, and appends the results as one JSON line to --output so runs can
+# be compared over time. The login rate limit is off during the run unless --rate-limit is given.
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event, select
+from database import SessionLocal, engine
+from models import ACTIVE, Content, Role, User
+from seed import SEED_EMAIL_PATTERN, SEED_PASSWORD
+
+# scenario -> weight in the mix
+MIX = {
+    "feed_anonymous": 40,
+    "feed_user": 25,
+    "login": 5,
+    "create": 10,
+    "edit": 15,
+    "ban": 5,
+}
+
+# Statements run by the current thread, for queries per request
+_queries = threading.local()
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries.count = getattr(_queries, "count", 0) + 1
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, scenario, seconds, queries, ok):
+        with self.lock:
+            if ok:
+                self.latencies[scenario].append(seconds)
+                self.queries[scenario].append(queries)
+            else:
+                self.errors[scenario] += 1
+
+def load_accounts():
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(User.id, User.email, Role.name)
+            .join(Role, User.role_id == Role.id)
+            .where(User.email.like(SEED_EMAIL_PATTERN))
+            .order_by(User.email)
+        ).all()
+    users = [(row.id, row.email) for row in rows if row.name == "user"]
+    admins = [row.email for row in rows if row.name == "admin"]
+    if not users or not admins:
+        sys.exit("No seeded users or admins found, run benchmarks/seed.py first.")
+    return users, admins
+
+def load_quote_ids(created_by=None, limit=1000):
+    query = select(Content.id).where(Content.status == ACTIVE)
+    if created_by is not None:
+        query = query.where(Content.created_by == created_by)
+    with SessionLocal() as db:
+        return [row.id for row in db.execute(query.limit(limit))]
+
+def login(client, email):
+    response = client.post("/login", data={"email": email, "password": SEED_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Login failed for {email} with status {response.status_code}")
+    return response
+
+class Worker:
+    def __init__(self, app, user, admin_email, ban_targets, rng):
+        self.app = app
+        self.user_id, self.email = user
+        self.anonymous = app.test_client()
+        self.client = app.test_client()
+        self.admin = app.test_client()
+        self.ban_targets = ban_targets
+        self.rng = rng
+        login(self.client, self.email)
+        login(self.admin, admin_email)
+        self.own_quotes = load_quote_ids(created_by=self.user_id, limit=50)
+
+    def request(self, scenario):
+        if scenario == "feed_anonymous":
+            return self.anonymous.get("/")
+        if scenario == "feed_user":
+            return self.client.get("/")
+        if scenario == "login":
+            # A fresh client so every login runs the full password check
+            return login(self.app.test_client(), self.email)
+        if scenario == "create":
+            return self.client.post("/createquote", data={"quote": f"Load test quote {self.rng.random()}"})
+        if scenario == "edit":
+            if not self.own_quotes:
+                return None
+            content_id = self.rng.choice(self.own_quotes)
+            return self.client.post(f"/content/{content_id}/edit", data={"quote": f"Edited {self.rng.random()}"})
+        if scenario == "ban":
+            try:
+                content_id = self.ban_targets.pop()
+            except IndexError:
+                return None
+            return self.admin.get(f"/content/{content_id}/ban")
+        raise ValueError(f"Unknown scenario {scenario}")
+
+def run_worker(worker, deadline, results):
+    scenarios, weights = zip(*MIX.items())
+    while time.monotonic() < deadline:
+        scenario = worker.rng.choices(scenarios, weights)[0]
+        _queries.count = 0
+        started = time.perf_counter()
+        try:
+            response = worker.request(scenario)
+            if response is None:
+                continue
+            response.get_data()
+            ok = response.status_code in (200, 302)
+        except Exception:
+            ok = False
+        results.record(scenario, time.perf_counter() - started, _queries.count, ok)
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+def summarize(results, elapsed):
+    summary = {}
+    for scenario in MIX:
+        ms = [v * 1000 for v in results.latencies[scenario]]
+        queries = results.queries[scenario]
+        errors = results.errors[scenario]
+        if not ms:
+            summary[scenario] = {"requests": 0, "errors": errors}
+            continue
+        summary[scenario] = {
+            "requests": len(ms),
+            "errors": errors,
+            "rps": round(len(ms) / elapsed, 2),
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p90_ms": round(percentile(ms, 90), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+            "max_ms": round(max(ms), 3),
+            "mean_ms": round(statistics.mean(ms), 3),
+            "queries_mean": round(statistics.mean(queries), 2),
+            "queries_max": max(queries),
+        }
+    return summary
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the routes against a seeded database.")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the login rate limit on")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "load_test.jsonl"))
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        from app import create_app
+        from rate_limit import limiter
+
+        app = create_app()
+
+        limiter.enabled = args.rate_limit
+        users, admins = load_accounts()
+        ban_targets = load_quote_ids(limit=args.threads * 1000)
+        random.Random(args.seed).shuffle(ban_targets)
+
+        workers = [
+            Worker(app, users[i % len(users)], admins[i % len(admins)], ban_targets, random.Random(args.seed + i))
+            for i in range(args.threads)
+        ]
+
+        results = Results()
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=run_worker, args=(worker, deadline, results)) for worker in workers]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+    summary = summarize(results, elapsed)
+    total = sum(s["requests"] for s in summary.values())
+    print(f"{engine.dialect.name}, {args.threads} threads, {elapsed:.1f}s, {total / elapsed:.0f} req/s")
+    for scenario, s in summary.items():
+        if not s["requests"]:
+            print(f"  {scenario:15} no requests, {s['errors']} errors")
+            continue
+        print(f"  {scenario:15} {s['rps']:8.1f} req/s  p50 {s['p50_ms']:8.2f} ms  p99 {s['p99_ms']:8.2f} ms  "
+              f"{s['queries_mean']:5.1f} queries/req  {s['errors']} errors")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "database": engine.dialect.name,
+            "threads": args.threads,
+            "duration": round(elapsed, 3),
+            "rps": round(total / elapsed, 2),
+            "scenarios": summary,
+        }) + "\n")
+    print(f"Results appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,471 @@
-from flask import Flask, abort, jsonify
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import create_engine, JSON, UUID
+import click
+from flask import Flask, jsonify
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy import create_engine, event, make_url, JSON, Select, UUID
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+import itertools
 import os
+import threading
+from contextlib import contextmanager
+import time
 from dotenv import load_dotenv
-from utils import hash_password, get_db
+from passwords import hash_password
 
 # Load environment variables from .env file
 load_dotenv()
 
-# get database url from .env file
+# get database url from .env file, checked when the engine is created
 DATABASE_URL = os.getenv("SUPABASE_URL")
 
-if not DATABASE_URL:
-    abort(404, description="SUPABASE_URL environment variable is not set in the .env file.")
-
-# Get superadmin details from .env file
+# Get superadmin details from .env file, only init_db needs them
 SUPERADMIN_PASSWORD = os.getenv("SUPERADMIN_PASSWORD")
 SUPERADMIN_EMAIL = os.getenv("SUPERADMIN_EMAIL")
 
-if not (SUPERADMIN_PASSWORD and SUPERADMIN_EMAIL):
-    abort(404, description="Superadmin credentials are not set in the .env file.")
+# Connection pool settings, one engine and pool per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))  # extra connections opened under load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # reopen connections older than this (seconds)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # test connections on checkout
+# Set when connecting through PgBouncer/Supavisor in transaction mode (port 6543),
+# the bouncer does the pooling so connections are not kept open here
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Supabase needs SSL, set to "disable" for a local Postgres (sqlite URLs ignore it)
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+
+# Read replicas, comma separated URLs. The read-only GET routes (utils.replica_reads) send their SELECTs
+# to one of them, everything else goes to the primary. Empty: every query goes to the primary
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))  # seconds, a replica further behind is not used
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))  # seconds between health and lag checks
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.waits += 1
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+pool_stats = PoolStats()
+
+# QueuePool that records how long each checkout waited for a connection
+class TimedQueuePool(QueuePool):
+    _local = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get calls itself when it retries, only time the outer call
+        if getattr(self._local, "timing", False):
+            return super()._do_get()
+
+        self._local.timing = True
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            pool_stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        finally:
+            self._local.timing = False
+        pool_stats.record_wait(time.perf_counter() - started)
+        return connection
+
+def database_url():
+    if not DATABASE_URL:
+        raise RuntimeError("SUPABASE_URL environment variable is not set in the .env file.")
+    return DATABASE_URL
+
+def engine_options(url=None):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    url = make_url(url or DATABASE_URL)
+    if url.drivername.startswith("postgresql"):
+        options["connect_args"] = {"sslmode": DB_SSLMODE}  # Ensures SSL connection for secure supabase need it
+    elif url.drivername.startswith("sqlite"):
+        # Local stand-in database (benchmarks/seed.py), pooled connections move between request threads
+        options["connect_args"] = {"check_same_thread": False}
+    if DB_PGBOUNCER:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+# The SQLAlchemy engine, shared by every request of this process. Created on first use so importing
+# the models or building the app doesn't connect or need SUPABASE_URL (CLI commands, benchmarks, gunicorn preload)
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(database_url(), **engine_options())
+    return _engine
+
+# `from database import engine` still works, the engine is created when it is first imported
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Seconds behind the primary. 0 for a Postgres that isn't replaying WAL (a primary) or is caught up
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.engine = create_engine(url, **engine_options(url))
+        self.healthy = False  # until the first check
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+        self.reads = 0
+        # A query failing on a lost connection takes the replica out until the next check passes
+        event.listen(self.engine, "handle_error", self.connection_failed)
+
+    def measure_lag(self, conn):
+        if conn.dialect.name == "postgresql":
+            return float(conn.exec_driver_sql(REPLICA_LAG_SQL).scalar() or 0)
+        # Local stand-in (benchmarks/check_replica_routing.py): reachable means usable
+        conn.exec_driver_sql("SELECT 1")
+        return 0.0
+
+    def check(self):
+        try:
+            with self.engine.connect() as conn:
+                self.lag = self.measure_lag(conn)
+            self.error = None
+            self.healthy = self.lag <= DB_REPLICA_MAX_LAG
+        except Exception as e:
+            self.healthy = False
+            self.error = str(e)
+        self.checked_at = time.time()
+
+    def connection_failed(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.healthy = False
+            self.error = str(context.original_exception)
+
+class ReplicaRouter:
+    def __init__(self, urls):
+        self.urls = urls
+        self.replicas = []
+        self.lock = threading.Lock()
+        self.pid = None
+        self.turn = itertools.count()
+        self.fallbacks = 0  # reads sent to the primary because no replica was usable
+
+    # Engines and the checker thread are created by the first read of each process, a forked worker
+    # doesn't inherit the master's connections or threads
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.replicas = [Replica(url) for url in self.urls]
+            self.check()
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, name="replica-checks", daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(DB_REPLICA_CHECK_INTERVAL)
+            self.check()
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check()
+
+    # Engine of a healthy replica, in turn. None when there is none: the read goes to the primary
+    def pick(self):
+        if not self.urls:
+            return None
+        self.start()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+        replica = healthy[next(self.turn) % len(healthy)]
+        replica.reads += 1
+        return replica.engine
+
+    def dispose(self, close=True):
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+        self.replicas = []
+        self.pid = None
+
+    def stats(self):
+        return {
+            "fallbacks": self.fallbacks,
+            "replicas": [
+                {
+                    "url": make_url(replica.url).render_as_string(hide_password=True),
+                    "healthy": replica.healthy,
+                    "lag": replica.lag,
+                    "reads": replica.reads,
+                    "error": replica.error,
+                    "checked_at": replica.checked_at,
+                }
+                for replica in self.replicas
+            ],
+        }
+
+replica_router = ReplicaRouter(DB_REPLICA_URLS)
+
+# Open connections up to the pool size now, so the first requests of a worker don't pay for the
+# TCP/SSL handshakes. Called in each worker after the fork, see gunicorn.conf.py
+def warm_pool():
+    engines = [get_engine()]
+    if replica_router.urls:
+        replica_router.start()
+        engines += [replica.engine for replica in replica_router.replicas if replica.healthy]
+    connections = []
+    try:
+        for engine in engines:
+            if isinstance(engine.pool, QueuePool):
+                for _ in range(DB_POOL_SIZE):
+                    connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+# Drop the pooled connections. A forked child passes close=False, the connections it inherited belong
+# to the parent (SQLAlchemy "Using Connection Pools with Multiprocessing")
+def dispose_engine(close=True):
+    if _engine is not None:
+        _engine.dispose(close=close)
+    replica_router.dispose(close=close)
 
-# create SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"sslmode": "require"}  # Ensures SSL connection for secure supabase need it
-)
+# Count the statements run on the engine inside the block, used to check routes for N+1 queries:
+#   with count_queries() as queries: client.get("/")
+#   assert queries.count <= 2, queries.statements
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+@contextmanager
+def count_queries(bind=None):
+    bind = bind or get_engine()
+    counter = QueryCounter()
+    event.listen(bind, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", counter)
+
+# Async engine for the ASGI mode (asgi.py), created on first use with the same pool budget
+_async_engine = None
+_async_sessionmaker = None
+
+def async_database_url(url):
+    url = make_url(url)
+    if url.drivername.startswith("postgresql"):
+        return url.set(drivername="postgresql+asyncpg")
+    if url.drivername.startswith("sqlite"):
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+def async_engine_options():
+    url = make_url(DATABASE_URL)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.drivername.startswith("postgresql"):
+        connect_args = {"ssl": DB_SSLMODE}  # asyncpg spelling of sslmode
+        if DB_PGBOUNCER:
+            # PgBouncer in transaction mode can't keep prepared statements between transactions
+            connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+        options["connect_args"] = connect_args
+    if DB_PGBOUNCER:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+def get_async_sessionmaker():
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(async_database_url(database_url()), **async_engine_options())
+        _async_sessionmaker = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+def get_pool_stats():
+    pool = get_engine().pool
+    stats = {
+        "pool_class": type(pool).__name__,
+        "waits": pool_stats.waits,
+        "wait_time_total": round(pool_stats.wait_time, 6),
+        "wait_time_avg": round(pool_stats.wait_time / pool_stats.waits, 6) if pool_stats.waits else 0.0,
+        "wait_time_max": round(pool_stats.max_wait_time, 6),
+        "timeouts": pool_stats.timeouts,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=DB_MAX_OVERFLOW,
+        )
+    return stats
+
+# Postgres tables partitioned by month (audit_events, content): the partition holding one (year, month).
+# Rows outside every partition land in the table's DEFAULT partition
+def month_partition_ddl(table, year, month):
+    end_year, end_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table}_{year:04d}_{month:02d} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{end_year:04d}-{end_month:02d}-01')"
+    )
+
+# Sessions bind to the engine when they first run a statement, not when they are created.
+# With info["replica_reads"] (set by utils.replica_reads) plain SELECTs go to one replica for the whole
+# session, flushes, writes and SELECT ... FOR UPDATE still go to the primary
+class DeferredSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get("replica_reads") and not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None:
+            if "replica" not in self.info:
+                self.info["replica"] = replica_router.pick()
+            if self.info["replica"] is not None:
+                return self.info["replica"]
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+# info["wrote"]: the session changed something, its client then reads from the primary for a while
+@event.listens_for(DeferredSession, "after_flush")
+def mark_flush(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(DeferredSession, "do_orm_execute")
+def mark_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
 
 # Create a sessionmaker to manage database sessions
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=DeferredSession, autocommit=False, autoflush=False)
 
 # Base class for ิbuilt models
 Base = declarative_base()
 
+# Directory with the Alembic migration scripts (also used by `flask db ...`)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Predefine roles and their permissions
+DEFAULT_ROLES = {
+    "superadmin": ["updateadmin"],
+    "admin": ["ban"],
+    "user": ["create_own_content", "update_own_content", "delete_own_content"],
+}
+
+# `flask db upgrade|migrate|...` from Flask-Migrate. It imports all of alembic, so it is only loaded
+# when a db command runs, web workers never import it
+class MigrateGroup(click.Group):
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask.cli import ScriptInfo
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db
+
+        app = parent.ensure_object(ScriptInfo).load_app()
+        if "migrate" not in app.extensions:
+            Migrate().init_app(app, directory=MIGRATIONS_DIR)
+        return db.make_context(info_name, args, parent=parent, **extra)
+
+migrate_cli = MigrateGroup("db", help="Perform database migrations (Flask-Migrate).")
+
+def upgrade_db(revision="head"):
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(MIGRATIONS_DIR, "alembic.ini"))
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    command.upgrade(config, revision)
+
 def init_db():
-    from models import Base, Role, User
+    from authors import display_name
+    from events import roles_changed
+    from models import Role, RolePermission, User
+
+    if not (SUPERADMIN_PASSWORD and SUPERADMIN_EMAIL):
+        return jsonify({"error": "Superadmin credentials are not set in the .env file.", "status_code": 400}), 400
+
+    try:
+        # Bring the schema up to date with the migration scripts, existing data is kept
+        upgrade_db()
+    except Exception as e:
+        return jsonify({"error": "Migration failed: " + str(e), "status_code": 500}), 500
+
     # Create a session to interact with the database
     db = SessionLocal()
 
     try:
-        # Attempt to drop all existing tables (optional: can be commented out if not needed)
-        Base.metadata.drop_all(bind=engine)
-        
-        # Create all tables (if they don't exist)
-        Base.metadata.create_all(bind=engine)
-
-        # Predefine roles and their permissions
-        roles = [
-            Role(name="superadmin", permissions=["updateadmin"]),
-            Role(name="admin", permissions=["ban"]),
-            Role(name="user", permissions=["create_own_content", "update_own_content", "delete_own_content"])
-        ]
-
-        # Insert roles into the database
-        db.add_all(roles)
+        # Insert only the roles that don't exist yet
+        existing_roles = {name for (name,) in db.query(Role.name).all()}
+        db.add_all([
+            Role(name=name, permission_rows=[RolePermission(permission=permission) for permission in permissions])
+            for name, permissions in DEFAULT_ROLES.items()
+            if name not in existing_roles
+        ])
         db.commit()
+        roles_changed.send(None)
 
         # Create a superadmin user with hashed password
         superadmin_role = db.query(Role).filter(Role.name == "superadmin").first()
         if not superadmin_role:
             return jsonify({"error": "Superadmin role not found in the database", "status_code": 404}), 404
 
-        superadmin_user = User(
-            first_name="Rithipong",  # should change this
-            last_name="Leanghirunkun",  # should change this
-            bio="superadmin",
-            email=SUPERADMIN_EMAIL,
-            password_hash=hash_password(SUPERADMIN_PASSWORD),  # Hash the password before saving
-            role_id=superadmin_role.id
-        )
+        if not db.query(User).filter(User.email == SUPERADMIN_EMAIL).first():
+            superadmin_user = User(
+                first_name="Rithipong",  # should change this
+                last_name="Leanghirunkun",  # should change this
+                display_name=display_name("Rithipong", "Leanghirunkun"),
+                bio="superadmin",
+                email=SUPERADMIN_EMAIL,
+                password_hash=hash_password(SUPERADMIN_PASSWORD),  # Hash the password before saving
+                role_id=superadmin_role.id
+            )
 
-        # Insert superadmin user into the database
-        db.add(superadmin_user)
-        db.commit()
+            # Insert superadmin user into the database
+            db.add(superadmin_user)
+            db.commit()
 
         # Return a success message
-        return jsonify({"message": "Drop old model table, new model table, all role data and superadmin created successfully!", "status_code": 200}), 200
+        return jsonify({"message": "Database migrated, roles and superadmin are up to date!", "status_code": 200}), 200
 
     except IntegrityError as e:
         # Handle database integrity error (e.g., duplicate email, missing foreign key)
@@ -92,7 +480,7 @@ def init_db():
     except Exception as e:
         # Handle any other exceptions (e.g., general SQLAlchemy or unknown errors)
         db.rollback()  # Rollback the transaction
-        return jsonify({"error": {"Something went wrong: " + str(e)}, "status_code": 500}), 500
+        return jsonify({"error": "Something went wrong: " + str(e), "status_code": 500}), 500
 
     finally:
         db.close()  # Close the session when done
@@ -0,0 +1,12 @@
+# events.py
+from blinker import Namespace
+
+signals = Namespace()
+
+# Sent after a quote is committed: content_changed.send(content_id=..., action="created"|"updated"|"deleted"|"banned")
+# Bulk changes send it once with content_id=None, subscribers then drop what they cached.
+# Caches and indexes subscribe to it instead of every route calling them
+content_changed = signals.signal("content-changed")
+
+# Sent after role permissions are changed in the database, permissions.py reloads its map
+roles_changed = signals.signal("roles-changed")
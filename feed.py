@@ -0,0 +1,113 @@
+# feed.py
+import base64
+import uuid
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from models import Content, INACTIVE, BANNED
+from permissions import has_permission
+from records import QuoteRecord
+
+# Page size for the quote feed
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+# Number of rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 500
+
+def clamp_page_size(limit):
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+# Cursor is the (created_at, id) of the last row on the page, url-safe encoded
+def encode_cursor(created_at: datetime, content_id):
+    raw = f"{created_at.isoformat()}|{content_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, content_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(content_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+def feed_columns():
+    return (
+        Content.id,
+        Content.quote,
+        Content.status,
+        Content.created_by,
+        Content.created_at,
+        # Denormalized author name (authors.py), the feed doesn't join users
+        Content.author_name.label("posts_by"),
+    )
+
+# Works on a legacy Query (sync routes) and on a select() (async routes in asgi.py)
+def apply_feed(query, cursor=None):
+    query = query.filter(Content.status != INACTIVE)  # Exclude inactive content
+
+    # Keyset pagination: only rows strictly older than the cursor, (created_at, id) is the sort key
+    if cursor:
+        created_at, content_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Content.created_at, Content.id) < tuple_(created_at, content_id))
+
+    return query.order_by(Content.created_at.desc(), Content.id.desc())
+
+def feed_query(db, cursor=None):
+    return apply_feed(db.query(*feed_columns()), cursor)
+
+def feed_select(cursor=None):
+    return apply_feed(select(*feed_columns()), cursor)
+
+def fetch_page(db, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    limit = clamp_page_size(limit)
+    # Fetch one extra row to know if there is a next page without a count query
+    return build_page(feed_query(db, cursor).limit(limit + 1), limit)
+
+# rows is iterated once, each row becomes a record as it is read, the rows aren't kept next to them
+def build_page(rows, limit):
+    records = [QuoteRecord.from_row(row) for row in rows]
+    next_cursor = None
+    if len(records) > limit:
+        del records[limit:]
+        next_cursor = encode_cursor(records[-1].created_at, records[-1].id)
+    return records, next_cursor
+
+def stream_feed(db, cursor=None):
+    # Build the query up front so an invalid cursor fails before the response starts
+    # yield_per makes SQLAlchemy use a server-side cursor and fetch in batches
+    query = feed_query(db, cursor).execution_options(yield_per=STREAM_BATCH_SIZE)
+
+    def generate():
+        # the session is closed once the generator is exhausted or the client disconnects
+        try:
+            for row in query:
+                yield QuoteRecord.from_row(row)
+        finally:
+            db.close()
+
+    return generate()
+
+# Flags for the action buttons of each card, worked out once per page for the viewer (a Principal or None)
+def with_capabilities(records, viewer):
+    viewer_id = str(viewer.id) if viewer else None
+    edit_own = viewer is not None and (
+        has_permission(viewer.role.name, "update_own_content") or has_permission(viewer.role.name, "delete_own_content")
+    )
+    ban = viewer is not None and has_permission(viewer.role.name, "ban")
+    for record in records:
+        record.can_edit = edit_own and record.created_by == viewer_id
+        record.can_ban = ban and record.status != BANNED
+        yield record
+
+def row_to_json(record):
+    return {
+        "id": record.id,
+        # Banned quotes are hidden from the public, same as the feed page
+        "quote": None if record.status == BANNED else record.quote,
+        "status": record.status,
+        "created_by": record.created_by,
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        "posts_by": record.posts_by,
+    }
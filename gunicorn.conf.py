@@ -0,0 +1,67 @@
+# gunicorn.conf.py
+# gunicorn reads this from the working directory: `gunicorn wsgi:app`, command line flags override it
+import os
+import time
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = 8
+
+# Import and build the app once in the master and fork the workers from it: they start faster and share
+# the imported modules and compiled templates (copy on write) instead of each loading its own
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+def run_warm_up(log, app):
+    from app import warm_up
+
+    started = time.perf_counter()
+    try:
+        warm_up(app)
+    except Exception:
+        log.exception("Warm-up failed, it will happen on the first requests")
+        return
+    log.info("Warm-up done in %.0f ms", (time.perf_counter() - started) * 1000)
+
+# In the master, after the preloaded app is built and before the first fork
+def when_ready(server):
+    if server.cfg.preload_app:
+        import database
+
+        run_warm_up(server.log, server.app.wsgi())
+        # Warm-up queried the database, don't hand those connections to the workers
+        database.dispose_engine()
+
+def post_fork(server, worker):
+    import database
+
+    database.dispose_engine(close=False)
+
+# In each worker, before it accepts requests
+def post_worker_init(worker):
+    import database
+
+    if not worker.cfg.preload_app:
+        run_warm_up(worker.log, worker.wsgi)
+    started = time.perf_counter()
+    try:
+        connections = database.warm_pool()
+    except Exception:
+        worker.log.exception("Could not open the database connections")
+        return
+    worker.log.info("Opened %d database connections in %.0f ms", connections, (time.perf_counter() - started) * 1000)
+
+    # Jobs left by other workers or by a restart are picked up without waiting for a new one
+    from jobs import job_queue
+
+    job_queue.start()
+
+# The worker's queued audit events are written and its running jobs finished before it exits
+def worker_exit(server, worker):
+    from audit import audit_log
+    from jobs import job_queue
+
+    audit_log.close()
+    job_queue.stop()
@@ -0,0 +1,211 @@
+# instrumentation.py
+# Per-request timings (database, templates, password hashing), Prometheus metrics and a sampling profiler
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from flask import before_render_template, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Add a Server-Timing header with the breakdown to every response (visible in the browser dev tools)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+# Allow /internal/profile to sample the stacks of this worker
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_MAX_SECONDS = 60
+
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestTimings:
+    __slots__ = ("started", "db", "queries", "render", "render_started", "hash")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.render = 0.0
+        self.render_started = None
+        self.hash = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+_timings = ContextVar("request_timings", default=None)
+
+# Add the time spent in the block to the current request, does nothing outside of one
+@contextmanager
+def timed(name):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, name, getattr(timings, name) + time.perf_counter() - started)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status) -> count
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))  # endpoint -> count per bucket
+        self.durations = Counter()  # endpoint -> seconds
+        self.counts = Counter()  # endpoint -> requests
+        self.db_seconds = Counter()
+        self.queries = Counter()
+        self.render_seconds = Counter()
+        self.hash_seconds = Counter()
+
+    def record(self, endpoint, method, status, timings, duration):
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            buckets = self.buckets[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            self.durations[endpoint] += duration
+            self.counts[endpoint] += 1
+            self.db_seconds[endpoint] += timings.db
+            self.queries[endpoint] += timings.queries
+            self.render_seconds[endpoint] += timings.render
+            self.hash_seconds[endpoint] += timings.hash
+
+    # Prometheus text exposition format
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            family("lovequotes_http_requests_total", "counter", "Requests by endpoint, method and status.")
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'lovequotes_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            family("lovequotes_http_request_duration_seconds", "histogram", "Request duration.")
+            for endpoint in sorted(self.counts):
+                for bound, count in zip(DURATION_BUCKETS, self.buckets[endpoint]):
+                    lines.append(f'lovequotes_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'lovequotes_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {self.counts[endpoint]}')
+                lines.append(f'lovequotes_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {self.durations[endpoint]:.6f}')
+                lines.append(f'lovequotes_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {self.counts[endpoint]}')
+
+            for name, values, help_text in (
+                ("lovequotes_db_seconds_total", self.db_seconds, "Time spent running SQL statements."),
+                ("lovequotes_db_queries_total", self.queries, "SQL statements run."),
+                ("lovequotes_template_render_seconds_total", self.render_seconds, "Time spent rendering templates."),
+                ("lovequotes_password_hash_seconds_total", self.hash_seconds, "Time spent hashing and verifying passwords."),
+            ):
+                family(name, "counter", help_text)
+                for endpoint in sorted(values):
+                    value = values[endpoint]
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value if isinstance(value, int) else f"{value:.6f}"}')
+
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _timings.get() is not None:
+        context._query_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _timings.get()
+    started = getattr(context, "_query_started", None)
+    if timings is not None and started is not None:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+
+def instrument_engine(engine):
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+def template_started(sender, template, context, **extra):
+    timings = _timings.get()
+    if timings is not None:
+        timings.render_started = time.perf_counter()
+
+def template_finished(sender, template, context, **extra):
+    timings = _timings.get()
+    if timings is not None and timings.render_started is not None:
+        timings.render += time.perf_counter() - timings.render_started
+        timings.render_started = None
+
+def server_timing(timings, duration):
+    return ", ".join([
+        f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries"',
+        f"render;dur={timings.render * 1000:.2f}",
+        f"hash;dur={timings.hash * 1000:.2f}",
+        f"total;dur={duration * 1000:.2f}",
+    ])
+
+def init_app(app):
+    # Every engine, so the one database.py creates on first use is timed too
+    instrument_engine(Engine)
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+
+    @app.before_request
+    def start_timings():
+        request.environ["lovequotes.timings_token"] = _timings.set(RequestTimings())
+
+    @app.after_request
+    def record_timings(response):
+        timings = _timings.get()
+        if timings is None:
+            return response
+        # Streamed bodies are rendered after this point, their time isn't included
+        duration = timings.elapsed()
+        metrics.record(request.endpoint or "unmatched", request.method, response.status_code, timings, duration)
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(timings, duration)
+        return response
+
+    @app.teardown_request
+    def reset_timings(exception=None):
+        token = request.environ.pop("lovequotes.timings_token", None)
+        if token is not None:
+            _timings.reset(token)
+
+# Stacks of every other thread every `interval` seconds, in the folded format that flamegraph.pl and
+# speedscope read: "outer;inner;innermost count"
+def sample_stacks(seconds, interval=0.005):
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+_profile_lock = threading.Lock()
+
+# None when a profile is already running in this worker
+def profile(seconds, interval=0.005):
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        stacks = sample_stacks(min(seconds, PROFILER_MAX_SECONDS), interval)
+    finally:
+        _profile_lock.release()
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
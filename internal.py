@@ -0,0 +1,82 @@
+# internal.py
+import hmac
+import os
+from flask import Blueprint, Response, abort, jsonify, request
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Token for the /internal endpoints, without it they answer nobody
+INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN")
+# Also answer requests from localhost without the token. Off by default: behind a reverse proxy on the same
+# host every request comes from localhost
+INTERNAL_ALLOW_LOOPBACK = os.getenv("INTERNAL_ALLOW_LOOPBACK", "false").lower() == "true"
+
+internal = Blueprint("internal", __name__, url_prefix="/internal")
+
+@internal.before_request
+def require_internal_access():
+    if INTERNAL_TOKEN:
+        token = request.headers.get("X-Internal-Token", "")
+        if hmac.compare_digest(token, INTERNAL_TOKEN):
+            return None
+    if INTERNAL_ALLOW_LOOPBACK and request.remote_addr in ("127.0.0.1", "::1"):
+        return None
+    # Pretend the endpoint doesn't exist
+    abort(404)
+
+@internal.route("/pool", methods=["GET"])
+def pool():
+    from database import get_pool_stats
+    return jsonify(get_pool_stats())
+
+@internal.route("/replicas", methods=["GET"])
+def replicas():
+    from database import replica_router
+    return jsonify(replica_router.stats())
+
+@internal.route("/principal-cache", methods=["GET"])
+def principal_cache_stats():
+    from principals import principal_cache
+    return jsonify(principal_cache.stats())
+
+@internal.route("/page-cache", methods=["GET"])
+def page_cache_stats():
+    from page_cache import cache_stats
+    return jsonify(cache_stats())
+
+@internal.route("/audit", methods=["GET"])
+def audit_stats():
+    from audit import audit_log
+    return jsonify(audit_log.stats())
+
+@internal.route("/jobs", methods=["GET"])
+def job_stats():
+    from database import SessionLocal
+    from jobs import job_queue
+    with SessionLocal() as db:
+        return jsonify(job_queue.stats(db))
+
+@internal.route("/live-feed", methods=["GET"])
+def live_feed_stats():
+    from live_feed import live_feed
+    return jsonify(live_feed.stats())
+
+@internal.route("/metrics", methods=["GET"])
+def metrics():
+    from instrumentation import metrics
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Folded stacks of this worker for a flamegraph: /internal/profile?seconds=10 | flamegraph.pl > profile.svg
+@internal.route("/profile", methods=["GET"])
+def profile():
+    from instrumentation import PROFILER_ENABLED, profile
+    if not PROFILER_ENABLED:
+        abort(404)
+    seconds = request.args.get("seconds", 10, type=float)
+    interval = max(request.args.get("interval", 0.005, type=float), 0.001)
+    stacks = profile(seconds, interval)
+    if stacks is None:
+        return jsonify({"error": "A profile is already running in this worker."}), 409
+    return Response(stacks, mimetype="text/plain")
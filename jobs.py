@@ -0,0 +1,358 @@
+# jobs.py
+# Durable queue of background jobs in the jobs table (migration 0008), for the work a request triggers
+# but doesn't have to wait for. A job is enqueued in the request's own transaction, so it exists exactly
+# when the change that asked for it is committed, and survives restarts until a worker has run it.
+#
+# Every web worker runs JOB_WORKERS threads taking jobs from the table, `flask jobs work` runs dedicated
+# worker processes. On Postgres they take jobs with FOR UPDATE SKIP LOCKED and never wait on each other.
+# A job's own changes and its completion are committed together, a failed job is retried with backoff
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import click
+from dotenv import load_dotenv
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, event, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from authors import recount_authors
+from database import SessionLocal, dispose_engine
+from models import Job
+
+# Load environment variables from .env file
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # threads per web worker, 0 leaves the jobs to `flask jobs work`
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))  # seconds an idle worker waits before looking again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 5))  # seconds before the first retry, doubled after each one
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))  # a running job not done by then is taken again
+JOB_KEEP_DAYS = int(os.getenv("JOB_KEEP_DAYS", 7))  # finished jobs kept by `flask jobs purge`
+MAX_RETRY_DELAY = 3600
+LATENCY_SAMPLES = 1000  # recent jobs the latency percentiles are computed from
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# name -> (function, priority, max_attempts). The function gets a session and the payload as keyword
+# arguments, and must not commit: the worker commits its changes with the job's completion. What it
+# returns is kept in the job's result
+handlers = {}
+
+def job(name, priority=0, max_attempts=JOB_MAX_ATTEMPTS):
+    def decorator(func):
+        handlers[name] = (func, priority, max_attempts)
+        return func
+    return decorator
+
+# INSERT of a job, for the sync and the async sessions. With an idempotency_key already in the table
+# nothing is inserted
+def enqueue_statement(dialect, name, payload=None, priority=None, idempotency_key=None, delay=0):
+    _, default_priority, max_attempts = handlers[name]
+    now = utcnow()
+    values = dict(
+        id=uuid.uuid4(),
+        name=name,
+        payload=payload or {},
+        priority=default_priority if priority is None else priority,
+        status=QUEUED,
+        attempts=0,
+        max_attempts=max_attempts,
+        idempotency_key=idempotency_key,
+        created_at=now,
+        run_at=now + timedelta(seconds=delay),
+    )
+    if idempotency_key is not None and dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = dialect_insert(Job).values(**values).on_conflict_do_nothing(index_elements=["idempotency_key"])
+    else:
+        statement = insert(Job).values(**values)
+    return statement.returning(Job.id)
+
+# Adds the job to the caller's transaction, the workers of this process are woken when it is committed.
+# Returns the job's id, None when a job with the same idempotency_key was already there
+def enqueue(db, name, payload=None, priority=None, idempotency_key=None, delay=0):
+    job_id = db.execute(enqueue_statement(db.get_bind().dialect.name, name, payload, priority, idempotency_key, delay)).scalar()
+    db.info["jobs_enqueued"] = True
+    return job_id
+
+# Same for the async sessions of the ASGI app (asgi.py)
+async def enqueue_async(db, name, payload=None, priority=None, idempotency_key=None, delay=0):
+    job_id = (await db.execute(enqueue_statement(db.get_bind().dialect.name, name, payload, priority, idempotency_key, delay))).scalar()
+    db.info["jobs_enqueued"] = True
+    return job_id
+
+# For a handler: func runs once the job's changes are committed (signals, caches), not when they are rolled back
+def after_commit(db, func):
+    db.info.setdefault("job_after_commit", []).append(func)
+
+@event.listens_for(Session, "after_commit")
+def wake_after_commit(session):
+    if session.info.pop("jobs_enqueued", False):
+        job_queue.wake()
+
+@event.listens_for(Session, "after_rollback")
+def forget_after_rollback(session):
+    session.info.pop("jobs_enqueued", None)
+
+# Running past its lease: its worker died, maybe killed by the job itself
+def lost(now):
+    return and_(Job.status == RUNNING, Job.locked_until < now)
+
+# Queued and due, or lost with attempts left
+def runnable(now):
+    return or_(
+        and_(Job.status == QUEUED, Job.run_at <= now),
+        and_(lost(now), Job.attempts < Job.max_attempts),
+    )
+
+def retry_delay(attempts):
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "p50": round(ordered[len(ordered) // 2], 6),
+        "p95": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 6),
+        "max": round(ordered[-1], 6),
+    }
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.pid = None
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_error = None
+        self.waits = deque(maxlen=LATENCY_SAMPLES)  # seconds from due to started
+        self.runs = deque(maxlen=LATENCY_SAMPLES)  # seconds from started to done
+        atexit.register(self.stop)
+
+    # The worker threads are started on the first job of each process, or by gunicorn's post_worker_init:
+    # with preload_app the workers are forked from a master whose threads don't survive the fork
+    def start(self, workers=None):
+        workers = self.workers if workers is None else workers
+        with self.lock:
+            if self.pid == os.getpid() or workers <= 0:
+                return
+            self.ready = threading.Event()
+            self.stopping = threading.Event()
+            self.pid = os.getpid()
+            self.threads = [
+                threading.Thread(target=self.run, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+            ]
+            for thread in self.threads:
+                thread.start()
+
+    def wake(self):
+        self.start()
+        self.ready.set()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except Exception:
+                log.exception("Job worker error")
+            self.ready.wait(JOB_POLL_INTERVAL)
+            self.ready.clear()
+
+    # Takes the next job in a short transaction of its own, so the row isn't locked while it runs
+    def claim(self):
+        now = utcnow()
+        with SessionLocal() as db:
+            # A lost job on its last attempt fails instead of being taken again, so a job that kills its
+            # worker doesn't run forever
+            exhausted = db.execute(
+                update(Job)
+                .where(lost(now), Job.attempts >= Job.max_attempts)
+                .values(status=FAILED, finished_at=now, locked_until=None, last_error="Worker lost during the last attempt.")
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if exhausted:
+                self.failed += exhausted
+                db.commit()
+            job_id = db.execute(
+                select(Job.id)
+                .where(runnable(now))
+                .order_by(Job.priority.desc(), Job.run_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).scalar()
+            if job_id is None:
+                return None
+            # Conditional, so two workers of a database without SKIP LOCKED (SQLite) can't both take it
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == job_id, runnable(now))
+                .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now, locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS))
+                .returning(Job.name, Job.payload, Job.attempts, Job.max_attempts, Job.run_at)
+                .execution_options(synchronize_session=False)
+            ).first()
+            db.commit()
+        return (job_id, *claimed, now) if claimed else None
+
+    # Runs one job, False when there was none to run
+    def run_next(self):
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        job_id, name, payload, attempt, max_attempts, run_at, started = claimed
+        self.waits.append(max((started - run_at).total_seconds(), 0.0))
+        clock = time.perf_counter()
+        mine = and_(Job.id == job_id, Job.attempts == attempt)
+        try:
+            func = handlers[name][0]
+            with SessionLocal() as db:
+                result = func(db, **(payload or {}))
+                done = db.execute(
+                    update(Job).where(mine).values(status=DONE, finished_at=utcnow(), locked_until=None, last_error=None, result=result)
+                    .execution_options(synchronize_session=False)
+                )
+                # Its lease ran out and another worker took it, or it was failed as lost: that other
+                # outcome stands and this run's changes are dropped
+                if done.rowcount != 1:
+                    db.rollback()
+                    log.warning("Job %s %s finished after its lease ran out, its changes are dropped", name, job_id)
+                    return True
+                db.commit()
+                for callback in db.info.pop("job_after_commit", []):
+                    # The job is done, a failing callback doesn't run it again
+                    try:
+                        callback()
+                    except Exception:
+                        log.exception("After commit callback of job %s %s failed", name, job_id)
+            self.succeeded += 1
+            self.runs.append(time.perf_counter() - clock)
+        except Exception as e:
+            self.last_error = f"{name}: {e}"
+            log.exception("Job %s %s failed (attempt %d of %d)", name, job_id, attempt, max_attempts)
+            retry = attempt < max_attempts
+            with SessionLocal() as db:
+                db.execute(
+                    update(Job).where(mine).values(
+                        status=QUEUED if retry else FAILED,
+                        run_at=utcnow() + timedelta(seconds=retry_delay(attempt)) if retry else run_at,
+                        finished_at=None if retry else utcnow(),
+                        locked_until=None,
+                        last_error=str(e)[:2000],
+                    ).execution_options(synchronize_session=False)
+                )
+                db.commit()
+            if retry:
+                self.retried += 1
+            else:
+                self.failed += 1
+        return True
+
+    # The running jobs of this process are finished, the threads then end
+    def stop(self, timeout=10):
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+            self.stopping.set()
+            self.ready.set()
+            for thread in self.threads:
+                thread.join(timeout)
+            self.threads = []
+            self.pid = None
+
+    # Queue depth from the table (all processes), counts and latencies of this process
+    def stats(self, db):
+        now = utcnow()
+        depth = dict(db.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+        oldest = db.execute(select(func.min(Job.run_at)).where(Job.status == QUEUED, Job.run_at <= now)).scalar()
+        return {
+            "workers": len(self.threads) if self.pid == os.getpid() else 0,
+            "depth": {status: depth.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            "oldest_due_seconds": round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_error": self.last_error,
+            "wait_seconds": percentiles(list(self.waits)),
+            "run_seconds": percentiles(list(self.runs)),
+        }
+
+job_queue = JobQueue()
+
+# Follow-up of a new quote: its author's quote counts. A recount rather than +1, so running it twice
+# or after a bulk recount gives the same result
+@job("authors.recount")
+def recount_author_job(db, author_id):
+    recount_authors(db, [uuid.UUID(author_id)])
+
+jobs_cli = AppGroup("jobs", help="Background job queue.")
+
+def work_process(threads):
+    # A process of its own, not the parent's connections
+    dispose_engine(close=False)
+    job_queue.start(threads)
+    while not job_queue.stopping.wait(1):
+        pass
+
+@jobs_cli.command("work", help="Run job workers until interrupted.")
+@click.option("--threads", type=int, default=max(JOB_WORKERS, 1), show_default=True, help="Worker threads per process.")
+@click.option("--processes", type=int, default=1, show_default=True)
+def work_command(threads, processes):
+    click.echo(f"Running {processes} x {threads} job workers: {', '.join(sorted(handlers))}")
+    children = [multiprocessing.Process(target=work_process, args=(threads,), daemon=True) for _ in range(processes - 1)]
+    for child in children:
+        child.start()
+    try:
+        job_queue.start(threads)
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        job_queue.stop()
+    finally:
+        for child in children:
+            child.terminate()
+            child.join()
+
+@jobs_cli.command("stats", help="Queue depth and job counts.")
+def stats_command():
+    with SessionLocal() as db:
+        stats = job_queue.stats(db)
+    click.echo(", ".join(f"{status}: {count}" for status, count in stats["depth"].items()))
+    click.echo(f"Oldest due job waiting for {stats['oldest_due_seconds']}s")
+
+@jobs_cli.command("retry", help="Queue the failed jobs again.")
+def retry_command():
+    with SessionLocal() as db:
+        result = db.execute(
+            update(Job).where(Job.status == FAILED)
+            .values(status=QUEUED, attempts=0, run_at=utcnow(), finished_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    click.echo(f"{result.rowcount} failed jobs queued again")
+
+@jobs_cli.command("purge", help="Delete finished jobs.")
+@click.option("--days", type=int, default=JOB_KEEP_DAYS, show_default=True, help="Keep the jobs finished in the last days.")
+def purge_command(days):
+    with SessionLocal() as db:
+        result = db.execute(
+            delete(Job).where(Job.status.in_((DONE, FAILED)), Job.finished_at < utcnow() - timedelta(days=days))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    click.echo(f"{result.rowcount} finished jobs deleted")
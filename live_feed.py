@@ -0,0 +1,300 @@
+# live_feed.py
+# Quote changes pushed to the open feed pages over server-sent events (/api/feed/stream).
+# A change is published once, each worker process looks the quote up once and fans the delta out to its
+# viewers from memory, so an idle viewer costs a queue and a heartbeat, no queries.
+#
+# "local" delivers to the viewers of the process that made the change, enough for one worker and for tests.
+# "postgres" sends every change through NOTIFY, each worker LISTENs on one dedicated connection and
+# receives the changes of all workers (WSGI and ASGI alike)
+import asyncio
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from dotenv import load_dotenv
+from sqlalchemy import select as sql_select
+from database import SessionLocal, get_engine
+from events import content_changed
+from feed import feed_columns, row_to_json
+from models import INACTIVE, Content
+from records import QuoteRecord
+
+# Load environment variables from .env file
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+LIVE_FEED_TRANSPORT = os.getenv("LIVE_FEED_TRANSPORT", "local")
+LIVE_FEED_CHANNEL = os.getenv("LIVE_FEED_CHANNEL", "live_feed")
+LIVE_FEED_HEARTBEAT = float(os.getenv("LIVE_FEED_HEARTBEAT", 15))  # seconds between keep-alive comments
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", 100))  # deltas waiting per viewer, past it the viewer reloads
+LIVE_FEED_HISTORY = int(os.getenv("LIVE_FEED_HISTORY", 256))  # recent deltas kept to resume a reconnecting viewer
+# Each stream of the WSGI app holds one of its threads, the ASGI app (asgi.py) has no such limit
+LIVE_FEED_MAX_STREAMS = int(os.getenv("LIVE_FEED_MAX_STREAMS", 4))  # per WSGI worker
+
+# Sent when a viewer may have missed deltas (bulk change, overflow, lost connection), the page reloads the feed
+RESET = {"action": "reset"}
+
+# One open stream. push() is called from the dispatcher thread, wake tells the stream's thread or event loop
+class Subscriber:
+    def __init__(self, wake):
+        self.wake = wake
+        self.pending = deque()
+        self.overflowed = False
+
+    def push(self, event):
+        if len(self.pending) >= LIVE_FEED_QUEUE_SIZE:
+            self.overflowed = True
+        else:
+            self.pending.append(event)
+        self.wake()
+
+    def drain(self):
+        if self.overflowed:
+            self.overflowed = False
+            self.pending.clear()
+            return [(None, RESET)]
+        events = []
+        while self.pending:
+            events.append(self.pending.popleft())
+        return events
+
+class LocalTransport:
+    def __init__(self):
+        self.hub = None
+
+    def start(self, hub):
+        self.hub = hub
+
+    def send(self, message):
+        self.hub.receive(message)
+
+class PostgresTransport:
+    def __init__(self, channel=LIVE_FEED_CHANNEL):
+        self.channel = channel
+        self.hub = None
+
+    def start(self, hub):
+        self.hub = hub
+        threading.Thread(target=self.listen, name="live-feed-listener", daemon=True).start()
+
+    def send(self, message):
+        with get_engine().connect() as conn:
+            conn.exec_driver_sql("SELECT pg_notify(%s, %s)", (self.channel, json.dumps(message)))
+            conn.commit()
+
+    def listen(self):
+        while True:
+            try:
+                # A connection of its own, out of the pool: it stays LISTENing for the life of the process
+                raw = get_engine().raw_connection()
+                raw.detach()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                conn.cursor().execute(f'LISTEN "{self.channel}"')
+                # Changes made while we weren't listening are lost, the viewers reload
+                self.hub.receive(RESET)
+                while True:
+                    if select.select([conn], [], [], LIVE_FEED_HEARTBEAT) != ([], [], []):
+                        conn.poll()
+                        while conn.notifies:
+                            self.hub.receive(json.loads(conn.notifies.pop(0).payload))
+            except Exception:
+                log.exception("Live feed listener lost its connection, reconnecting")
+                time.sleep(1)
+
+def create_transport(transport=LIVE_FEED_TRANSPORT):
+    if transport == "local":
+        return LocalTransport()
+    if transport == "postgres":
+        return PostgresTransport()
+    raise ValueError(f"Unknown LIVE_FEED_TRANSPORT: {transport}")
+
+class LiveFeed:
+    def __init__(self, transport):
+        self.transport = transport
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        # Event ids are "<process token>-<sequence>", a viewer reconnecting to another process gets a reset
+        self.token = uuid.uuid4().hex[:8]
+        self.sequence = itertools.count(1)
+        self.history = deque(maxlen=LIVE_FEED_HISTORY)
+        self.queue = None
+        self.pid = None
+        self.published = 0
+        self.delivered = 0
+        self.lookups = 0
+        self.threaded_streams = 0  # open WSGI streams, each holds a thread
+
+    # The dispatcher thread and the transport are started by the first stream or change of each process,
+    # gunicorn's preload_app forks the workers from a master whose threads don't survive the fork
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue()
+            self.subscribers = set()
+            self.history.clear()
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, name="live-feed", daemon=True).start()
+            self.transport.start(self)
+
+    # Called after the change is committed: {"action": ..., "id": ...}, or RESET for bulk changes
+    def publish(self, message):
+        self.start()
+        self.published += 1
+        self.queue.put(("send", message))
+
+    # A message from the transport, for this process's viewers
+    def receive(self, message):
+        self.queue.put(("receive", message))
+
+    def run(self):
+        while True:
+            kind, message = self.queue.get()
+            try:
+                if kind == "send":
+                    self.transport.send(message)
+                elif self.subscribers:
+                    self.broadcast(self.resolve(message))
+                else:
+                    # Nobody to tell, and a viewer reconnecting later can't be resumed across the gap
+                    with self.lock:
+                        self.history.clear()
+            except Exception:
+                log.exception("Live feed message %s not handled", message)
+
+    # The delta the viewers get: the quote as the feed shows it, looked up once for all of them
+    def resolve(self, message):
+        if message["action"] == "reset":
+            return RESET
+        if message["action"] == "deleted":
+            return {"action": "deleted", "id": message["id"]}
+        self.lookups += 1
+        with SessionLocal() as db:
+            row = db.execute(sql_select(*feed_columns()).where(Content.id == uuid.UUID(message["id"]))).first()
+        if row is None or row.status == INACTIVE:
+            return {"action": "deleted", "id": message["id"]}
+        return {"action": message["action"], "quote": row_to_json(QuoteRecord.from_row(row))}
+
+    def broadcast(self, delta):
+        event = (f"{self.token}-{next(self.sequence)}", delta)
+        with self.lock:
+            self.history.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.push(event)
+        self.delivered += len(subscribers)
+
+    # last_event_id is the Last-Event-ID of a reconnecting browser: the deltas it missed are queued first,
+    # or a reset when they are no longer known
+    def subscribe(self, wake, last_event_id=None):
+        self.start()
+        subscriber = Subscriber(wake)
+        with self.lock:
+            if last_event_id:
+                ids = [event_id for event_id, _ in self.history]
+                if last_event_id in ids:
+                    subscriber.pending.extend(itertools.islice(self.history, ids.index(last_event_id) + 1, None))
+                else:
+                    subscriber.pending.append((None, RESET))
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def stats(self):
+        return {
+            "transport": type(self.transport).__name__,
+            "viewers": len(self.subscribers) if self.pid == os.getpid() else 0,
+            "published": self.published,
+            "delivered": self.delivered,
+            "lookups": self.lookups,
+            "threaded_streams": self.threaded_streams,
+        }
+
+live_feed = LiveFeed(create_transport())
+
+@content_changed.connect
+def publish_change(sender, content_id=None, action=None, **kwargs):
+    if content_id is None:
+        live_feed.publish(RESET)
+    else:
+        live_feed.publish({"action": action, "id": str(content_id)})
+
+def format_event(event_id, delta):
+    lines = f"id: {event_id}\n" if event_id else ""
+    return f"{lines}data: {json.dumps(delta, separators=(',', ':'))}\n\n"
+
+# "retry" is how long the browser waits before reconnecting, in milliseconds
+STREAM_START = "retry: 5000\n\n"
+HEARTBEAT = ": keep-alive\n\n"
+
+# Body of a WSGI stream, the thread sleeps on an Event between deltas. None when the worker already
+# has LIVE_FEED_MAX_STREAMS of its threads streaming
+def stream_events(last_event_id=None):
+    with live_feed.lock:
+        if live_feed.threaded_streams >= LIVE_FEED_MAX_STREAMS:
+            return None
+        live_feed.threaded_streams += 1
+    return ThreadedStream(last_event_id)
+
+# Holds one of the worker's stream slots until the server closes the body. close() is called for every
+# response, also when the body is never iterated (HEAD, client gone before the first chunk), while the
+# generator's finally only runs once it has started
+class ThreadedStream:
+    def __init__(self, last_event_id):
+        self.events = threaded_stream(last_event_id)
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.events.close()
+        with live_feed.lock:
+            if not self.closed:
+                self.closed = True
+                live_feed.threaded_streams -= 1
+
+def threaded_stream(last_event_id):
+    ready = threading.Event()
+    subscriber = live_feed.subscribe(ready.set, last_event_id)
+    try:
+        yield STREAM_START
+        while True:
+            if not ready.wait(LIVE_FEED_HEARTBEAT):
+                yield HEARTBEAT
+                continue
+            ready.clear()
+            for event_id, delta in subscriber.drain():
+                yield format_event(event_id, delta)
+    finally:
+        live_feed.unsubscribe(subscriber)
+
+# Same for the ASGI app, the dispatcher thread wakes the viewer's event loop
+async def stream_events_async(last_event_id=None):
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    subscriber = live_feed.subscribe(lambda: loop.call_soon_threadsafe(ready.set), last_event_id)
+    try:
+        yield STREAM_START
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), LIVE_FEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            ready.clear()
+            for event_id, delta in subscriber.drain():
+                yield format_event(event_id, delta)
+    finally:
+        live_feed.unsubscribe(subscriber)
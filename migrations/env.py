@@ -0,0 +1,62 @@
+import os
+import re
+import sys
+from logging.config import fileConfig
+from alembic import context
+
+# Make the project modules importable when alembic is run from another directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base, engine
+import models  # noqa: F401 register the models on Base.metadata
+
+config = context.config
+
+# Set up loggers from alembic.ini
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Postgres-only search objects created by raw SQL in 0003, not mapped on the models
+UNMAPPED_OBJECTS = {"search_vector", "ix_content_search", "ix_users_name_search"}
+
+# Postgres partitions of audit_events (0006, created by audit.py) and content (0007, archive.py):
+# audit_events_2024_12, content_default, ...
+PARTITION_NAME = re.compile(r"^(audit_events|content)_(\d{4}_\d{2}|default)$")
+
+# Keep autogenerate from dropping them
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and reflected and PARTITION_NAME.match(name):
+        return False
+    return name not in UNMAPPED_OBJECTS
+
+def run_migrations_offline():
+    # Emit SQL to stdout instead of running it (flask db upgrade --sql)
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            compare_type=True,
+            # SQLite can't ALTER most things in place, batch mode recreates the table instead
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,58 @@
+"""initial schema
+
+Tables as they were created by the old database.init_db (create_all).
+Existing databases should be stamped with `flask db stamp 0001` before upgrading.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-12-01 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "roles",
+        sa.Column("id", sa.UUID(as_uuid=True), primary_key=True),
+        sa.Column("name", sa.String(), unique=True),
+        sa.Column("permissions", sa.JSON()),
+        sa.UniqueConstraint("id"),
+    )
+    op.create_table(
+        "users",
+        sa.Column("id", sa.UUID(as_uuid=True), primary_key=True),
+        sa.Column("first_name", sa.String()),
+        sa.Column("last_name", sa.String()),
+        sa.Column("bio", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("password_hash", sa.String()),
+        sa.Column("role_id", sa.UUID(as_uuid=True), sa.ForeignKey("roles.id")),
+        sa.UniqueConstraint("id"),
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_table(
+        "content",
+        sa.Column("id", sa.UUID(as_uuid=True), primary_key=True),
+        sa.Column("quote", sa.String()),
+        sa.Column("status", sa.String()),
+        sa.Column("created_by", sa.UUID(as_uuid=True), sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.UniqueConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("content")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_table("users")
+    op.drop_table("roles")
@@ -0,0 +1,47 @@
+"""content hot query indexes
+
+- ix_content_feed: partial index on (created_at DESC, id DESC) for non-Inactive rows,
+  matches the filter and ORDER BY of feed.feed_query so the feed and its keyset pages are an index scan.
+- ix_content_created_by_status: quotes of one author, optionally by status.
+
+On Postgres the indexes are built CONCURRENTLY so a large content table is not locked for writes.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-12-01 00:00:01
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_content_feed",
+            "content",
+            [sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_where=sa.text("status != 'Inactive'"),
+            sqlite_where=sa.text("status != 'Inactive'"),
+            postgresql_concurrently=concurrently,
+        )
+        op.create_index(
+            "ix_content_created_by_status",
+            "content",
+            ["created_by", "status"],
+            postgresql_concurrently=concurrently,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_content_created_by_status", table_name="content")
+    op.drop_index("ix_content_feed", table_name="content")
@@ -0,0 +1,51 @@
+"""quote search
+
+Postgres only, see search.py:
+- content.search_vector: generated tsvector of the quote, with a GIN index over Active quotes.
+- ix_users_name_search: GIN expression index on the author name, for matching quotes by author.
+
+SQLite databases use the in-memory index of search.py instead, this revision does nothing there.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-12-01 00:00:02
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("""
+        ALTER TABLE content ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(quote, ''))) STORED
+    """)
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY ix_content_search ON content USING gin (search_vector)
+            WHERE status = 'Active'
+        """)
+        op.execute("""
+            CREATE INDEX CONCURRENTLY ix_users_name_search ON users
+            USING gin (to_tsvector('simple'::regconfig, coalesce(first_name, '') || ' ' || coalesce(last_name, '')))
+        """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.drop_index("ix_users_name_search", table_name="users")
+    op.drop_index("ix_content_search", table_name="content")
+    op.drop_column("content", "search_vector")
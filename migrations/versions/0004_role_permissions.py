@@ -0,0 +1,64 @@
+"""role permissions table
+
+Moves roles.permissions (a JSON list) to role_permissions, one row per (role, permission) with
+the pair as primary key. permissions.py loads it once into an in-memory bitmask per role.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-12-01 00:00:03
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def load_permissions(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or []
+
+
+def upgrade():
+    op.create_table(
+        "role_permissions",
+        sa.Column("role_id", sa.UUID(as_uuid=True), sa.ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("permission", sa.String(64), primary_key=True),
+    )
+
+    bind = op.get_bind()
+    roles = sa.table("roles", sa.column("id", sa.UUID(as_uuid=True)), sa.column("permissions", sa.JSON()))
+    role_permissions = sa.table("role_permissions", sa.column("role_id", sa.UUID(as_uuid=True)), sa.column("permission", sa.String()))
+    rows = [
+        {"role_id": role_id, "permission": permission}
+        for role_id, permissions in bind.execute(sa.select(roles.c.id, roles.c.permissions))
+        for permission in dict.fromkeys(load_permissions(permissions))
+    ]
+    if rows:
+        op.bulk_insert(role_permissions, rows)
+
+    with op.batch_alter_table("roles") as batch_op:
+        batch_op.drop_column("permissions")
+
+
+def downgrade():
+    with op.batch_alter_table("roles") as batch_op:
+        batch_op.add_column(sa.Column("permissions", sa.JSON(), nullable=True))
+
+    bind = op.get_bind()
+    roles = sa.table("roles", sa.column("id", sa.UUID(as_uuid=True)), sa.column("permissions", sa.JSON()))
+    role_permissions = sa.table("role_permissions", sa.column("role_id", sa.UUID(as_uuid=True)), sa.column("permission", sa.String()))
+    permissions = {}
+    for role_id, permission in bind.execute(sa.select(role_permissions.c.role_id, role_permissions.c.permission)):
+        permissions.setdefault(role_id, []).append(permission)
+    for role_id, names in permissions.items():
+        bind.execute(roles.update().where(roles.c.id == role_id).values(permissions=names))
+
+    op.drop_table("role_permissions")
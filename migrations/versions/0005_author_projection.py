@@ -0,0 +1,105 @@
+"""author projection
+
+Denormalized author data so the feed reads the content table alone, see authors.py:
+- users.display_name: "first last".
+- content.author_name: copy of the author's display_name.
+- users.quote_count, users.active_quote_count: quotes that aren't deleted, Active quotes.
+
+On Postgres ix_content_feed is rebuilt with INCLUDE of the columns the feed reads, so a feed page is
+an index-only scan. The new index is built CONCURRENTLY next to the old one and then renamed.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-12-01 00:00:04
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+FEED_INCLUDE = ["quote", "status", "created_by", "author_name"]
+
+
+def upgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(sa.Column("display_name", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("quote_count", sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column("active_quote_count", sa.Integer(), nullable=False, server_default="0"))
+    with op.batch_alter_table("content") as batch_op:
+        batch_op.add_column(sa.Column("author_name", sa.String(), nullable=True))
+
+    users = sa.table(
+        "users",
+        sa.column("id", sa.UUID(as_uuid=True)),
+        sa.column("first_name", sa.String()),
+        sa.column("last_name", sa.String()),
+        sa.column("display_name", sa.String()),
+        sa.column("quote_count", sa.Integer()),
+        sa.column("active_quote_count", sa.Integer()),
+    )
+    content = sa.table(
+        "content",
+        sa.column("created_by", sa.UUID(as_uuid=True)),
+        sa.column("status", sa.String()),
+        sa.column("author_name", sa.String()),
+    )
+
+    op.execute(users.update().values(
+        display_name=sa.func.trim(sa.func.coalesce(users.c.first_name, "") + " " + sa.func.coalesce(users.c.last_name, ""))
+    ))
+    op.execute(users.update().values(
+        quote_count=sa.select(sa.func.count())
+        .where(content.c.created_by == users.c.id, content.c.status != "Inactive")
+        .scalar_subquery(),
+        active_quote_count=sa.select(sa.func.count())
+        .where(content.c.created_by == users.c.id, content.c.status == "Active")
+        .scalar_subquery(),
+    ))
+
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute("UPDATE content SET author_name = users.display_name FROM users WHERE users.id = content.created_by")
+    else:
+        op.execute(content.update().values(
+            author_name=sa.select(users.c.display_name).where(users.c.id == content.c.created_by).scalar_subquery()
+        ))
+
+    if bind.dialect.name == "postgresql":
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            create_feed_index("ix_content_feed_new", FEED_INCLUDE)
+            op.drop_index("ix_content_feed", table_name="content", postgresql_concurrently=True)
+            op.execute("ALTER INDEX ix_content_feed_new RENAME TO ix_content_feed")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            create_feed_index("ix_content_feed_old", [])
+            op.drop_index("ix_content_feed", table_name="content", postgresql_concurrently=True)
+            op.execute("ALTER INDEX ix_content_feed_old RENAME TO ix_content_feed")
+
+    with op.batch_alter_table("content") as batch_op:
+        batch_op.drop_column("author_name")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("active_quote_count")
+        batch_op.drop_column("quote_count")
+        batch_op.drop_column("display_name")
+
+
+def create_feed_index(name, include):
+    op.create_index(
+        name,
+        "content",
+        [sa.text("created_at DESC"), sa.text("id DESC")],
+        postgresql_where=sa.text("status != 'Inactive'"),
+        postgresql_include=include,
+        postgresql_concurrently=True,
+    )
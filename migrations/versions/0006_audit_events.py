@@ -0,0 +1,60 @@
+"""audit events
+
+Append-only log of quote and role changes written by audit.py when AUDIT_BACKEND=database.
+
+On Postgres the table is partitioned by RANGE (at), one partition per month created by the writer
+before the first event of the month, and audit_events_default catches anything outside them. Old
+months can then be detached or dropped without touching the rest of the log.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-12-01 00:00:05
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("""
+            CREATE TABLE audit_events (
+                at timestamp without time zone NOT NULL,
+                id uuid NOT NULL,
+                actor_id uuid,
+                entity varchar(32) NOT NULL,
+                entity_id uuid NOT NULL,
+                action varchar(32) NOT NULL,
+                before jsonb,
+                after jsonb,
+                PRIMARY KEY (at, id)
+            ) PARTITION BY RANGE (at)
+        """)
+        op.execute("CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT")
+    else:
+        op.create_table(
+            "audit_events",
+            sa.Column("at", sa.DateTime(), primary_key=True),
+            sa.Column("id", sa.UUID(as_uuid=True), primary_key=True),
+            sa.Column("actor_id", sa.UUID(as_uuid=True), nullable=True),
+            sa.Column("entity", sa.String(32), nullable=False),
+            sa.Column("entity_id", sa.UUID(as_uuid=True), nullable=False),
+            sa.Column("action", sa.String(32), nullable=False),
+            sa.Column("before", sa.JSON(), nullable=True),
+            sa.Column("after", sa.JSON(), nullable=True),
+        )
+    # On a partitioned table this creates the index on every partition, present and future
+    op.create_index("ix_audit_events_entity", "audit_events", ["entity", "entity_id", "at"])
+
+
+def downgrade():
+    op.drop_index("ix_audit_events_entity", table_name="audit_events")
+    # Drops the partitions with it on Postgres
+    op.drop_table("audit_events")
@@ -0,0 +1,141 @@
+"""content partitions and archive
+
+- content_archive: cold storage for archived quotes, see archive.py. Every database.
+- ix_content_archivable: partial index on content (status, updated_at) WHERE status != 'Active', for
+  the batches of archive.py. ix_content_feed leaves the deleted quotes out. Every database.
+- Postgres only: content is rebuilt as a table partitioned BY RANGE (created_at), one partition per
+  month from the oldest quote to CONTENT_PARTITIONS_AHEAD months from now, and content_default for
+  anything outside them. archive.py creates the partitions of the following months. The key becomes
+  (id, created_at), a partitioned table can only have unique keys that contain the partition column.
+
+The rebuild copies every quote into the new table while content is locked, run it in a quiet moment.
+Quotes without created_at get their updated_at, or the time of the migration.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-12-01 00:00:06
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+CONTENT_PARTITIONS_AHEAD = 3  # months, same default as archive.py
+COLUMNS = "id, quote, status, created_by, created_at, updated_at, author_name"
+FEED_INCLUDE = "quote, status, created_by, author_name"
+ARCHIVABLE = "status != 'Active'"  # archive.py moves Inactive and old Ban quotes
+
+
+def upgrade():
+    op.create_table(
+        "content_archive",
+        sa.Column("id", sa.UUID(as_uuid=True), primary_key=True),
+        sa.Column("quote", sa.String()),
+        sa.Column("status", sa.String()),
+        sa.Column("created_by", sa.UUID(as_uuid=True)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.Column("author_name", sa.String()),
+        sa.Column("archived_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_content_archive_created_by", "content_archive", ["created_by"])
+
+    if op.get_bind().dialect.name != "postgresql":
+        op.create_index("ix_content_archivable", "content", ["status", "updated_at"], sqlite_where=sa.text(ARCHIVABLE))
+        return
+
+    op.execute("UPDATE content SET created_at = coalesce(updated_at, now() AT TIME ZONE 'utc') WHERE created_at IS NULL")
+    op.execute("LOCK TABLE content IN EXCLUSIVE MODE")  # reads go on, writes wait for the copy
+    op.execute(f"""
+        CREATE TABLE content_partitioned (
+            id uuid NOT NULL,
+            quote varchar,
+            status varchar,
+            created_by uuid REFERENCES users (id),
+            created_at timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone,
+            author_name varchar,
+            search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(quote, ''))) STORED
+        ) PARTITION BY RANGE (created_at)
+    """)
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM content")).scalar()
+    for year, month in months(oldest or datetime.now(timezone.utc), CONTENT_PARTITIONS_AHEAD):
+        op.execute(partition_ddl("content_partitioned", f"content_{year:04d}_{month:02d}", year, month))
+    op.execute("CREATE TABLE content_default PARTITION OF content_partitioned DEFAULT")
+    op.execute(f"INSERT INTO content_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM content")
+
+    op.execute("DROP TABLE content")
+    op.execute("ALTER TABLE content_partitioned RENAME TO content")
+    # Created on the parent, they are created on every partition, present and future
+    op.execute("ALTER TABLE content ADD PRIMARY KEY (id, created_at)")
+    create_indexes()
+    op.execute(f"CREATE INDEX ix_content_archivable ON content (status, updated_at) WHERE {ARCHIVABLE}")
+
+
+def downgrade():
+    bind = op.get_bind()
+    # Archived quotes go back to content before their table is dropped
+    op.execute(f"INSERT INTO content ({COLUMNS}) SELECT {COLUMNS} FROM content_archive")
+    op.drop_index("ix_content_archive_created_by", table_name="content_archive")
+    op.drop_table("content_archive")
+
+    if bind.dialect.name != "postgresql":
+        op.drop_index("ix_content_archivable", table_name="content")
+        return
+
+    op.execute("LOCK TABLE content IN EXCLUSIVE MODE")
+    op.execute("""
+        CREATE TABLE content_unpartitioned (
+            id uuid PRIMARY KEY,
+            quote varchar,
+            status varchar,
+            created_by uuid REFERENCES users (id),
+            created_at timestamp without time zone,
+            updated_at timestamp without time zone,
+            author_name varchar,
+            search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(quote, ''))) STORED,
+            UNIQUE (id)
+        )
+    """)
+    op.execute(f"INSERT INTO content_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM content")
+    # Drops the partitions with it
+    op.execute("DROP TABLE content")
+    op.execute("ALTER TABLE content_unpartitioned RENAME TO content")
+    # ix_content_archivable went with the partitioned table
+    create_indexes()
+
+
+# The indexes of 0002, 0003 and 0005
+def create_indexes():
+    op.execute(f"""
+        CREATE INDEX ix_content_feed ON content (created_at DESC, id DESC)
+        INCLUDE ({FEED_INCLUDE}) WHERE status != 'Inactive'
+    """)
+    op.execute("CREATE INDEX ix_content_created_by_status ON content (created_by, status)")
+    op.execute("CREATE INDEX ix_content_search ON content USING gin (search_vector) WHERE status = 'Active'")
+
+
+# (year, month) from the month of `start` to `ahead` months after the current one
+def months(start, ahead):
+    now = datetime.now(timezone.utc)
+    year, month = start.year, start.month
+    last = now.year * 12 + now.month - 1 + ahead
+    while year * 12 + month - 1 <= last:
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_ddl(table, name, year, month):
+    end_year, end_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return (
+        f"CREATE TABLE {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{end_year:04d}-{end_month:02d}-01')"
+    )
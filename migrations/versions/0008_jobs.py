@@ -0,0 +1,45 @@
+"""jobs
+
+Durable queue of background jobs, see jobs.py. Workers take the next job with
+SELECT ... FOR UPDATE SKIP LOCKED on Postgres.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-12-01 00:00:07
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.UUID(as_uuid=True), primary_key=True),
+        sa.Column("name", sa.String(64), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("idempotency_key", sa.String(200), nullable=True, unique=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("run_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+    )
+    op.create_index("ix_jobs_ready", "jobs", ["status", "priority", "run_at"])
+
+
+def downgrade():
+    op.drop_index("ix_jobs_ready", table_name="jobs")
+    op.drop_table("jobs")
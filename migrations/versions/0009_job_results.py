@@ -0,0 +1,29 @@
+"""job results
+
+jobs.result: what the job's handler returned, read by /api/moderation/jobs/<id> for the
+batch moderation jobs that now run on the job queue.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-12-01 00:00:08
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("jobs") as batch_op:
+        batch_op.add_column(sa.Column("result", sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("jobs") as batch_op:
+        batch_op.drop_column("result")
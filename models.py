@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, DateTime, String, ForeignKey, UUID, JSON
+from sqlalchemy import JSON, Column, DateTime, Integer, String, Text, ForeignKey, UUID, Index, text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime, timezone
@@ -20,6 +20,11 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     password_hash = Column(String)
     role_id = Column(UUID(as_uuid=True), ForeignKey('roles.id'))
+    # Denormalized, kept up to date by authors.py: "first last" (also copied to content.author_name),
+    # quotes that aren't deleted and Active quotes
+    display_name = Column(String)
+    quote_count = Column(Integer, nullable=False, default=0, server_default="0")
+    active_quote_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     role = relationship("Role", back_populates="users")
     content = relationship("Content", back_populates="creator")
@@ -29,20 +34,125 @@ class Role(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True)
     name = Column(String, unique=True)
-    permissions = Column(JSON)
 
     users = relationship("User", back_populates="role")
+    permission_rows = relationship("RolePermission", back_populates="role", cascade="all, delete-orphan")
 
+# One row per permission of a role, see permissions.py for the in-memory map built from it
+class RolePermission(Base):
+    __tablename__ = "role_permissions"
+
+    role_id = Column(UUID(as_uuid=True), ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True)
+    permission = Column(String(64), primary_key=True)
+
+    role = relationship("Role", back_populates="permission_rows")
+
+# On Postgres the table is partitioned by month on created_at (migrations/versions/0007), so the key of the
+# table is (id, created_at) and id alone can't be declared unique. The ORM still identifies a quote by its id
 class Content(Base):
     __tablename__ = "content"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     quote = Column(String)
     status = Column(String, default=ACTIVE)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, primary_key=True, default=datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(timezone.utc))
+    # Copy of the author's users.display_name so the feed doesn't join users, see authors.py
+    author_name = Column(String)
 
     creator = relationship("User", back_populates="content")
 
-    # model for set database schema
\ No newline at end of file
+    __mapper_args__ = {"primary_key": [id]}
+
+    # Indexes shaped to the hot queries, created by migrations/versions/0002, 0005 and 0007
+    __table_args__ = (
+        # Feed: WHERE status != 'Inactive' ORDER BY created_at DESC, id DESC. On Postgres it also holds
+        # every column the feed reads, so a page is an index-only scan
+        Index(
+            "ix_content_feed",
+            created_at.desc(),
+            id.desc(),
+            postgresql_where=text("status != 'Inactive'"),
+            sqlite_where=text("status != 'Inactive'"),
+            postgresql_include=["quote", "status", "created_by", "author_name"],
+        ),
+        # Quotes of one author
+        Index("ix_content_created_by_status", created_by, status),
+        # Archiving (archive.py): status = 'Inactive', or 'Ban' and updated_at before the cutoff. Only the
+        # few rows the feed index leaves out or that it can't tell apart from the Active ones
+        Index(
+            "ix_content_archivable",
+            status,
+            updated_at,
+            postgresql_where=text("status != 'Active'"),
+            sqlite_where=text("status != 'Active'"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # model for set database schema
+
+# Cold storage for deleted quotes and, optionally, quotes banned long ago, moved out of content by
+# archive.py. A banned quote is moved back when its author edits it
+class ContentArchive(Base):
+    __tablename__ = "content_archive"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    quote = Column(String)
+    status = Column(String)
+    created_by = Column(UUID(as_uuid=True))
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    author_name = Column(String)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_content_archive_created_by", created_by),
+    )
+
+# Append-only log of quote and role changes, written by audit.py. On Postgres the table is partitioned by
+# month on `at` (migrations/versions/0006), which is why `at` is part of the primary key
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+
+    at = Column(DateTime, primary_key=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    actor_id = Column(UUID(as_uuid=True))
+    entity = Column(String(32), nullable=False)  # "content" or "user_role"
+    entity_id = Column(UUID(as_uuid=True), nullable=False)
+    action = Column(String(32), nullable=False)
+    before = Column(JSON)
+    after = Column(JSON)
+
+    __table_args__ = (
+        # History of one quote or user
+        Index("ix_audit_events_entity", entity, entity_id, at),
+    )
+
+# Durable queue of background jobs, see jobs.py
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(64), nullable=False)
+    payload = Column(JSON)
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    # A second enqueue with the same key is ignored, the job runs once
+    idempotency_key = Column(String(200), unique=True)
+    created_at = Column(DateTime, nullable=False)
+    run_at = Column(DateTime, nullable=False)  # not before, later for retries
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # A running job whose worker died is taken again after this
+    locked_until = Column(DateTime)
+    last_error = Column(Text)
+    result = Column(JSON)  # what the handler returned (migration 0009)
+
+    __table_args__ = (
+        # Next job to run: status = 'queued' ORDER BY priority DESC, run_at
+        Index("ix_jobs_ready", status, priority, run_at),
+    )
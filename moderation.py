@@ -0,0 +1,223 @@
+# moderation.py
+# Ban or restore many quotes at once, by ids or by filters, with one set-based UPDATE per batch
+import os
+import uuid
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from audit import audit_log
+from authors import recount_authors
+from events import content_changed
+from jobs import after_commit, enqueue, job
+from models import ACTIVE, BANNED, INACTIVE, Content, User
+from principals import principal_cache
+
+# Load environment variables from .env file
+load_dotenv()
+
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", 1000))  # rows per UPDATE
+MODERATION_MAX_ITEMS = int(os.getenv("MODERATION_MAX_ITEMS", 10000))  # rows per request, the rest is left for the next one
+
+# action -> (status a quote must have, new status, outcome). Same rules as the single quote routes:
+# only Active quotes can be banned, only banned quotes restored, deleted (Inactive) quotes stay deleted
+ACTIONS = {
+    "ban": (ACTIVE, BANNED, "banned"),
+    "restore": (BANNED, ACTIVE, "restored"),
+}
+
+# Why a quote wasn't changed, by its current status
+SKIPPED = {
+    "ban": {BANNED: "already_banned", INACTIVE: "inactive"},
+    "restore": {ACTIVE: "not_banned", INACTIVE: "inactive"},
+}
+
+class ModerationError(ValueError):
+    pass
+
+def parse_ids(ids):
+    parsed, invalid = [], []
+    for value in ids:
+        try:
+            parsed.append(uuid.UUID(str(value)))
+        except ValueError:
+            invalid.append(str(value))
+    return parsed, invalid
+
+def parse_time(value, name):
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ModerationError(f"{name} must be an ISO 8601 date.")
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise ModerationError(f"{name} must be an ISO 8601 date.") from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def text_filter(filters, name):
+    value = filters.get(name) or ""
+    if not isinstance(value, str):
+        raise ModerationError(f"{name} must be a string.")
+    return value.strip()
+
+# WHERE clauses for {"author": email, "created_from": iso, "created_to": iso, "text": "..."}
+def filter_conditions(filters):
+    conditions = []
+    author = text_filter(filters, "author").lower()
+    if author:
+        conditions.append(Content.created_by.in_(select(User.id).where(User.email == author)))
+    created_from = parse_time(filters.get("created_from"), "created_from")
+    if created_from:
+        conditions.append(Content.created_at >= created_from)
+    created_to = parse_time(filters.get("created_to"), "created_to")
+    if created_to:
+        conditions.append(Content.created_at < created_to)
+    text = text_filter(filters, "text")
+    if text:
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append(Content.quote.ilike(f"%{escaped}%", escape="\\"))
+    if not conditions:
+        raise ModerationError("At least one filter is required.")
+    return conditions
+
+def update_batch(db, action, ids):
+    from_status, to_status, _ = ACTIONS[action]
+    statement = (
+        update(Content)
+        .where(Content.id.in_(ids), Content.status == from_status)
+        .values(status=to_status, updated_at=datetime.now(timezone.utc))
+        .returning(Content.id, Content.created_by)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(statement).all()
+
+class ModerationResult:
+    def __init__(self, action):
+        self.action = action
+        self.items = []
+        self.updated = 0
+        self.authors = set()
+        self.more = False
+
+    def add(self, content_id, outcome):
+        self.items.append({"id": str(content_id), "outcome": outcome})
+        if outcome == ACTIONS[self.action][2]:
+            self.updated += 1
+
+    def to_dict(self):
+        return {
+            "action": self.action,
+            "updated": self.updated,
+            "skipped": len(self.items) - self.updated,
+            "more": self.more,
+            "items": self.items,
+        }
+
+def moderate_ids(db, action, ids, result):
+    ids, invalid = parse_ids(ids)
+    for value in invalid:
+        result.add(value, "invalid_id")
+    ids = list(dict.fromkeys(ids))[:MODERATION_MAX_ITEMS]
+    outcome = ACTIONS[action][2]
+
+    for start in range(0, len(ids), MODERATION_BATCH_SIZE):
+        batch = ids[start:start + MODERATION_BATCH_SIZE]
+        changed = {row.id: row.created_by for row in update_batch(db, action, batch)}
+        result.authors.update(changed.values())
+
+        # Read the status of the rest only to explain why they were skipped
+        rest = [content_id for content_id in batch if content_id not in changed]
+        statuses = dict(db.execute(select(Content.id, Content.status).where(Content.id.in_(rest))).all()) if rest else {}
+        for content_id in batch:
+            if content_id in changed:
+                result.add(content_id, outcome)
+            elif content_id not in statuses:
+                result.add(content_id, "not_found")
+            else:
+                result.add(content_id, SKIPPED[action].get(statuses[content_id], "skipped"))
+
+def moderate_filters(db, action, filters, result):
+    from_status, _, outcome = ACTIONS[action]
+    conditions = filter_conditions(filters)
+    last_id = None
+    while True:
+        # Keyset over the id so every batch is one indexed range, the matched rows leave the filter once updated
+        query = select(Content.id).where(Content.status == from_status, *conditions).order_by(Content.id)
+        if last_id is not None:
+            query = query.where(Content.id > last_id)
+        remaining = MODERATION_MAX_ITEMS - len(result.items)
+        limit = min(MODERATION_BATCH_SIZE, remaining)
+        ids = db.execute(query.limit(limit + 1)).scalars().all()
+        if not ids:
+            return
+        if len(ids) > limit:
+            ids = ids[:limit]
+            result.more = limit == remaining
+        if ids:
+            last_id = ids[-1]
+            for row in update_batch(db, action, ids):
+                result.authors.add(row.created_by)
+                result.add(row.id, outcome)
+        if result.more or len(ids) < limit:
+            return
+
+def validate(action, ids, filters):
+    if action not in ACTIONS:
+        raise ModerationError("action must be ban or restore.")
+    if not ids and not filters:
+        raise ModerationError("ids or filters are required.")
+    if not ids:
+        filter_conditions(filters)
+
+# The updates and the authors' counts in the caller's transaction, without committing
+def apply_moderation(db, action, ids=None, filters=None):
+    validate(action, ids, filters)
+    result = ModerationResult(action)
+    if ids:
+        moderate_ids(db, action, ids, result)
+    else:
+        moderate_filters(db, action, filters, result)
+    # The authors' Active quote counts, in the same transaction
+    recount_authors(db, result.authors)
+    return result
+
+# Once the changes are committed the caches are told once
+def announce(result, actor_id=None):
+    if not result.updated:
+        return
+    content_changed.send(None, content_id=None, action=result.action)
+    # Same as the ban route, the authors' cached principals are reloaded
+    for author_id in result.authors:
+        principal_cache.invalidate(author_id)
+    # One audit event per changed quote, only the status is known here
+    from_status, to_status, outcome = ACTIONS[result.action]
+    for item in result.items:
+        if item["outcome"] == outcome:
+            audit_log.record("content", item["id"], outcome, {"status": from_status}, {"status": to_status}, actor_id=actor_id)
+
+# Runs the whole request in one transaction
+def moderate(db, action, ids=None, filters=None, actor_id=None):
+    try:
+        result = apply_moderation(db, action, ids, filters)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    announce(result, actor_id)
+    return result
+
+# Large jobs run on the job queue (jobs.py): any web worker or `flask jobs work` takes them, and their
+# status and result are read from the jobs table by whichever worker gets the poll
+@job("moderation.run", max_attempts=3)
+def moderation_job(db, action, ids=None, filters=None, actor_id=None):
+    result = apply_moderation(db, action, ids, filters)
+    after_commit(db, lambda: announce(result, actor_id))
+    return result.to_dict()
+
+# Checks the request now rather than in the job, queues it in the caller's transaction and returns its id
+def submit(db, action, ids=None, filters=None, actor_id=None):
+    validate(action, ids, filters)
+    payload = {"action": action, "ids": [str(value) for value in ids] if ids else None, "filters": filters, "actor_id": str(actor_id) if actor_id else None}
+    return enqueue(db, "moderation.run", payload)
@@ -0,0 +1,194 @@
+# page_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import wraps
+from dotenv import load_dotenv
+from flask import Response, g, make_response, request, session
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+from events import content_changed
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Where the feed version lives. It must be shared by every worker for invalidation to be exact:
+# "sqlite" shares it between the workers of one host, "redis" between hosts, "memory" is one process only
+PAGE_CACHE_VERSION_BACKEND = os.getenv("PAGE_CACHE_VERSION_BACKEND", "sqlite")
+PAGE_CACHE_SQLITE_PATH = os.getenv("PAGE_CACHE_SQLITE_PATH", "page_cache.sqlite3")
+PAGE_CACHE_REDIS_URL = os.getenv("PAGE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", 256))  # rendered pages kept per worker
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 10000))  # quote cards kept per worker
+
+class MemoryVersionStore:
+    def __init__(self):
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        return self.version
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+            return self.version
+
+class SQLiteVersionStore:
+    def __init__(self, path=PAGE_CACHE_SQLITE_PATH):
+        self.path = path
+        self.local = threading.local()
+        conn = self.connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS feed_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO feed_version (id, version) VALUES (1, 0)")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self):
+        return self.connection().execute("SELECT version FROM feed_version WHERE id = 1").fetchone()[0]
+
+    def bump(self):
+        return self.connection().execute(
+            "UPDATE feed_version SET version = version + 1 WHERE id = 1 RETURNING version"
+        ).fetchone()[0]
+
+class RedisVersionStore:
+    def __init__(self, client=None, url=PAGE_CACHE_REDIS_URL, key="feed:version"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("PAGE_CACHE_VERSION_BACKEND=redis needs the redis package (pip install redis).") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.key = key
+
+    def get(self):
+        return int(self.client.get(self.key) or 0)
+
+    def bump(self):
+        return int(self.client.incr(self.key))
+
+def create_version_store(backend=PAGE_CACHE_VERSION_BACKEND):
+    if backend == "memory":
+        return MemoryVersionStore()
+    if backend == "sqlite":
+        return SQLiteVersionStore()
+    if backend == "redis":
+        return RedisVersionStore()
+    raise ValueError(f"Unknown PAGE_CACHE_VERSION_BACKEND: {backend}")
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+feed_version = create_version_store()
+page_cache = LRUCache(PAGE_CACHE_SIZE)
+fragment_cache = LRUCache(FRAGMENT_CACHE_SIZE)
+
+# Every committed quote change makes all cached pages and ETags of the feed stale
+@content_changed.connect
+def bump_feed_version(sender, **kwargs):
+    feed_version.bump()
+
+def make_etag(version, path):
+    return f"feed-{version}-{hashlib.sha1(path.encode()).hexdigest()[:16]}"
+
+# Cache a GET view per (feed version, url). With anonymous_only the cache is skipped for logged in users,
+# whose pages show their own action buttons
+def cached_feed(anonymous_only=True):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.args.get("stream") or (anonymous_only and session.get("user_id")):
+                return view(*args, **kwargs)
+
+            version = feed_version.get()
+            etag = make_etag(version, request.full_path)
+
+            # The ETag only depends on the version, so a repeat visitor is answered without touching the DB
+            if etag in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            key = (version, request.full_path)
+            cached = page_cache.get(key)
+            if cached is None:
+                # The version may have been bumped by a write a replica (utils.replica_reads) hasn't got yet, and
+                # what is kept or named by its ETag stays until the next write: it is rendered from the primary.
+                # Without a page cache a replica still serves it, without an ETag
+                db = g.get("db")
+                from_replica = db is not None and db.info.get("replica_reads", False)
+                if from_replica and page_cache.maxsize > 0:
+                    db.info["replica_reads"] = from_replica = False
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or from_replica:
+                    return response
+                cached = (response.get_data(), response.mimetype)
+                page_cache.put(key, cached)
+
+            response = Response(cached[0], mimetype=cached[1])
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"  # browsers revalidate with If-None-Match
+            return response
+        return wrapper
+    return decorator
+
+# Plain Jinja environment for fragments so the WSGI and the ASGI app (asgi.py) can share them
+_fragment_env = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")),
+    autoescape=select_autoescape(),
+)
+
+# Markup of a quote card without the action buttons, the part that is the same for every viewer
+def render_quote_card(content):
+    key = (content.id, content.status, content.quote, content.posts_by)
+    markup = fragment_cache.get(key)
+    if markup is None:
+        markup = Markup(_fragment_env.get_template("_quote_card.html").render(content=content))
+        fragment_cache.put(key, markup)
+    return markup
+
+def cache_stats():
+    return {
+        "feed_version": feed_version.get(),
+        "pages": page_cache.stats(),
+        "fragments": fragment_cache.stats(),
+    }
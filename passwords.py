@@ -0,0 +1,82 @@
+# passwords.py
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from dotenv import load_dotenv
+from instrumentation import timed
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Argon2 cost, defaults are the passlib defaults so existing hashes stay valid
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))  # iterations
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))  # lanes
+
+# Number of processes used for hashing, 0 hashes on the request thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 0))
+# Max hashes waiting for or running in the pool, further requests wait for a free slot
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", PASSWORD_HASH_WORKERS * 4))
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(max(PASSWORD_HASH_MAX_PENDING, 1))
+
+# One CryptContext per process, built on first use
+@lru_cache(maxsize=None)
+def get_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=ARGON2_TIME_COST,
+        argon2__memory_cost=ARGON2_MEMORY_COST,
+        argon2__parallelism=ARGON2_PARALLELISM,
+    )
+
+# Run in the worker processes, must be module level to be picklable
+def _hash(password: str):
+    return get_context().hash(password)
+
+def _verify(password: str, stored_hash: str):
+    return get_context().verify(password, stored_hash)
+
+def get_pool():
+    global _pool
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+            atexit.register(_pool.shutdown)
+    return _pool
+
+def _run(func, *args):
+    pool = get_pool()
+    if pool is None:
+        return func(*args)
+
+    # Bound the number of queued hashes so a login burst can't pile up unbounded work
+    with _pool_slots:
+        return pool.submit(func, *args).result()
+
+def hash_password(password: str):
+    with timed("hash"):
+        return _run(_hash, password)  # hashes and salts the password
+
+def verify_password(password: str, stored_hash: str):
+    if not stored_hash:
+        return False
+    with timed("hash"):
+        return _run(_verify, password, stored_hash)
+
+# Verify, and if the hash was made with other argon2 parameters return a new hash to store
+def verify_and_update(password: str, stored_hash: str):
+    if not verify_password(password, stored_hash):
+        return False, None
+    if get_context().needs_update(stored_hash):
+        return True, hash_password(password)
+    return True, None
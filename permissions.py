@@ -0,0 +1,77 @@
+# permissions.py
+# Role permissions as bitmasks, loaded from the role_permissions table into an immutable map
+import os
+import threading
+import time
+from types import MappingProxyType
+from dotenv import load_dotenv
+from sqlalchemy import select
+from database import SessionLocal
+from events import roles_changed
+from models import Role, RolePermission
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Every permission the routes check, each gets one bit
+PERMISSIONS = ("create_own_content", "update_own_content", "delete_own_content", "ban", "updateadmin")
+PERMISSION_BITS = MappingProxyType({name: 1 << i for i, name in enumerate(PERMISSIONS)})
+
+# A change made by this worker refreshes the map at once (roles_changed), other workers reload it after the TTL
+ROLE_MAP_TTL = float(os.getenv("ROLE_MAP_TTL", 300))  # seconds
+
+def to_mask(permissions):
+    mask = 0
+    for permission in permissions:
+        mask |= PERMISSION_BITS.get(permission, 0)
+    return mask
+
+def from_mask(mask):
+    return frozenset(name for name, bit in PERMISSION_BITS.items() if mask & bit)
+
+class RoleMap:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.masks = MappingProxyType({})  # role name -> bitmask, replaced as a whole on refresh
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        masks = {}
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(Role.name, RolePermission.permission).outerjoin(RolePermission, RolePermission.role_id == Role.id)
+            )
+            for name, permission in rows:
+                masks[name] = masks.get(name, 0) | PERMISSION_BITS.get(permission, 0)
+        return MappingProxyType(masks)
+
+    def get(self):
+        if self.stale():
+            with self.lock:
+                if self.stale():
+                    self.masks = self.load()
+                    self.expires_at = time.monotonic() + self.ttl
+        return self.masks
+
+    # get() would load the map from the database
+    def stale(self):
+        return time.monotonic() >= self.expires_at
+
+    def mask(self, role_name):
+        return self.get().get(role_name, 0)
+
+    def invalidate(self):
+        self.expires_at = 0.0
+
+role_map = RoleMap(ROLE_MAP_TTL)
+
+@roles_changed.connect
+def refresh_role_map(sender, **kwargs):
+    role_map.invalidate()
+
+def has_permission(role_name, permission):
+    return bool(role_map.mask(role_name) & PERMISSION_BITS[permission])
+
+def role_permissions(role_name):
+    return from_mask(role_map.mask(role_name))
@@ -0,0 +1,92 @@
+# principals.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from permissions import role_permissions
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Cached principals are per worker process, invalidation only reaches this process,
+# the TTL bounds how long another worker can keep a stale role
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 60))  # seconds
+
+# What authorization needs to know about a user, detached from any database session.
+# The permissions of the role come from the shared role map (permissions.py), not from the cache
+class RolePrincipal:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def permissions(self):
+        return role_permissions(self.name)
+
+class Principal:
+    __slots__ = ("id", "role")
+
+    def __init__(self, id, role: RolePrincipal):
+        self.id = id
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, RolePrincipal(user.role.name))
+
+# LRU cache with a time to live, keyed by user id
+class PrincipalCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, principal):
+        key = str(user_id)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, principal)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,282 @@
+# quote_io.py
+# Bulk import and export of quotes as JSONL or CSV, used by `flask quotes ...` and /api/quotes/import|export
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+import click
+from dotenv import load_dotenv
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from authors import recount_authors
+from database import SessionLocal
+from events import content_changed
+from models import ACTIVE, BANNED, INACTIVE, Content, User
+
+# Load environment variables from .env file
+load_dotenv()
+
+IMPORT_BATCH_SIZE = int(os.getenv("QUOTE_IMPORT_BATCH_SIZE", 5000))  # rows per bulk insert and commit
+EXPORT_BATCH_SIZE = 1000  # rows per round trip of the server-side cursor
+MAX_REPORTED_ERRORS = 100
+AUTHOR_CACHE_SIZE = 10000
+
+FORMATS = ("jsonl", "csv")
+FIELDS = ("id", "quote", "status", "author_email", "created_at", "updated_at")
+STATUSES = (ACTIVE, INACTIVE, BANNED)
+COPY_COLUMNS = ("id", "quote", "status", "created_by", "author_name", "created_at", "updated_at")
+
+def format_from_filename(filename, default="jsonl"):
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return extension if extension in FORMATS else default
+
+# Yields (line number, record dict) from a text stream, one line or CSV row at a time
+def read_records(stream, fmt):
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, record if isinstance(record, dict) else None
+
+def parse_datetime(value, default):
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value)
+    # Stored naive in UTC, like the rows created by the app
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+# A field of the record as a string, None when missing or empty. JSON lines can hold any type
+def text_field(record, name):
+    value = record.get(name)
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be a string.")
+    return value
+
+# Turns one record into a Content row, the author id is filled in per batch. Raises ValueError
+def parse_record(record, now):
+    if record is None:
+        raise ValueError("Not a JSON object.")
+    quote = (text_field(record, "quote") or "").strip()
+    if not quote:
+        raise ValueError("quote is required.")
+    email = (text_field(record, "author_email") or "").strip().lower()
+    if not email:
+        raise ValueError("author_email is required.")
+    status = text_field(record, "status") or ACTIVE
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status {status!r}.")
+    created_at = parse_datetime(text_field(record, "created_at"), now)
+    content_id = text_field(record, "id")
+    return email, {
+        "id": uuid.UUID(content_id) if content_id else uuid.uuid4(),
+        "quote": quote,
+        "status": status,
+        "created_at": created_at,
+        "updated_at": parse_datetime(text_field(record, "updated_at"), created_at),
+    }
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(self.imported / seconds, 1) if seconds else 0.0,
+        }
+
+class AuthorResolver:
+    # Email -> (user id, display name), looked up once per batch and kept in a bounded cache across batches
+    def __init__(self, db):
+        self.db = db
+        self.authors = {}
+
+    def resolve(self, emails):
+        emails = set(emails)
+        if len(self.authors) + len(emails) > AUTHOR_CACHE_SIZE:
+            self.authors.clear()
+        missing = [email for email in emails if email not in self.authors]
+        if missing:
+            self.authors.update({email: None for email in missing})
+            rows = self.db.execute(select(User.email, User.id, User.display_name).where(User.email.in_(missing)))
+            self.authors.update({email: (user_id, name) for email, user_id, name in rows})
+        return self.authors
+
+def copy_rows(db, rows):
+    # COPY is the fastest way into Postgres, the rows go through as CSV
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in COPY_COLUMNS])
+    buffer.seek(0)
+    cursor = db.connection().connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY content ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def insert_batch(db, rows):
+    if db.get_bind().dialect.driver == "psycopg2":
+        copy_rows(db, rows)
+    else:
+        db.execute(insert(Content), rows)  # executemany
+    recount_authors(db, {row["created_by"] for row in rows})
+    db.commit()
+
+def flush_batch(db, batch, authors, result):
+    resolved = authors.resolve(email for _, email, _ in batch)
+    rows = []
+    for line, email, row in batch:
+        author = resolved.get(email)
+        if author is None:
+            result.error(line, f"No user with email {email}.")
+            continue
+        row["created_by"], row["author_name"] = author
+        rows.append(row)
+    if not rows:
+        return
+    try:
+        insert_batch(db, rows)
+        result.imported += len(rows)
+    except Exception as e:
+        db.rollback()
+        # The batch is one transaction, report it once with the lines it covered
+        result.error(f"{batch[0][0]}-{batch[-1][0]}", f"Batch not imported: {str(e).splitlines()[0]}")
+        result.failed += len(rows) - 1
+
+# Memory stays bounded by the batch size whatever the size of the stream
+def import_quotes(db, stream, fmt, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    result = ImportResult()
+    authors = AuthorResolver(db)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    batch = []
+    for line, record in read_records(stream, fmt):
+        try:
+            email, row = parse_record(record, now)
+        except (ValueError, TypeError, KeyError) as e:
+            result.error(line, str(e))
+            continue
+        batch.append((line, email, row))
+        if len(batch) >= batch_size:
+            flush_batch(db, batch, authors, result)
+            batch = []
+            if progress:
+                progress(result)
+    if batch:
+        flush_batch(db, batch, authors, result)
+
+    if result.imported:
+        # One signal for the whole import, the caches and indexes reset instead of updating row by row
+        content_changed.send(None, content_id=None, action="imported")
+    return result
+
+def export_query(status=None):
+    query = (
+        select(Content.id, Content.quote, Content.status, User.email.label("author_email"), Content.created_at, Content.updated_at)
+        .join(User, Content.created_by == User.id)
+        .order_by(Content.created_at, Content.id)
+    )
+    if status:
+        query = query.where(Content.status == status)
+    return query
+
+def export_record(row):
+    return {
+        "id": str(row.id),
+        "quote": row.quote,
+        "status": row.status,
+        "author_email": row.author_email,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+    }
+
+# Yields the export as text chunks, read from a server-side cursor so the table is never held in memory.
+# Opens its own session, the generator can outlive the request that started it
+def export_quotes(fmt, status=None, stats=None):
+    def generate():
+        with SessionLocal() as db:
+            rows = db.execute(export_query(status).execution_options(yield_per=EXPORT_BATCH_SIZE))
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+                writer.writeheader()
+                for partition in rows.partitions():
+                    for row in partition:
+                        writer.writerow(export_record(row))
+                    if stats is not None:
+                        stats["rows"] += len(partition)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for partition in rows.partitions():
+                    if stats is not None:
+                        stats["rows"] += len(partition)
+                    yield "".join(json.dumps(export_record(row)) + "\n" for row in partition)
+
+    return generate()
+
+quotes_cli = AppGroup("quotes", help="Bulk import and export of quotes.")
+
+@quotes_cli.command("import", help="Import quotes from a JSONL or CSV file, authors are matched by author_email.")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+def import_command(path, fmt, batch_size):
+    fmt = fmt or format_from_filename(path)
+
+    def progress(result):
+        stats = result.to_dict()
+        click.echo(f"{stats['imported']} imported, {stats['failed']} failed, {stats['rows_per_sec']:.0f} rows/sec")
+
+    with SessionLocal() as db, open(path, newline="", encoding="utf-8") as stream:
+        stats = import_quotes(db, stream, fmt, batch_size, progress).to_dict()
+    for error in stats["errors"]:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Done: {stats['imported']} imported, {stats['failed']} failed in {stats['seconds']}s "
+               f"({stats['rows_per_sec']:.0f} rows/sec)")
+
+@quotes_cli.command("export", help='Export quotes to a JSONL or CSV file ("-" for stdout).')
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option("--status", type=click.Choice(STATUSES), help="Only quotes with this status.")
+def export_command(path, fmt, status):
+    fmt = fmt or format_from_filename(path)
+    started = time.perf_counter()
+    stats = {"rows": 0}
+    with click.open_file(path, "w", encoding="utf-8") as out:
+        for chunk in export_quotes(fmt, status, stats):
+            out.write(chunk)
+    rows = stats["rows"]
+    seconds = time.perf_counter() - started
+    click.echo(f"Exported {rows} quotes in {seconds:.1f}s ({rows / seconds if seconds else 0:.0f} rows/sec)", err=True)
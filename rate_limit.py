@@ -0,0 +1,65 @@
+# rate_limit.py
+# Rate limits counted in storage shared by every worker: RATELIMIT_STORAGE_URI is "memory://" (one process,
+# for development and tests) or "redis://host:6379" for any server speaking the Redis protocol
+import os
+from dotenv import load_dotenv
+from flask import jsonify, request, session
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from utils import handle_error
+
+# Load environment variables from .env file
+load_dotenv()
+
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+# "sliding-window-counter" or "moving-window" (exact, more storage), "fixed-window" allows bursts at window edges
+RATELIMIT_STRATEGY = os.getenv("RATELIMIT_STRATEGY", "sliding-window-counter")
+
+LOGIN_LIMIT = os.getenv("RATELIMIT_LOGIN", "5 per minute")  # login attempts per client address
+LOGIN_ACCOUNT_LIMIT = os.getenv("RATELIMIT_LOGIN_ACCOUNT", "10 per hour")  # failed logins per email, from any address
+REGISTER_LIMIT = os.getenv("RATELIMIT_REGISTER", "10 per hour")  # registrations per client address
+MUTATION_LIMIT = os.getenv("RATELIMIT_MUTATIONS", "60 per minute")  # quote changes per user
+
+def account_key():
+    return "account:" + request.form.get("email", "").strip().lower()
+
+def user_key():
+    user_id = session.get("user_id")
+    return f"user:{user_id}" if user_id else get_remote_address()
+
+# The create and edit forms are only changes when posted, delete and ban change on GET
+def viewing_form():
+    return request.method == "GET" and request.endpoint in ("create_content", "update_content")
+
+def failed_login(response):
+    return response.status_code != 302
+
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
+    key_prefix="lovequotes",
+    # Keep limiting per process if the shared storage goes down
+    in_memory_fallback_enabled=True,
+)
+
+# Limits are checked before the view runs, so a throttled login never reaches the argon2 verification.
+# Only failed logins count against the account, its owner can still log in from elsewhere
+def limit_login(view):
+    view = limiter.limit(LOGIN_ACCOUNT_LIMIT, key_func=account_key, methods=["POST"], deduct_when=failed_login)(view)
+    return limiter.limit(LOGIN_LIMIT, methods=["POST"])(view)
+
+def limit_register(view):
+    return limiter.limit(REGISTER_LIMIT, methods=["POST"])(view)
+
+# Shared by every route that changes quotes, one budget per user
+mutation_limit = limiter.shared_limit(MUTATION_LIMIT, scope="mutations", key_func=user_key, exempt_when=viewing_form)
+
+def too_many_requests(error):
+    if request.path.startswith("/api/"):
+        return jsonify({"error": "Too many requests, try again later."}), 429
+    return handle_error("Too many requests, try again later."), 429
+
+# Storage URI for limits.aio in the ASGI app (asgi.py), same server as the WSGI workers
+def async_storage_uri():
+    return RATELIMIT_STORAGE_URI if RATELIMIT_STORAGE_URI.startswith("async+") else "async+" + RATELIMIT_STORAGE_URI
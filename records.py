@@ -0,0 +1,75 @@
+# records.py
+# Read models for the templates and the JSON routes: slotted records built from the projected columns of
+# a query, instead of ORM entities (identity map, change tracking, lazy loads) or one dict per row.
+# UUIDs are turned into strings once, when the record is built, not at every use in a template
+from sqlalchemy import select
+from models import Content, ContentArchive
+
+class QuoteRecord:
+    __slots__ = ("id", "quote", "status", "created_by", "created_at", "posts_by", "can_edit", "can_ban")
+
+    def __init__(self, id, quote, status, created_by, created_at, posts_by):
+        self.id = str(id)
+        self.quote = quote
+        self.status = status
+        self.created_by = str(created_by) if created_by else None
+        self.created_at = created_at
+        self.posts_by = posts_by
+        # Action buttons of the viewer, set by feed.with_capabilities
+        self.can_edit = False
+        self.can_ban = False
+
+    # A row of feed.feed_columns()
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.id, row.quote, row.status, row.created_by, row.created_at, row.posts_by)
+
+class SearchRecord(QuoteRecord):
+    __slots__ = ("score",)
+
+    def __init__(self, id, quote, status, created_by, created_at, posts_by, score):
+        super().__init__(id, quote, status, created_by, created_at, posts_by)
+        self.score = score
+
+    @classmethod
+    def from_row(cls, row, score):
+        return cls(row.id, row.quote, row.status, row.created_by, row.created_at, row.posts_by, score)
+
+# One user of the Manage Roles directory, a row of user_directory.directory_columns()
+class UserRecord:
+    __slots__ = ("id", "first_name", "last_name", "email", "role", "quote_count", "active_quote_count")
+
+    def __init__(self, id, first_name, last_name, email, role, quote_count, active_quote_count):
+        self.id = str(id)
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        self.role = role
+        self.quote_count = quote_count
+        self.active_quote_count = active_quote_count
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.id, row.first_name, row.last_name, row.email, row.role, row.quote_count, row.active_quote_count)
+
+# What the edit form shows and checks
+class QuoteFormRecord:
+    __slots__ = ("id", "quote", "status", "created_by")
+
+    def __init__(self, id, quote, status, created_by):
+        self.id = str(id)
+        self.quote = quote
+        self.status = status
+        self.created_by = str(created_by) if created_by else None
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.id, row.quote, row.status, row.created_by)
+
+# The quote for the edit form, from content or, when it was archived (archive.py), from content_archive.
+# One query for the sync and the async routes
+def quote_form_select(content_id):
+    return select(Content.id, Content.quote, Content.status, Content.created_by).where(Content.id == content_id).union_all(
+        select(ContentArchive.id, ContentArchive.quote, ContentArchive.status, ContentArchive.created_by)
+        .where(ContentArchive.id == content_id)
+    ).limit(1)
@@ -0,0 +1,200 @@
+# search.py
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+from flask import has_app_context
+from sqlalchemy import case, func, literal_column, or_, select
+from database import SessionLocal, get_engine
+from events import content_changed
+from models import ACTIVE, Content, User
+from records import SearchRecord
+from utils import get_db
+
+# Load environment variables from .env file
+load_dotenv()
+
+# "postgres" uses the tsvector column and GIN indexes from migrations/versions/0003,
+# "memory" a per-process inverted index for SQLite and local testing, "auto" picks by database
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+
+PAGE_SIZE = 20
+MAX_QUERY_LENGTH = 200
+# No stemming so tokens match the memory index, spelled like the index expressions in 0003
+TS_CONFIG = literal_column("'simple'::regconfig")
+
+_token_re = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    return _token_re.findall((text or "").lower())
+
+def result_to_json(result):
+    return {
+        "id": result.id,
+        "quote": result.quote,
+        "created_by": result.created_by,
+        "created_at": result.created_at.isoformat() if result.created_at else None,
+        "posts_by": result.posts_by,
+        "score": round(result.score, 6),
+    }
+
+# Only Active quotes are searchable: Inactive ones are deleted and the text of banned ones is hidden
+class PostgresSearch:
+    def search(self, db, text, page=1):
+        query = func.plainto_tsquery(TS_CONFIG, text)
+        # The generated column isn't mapped on Content so the model keeps working on SQLite
+        search_vector = literal_column("content.search_vector")
+        author_vector = func.to_tsvector(TS_CONFIG, func.coalesce(User.first_name, "") + " " + func.coalesce(User.last_name, ""))
+        matching_authors = select(User.id).where(author_vector.op("@@")(query))
+        # Quote matches rank by ts_rank, quotes matched only through the author name get a flat score
+        score = func.ts_rank(search_vector, query) + case((Content.created_by.in_(matching_authors), 0.1), else_=0.0)
+
+        rows = (
+            db.query(
+                Content.id,
+                Content.quote,
+                Content.status,
+                Content.created_by,
+                Content.created_at,
+                Content.author_name.label("posts_by"),  # denormalized, see authors.py
+                score.label("score"),
+            )
+            .filter(Content.status == ACTIVE)
+            .filter(or_(search_vector.op("@@")(query), Content.created_by.in_(matching_authors)))
+            .order_by(literal_column("score").desc(), Content.created_at.desc(), Content.id.desc())
+            .offset((page - 1) * PAGE_SIZE)
+            .limit(PAGE_SIZE + 1)
+            .all()
+        )
+        return [SearchRecord.from_row(row, float(row.score)) for row in rows]
+
+# Inverted index over quote and author tokens, built from the database on the first search
+# and kept up to date from the content_changed signal
+class MemorySearch:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.postings = defaultdict(dict)  # token -> {content id: term count}
+        self.documents = {}  # content id -> (row, tokens)
+
+    def rows_query(self, db):
+        return (
+            db.query(
+                Content.id,
+                Content.quote,
+                Content.status,
+                Content.created_by,
+                Content.created_at,
+                Content.author_name.label("posts_by"),  # denormalized, see authors.py
+            )
+            .filter(Content.status == ACTIVE)
+        )
+
+    def ensure_loaded(self, db):
+        with self.lock:
+            if self.loaded:
+                return
+            for row in self.rows_query(db).execution_options(yield_per=1000):
+                self.add(row)
+            self.loaded = True
+
+    def add(self, row):
+        with self.lock:
+            self.remove(row.id)
+            counts = Counter(tokenize(row.quote) + tokenize(row.posts_by))
+            for token, count in counts.items():
+                self.postings[token][row.id] = count
+            self.documents[row.id] = (row, counts)
+
+    def remove(self, content_id):
+        with self.lock:
+            document = self.documents.pop(content_id, None)
+            if document is None:
+                return
+            for token in document[1]:
+                postings = self.postings.get(token)
+                if postings is not None:
+                    postings.pop(content_id, None)
+                    if not postings:
+                        del self.postings[token]
+
+    # Forget everything, the index is rebuilt on the next search
+    def reset(self):
+        with self.lock:
+            self.loaded = False
+            self.postings.clear()
+            self.documents.clear()
+
+    # Re-read one quote after a change, it leaves the index unless it's Active
+    def refresh(self, db, content_id):
+        with self.lock:
+            if not self.loaded:
+                return
+            row = self.rows_query(db).filter(Content.id == content_id).first()
+            if row is None:
+                self.remove(content_id)
+            else:
+                self.add(row)
+
+    def search(self, db, text, page=1):
+        self.ensure_loaded(db)
+        tokens = set(tokenize(text))
+        if not tokens:
+            return []
+
+        with self.lock:
+            # Every token must match, like plainto_tsquery
+            postings = [self.postings.get(token, {}) for token in tokens]
+            if not all(postings):
+                return []
+            total = len(self.documents)
+            candidates = set.intersection(*(set(p) for p in sorted(postings, key=len)))
+            scored = []
+            for content_id in candidates:
+                score = sum(p[content_id] * math.log(1 + total / len(p)) for p in postings)
+                row = self.documents[content_id][0]
+                scored.append((score, row.created_at, row))
+
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        start = (page - 1) * PAGE_SIZE
+        return [SearchRecord.from_row(row, score) for score, _, row in scored[start:start + PAGE_SIZE + 1]]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend = SEARCH_BACKEND
+            if backend == "auto":
+                backend = "postgres" if get_engine().dialect.name == "postgresql" else "memory"
+            _backend = PostgresSearch() if backend == "postgres" else MemorySearch()
+    return _backend
+
+# Returns one page of results and whether there is a next page
+def search_quotes(db, text, page=1):
+    text = (text or "").strip()[:MAX_QUERY_LENGTH]
+    if not text:
+        return [], False
+    results = get_backend().search(db, text, max(page, 1))
+    return results[:PAGE_SIZE], len(results) > PAGE_SIZE
+
+# The Postgres index is maintained by the database, the memory one needs every change
+@content_changed.connect
+def update_search_index(sender, content_id=None, **kwargs):
+    backend = get_backend()
+    if not isinstance(backend, MemorySearch):
+        return
+    # Bulk changes (imports, batch moderation) are sent without a single content_id
+    if content_id is None:
+        backend.reset()
+        return
+    if has_app_context():
+        backend.refresh(get_db(), content_id)
+    else:
+        # Sent from the ASGI app (asgi.py), which has no Flask request session
+        with SessionLocal() as db:
+            backend.refresh(db, content_id)
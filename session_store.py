@@ -0,0 +1,229 @@
+# session_store.py
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+# Load environment variables from .env file
+load_dotenv()
+
+# "sqlite" (one file shared by the workers of a host) or "redis" (anything speaking the Redis protocol)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite3")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+# An unchanged session is written again only when it's older than this, to push its expiry forward
+SESSION_REFRESH_INTERVAL = int(os.getenv("SESSION_REFRESH_INTERVAL", 3600))  # seconds
+# Expired sqlite sessions are deleted in batches of this size, at most once per interval
+SESSION_SWEEP_BATCH = int(os.getenv("SESSION_SWEEP_BATCH", 500))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", 300))  # seconds
+
+# Payloads bigger than this are zlib compressed
+COMPRESS_MIN_SIZE = 256
+
+_serializer = TaggedJSONSerializer()  # compact JSON that round trips UUID, datetime, bytes, ...
+
+def dumps(data: dict):
+    raw = _serializer.dumps(data).encode()
+    if len(raw) >= COMPRESS_MIN_SIZE:
+        return b"z" + zlib.compress(raw)
+    return b"j" + raw
+
+def loads(payload: bytes):
+    if payload[:1] == b"z":
+        return _serializer.loads(zlib.decompress(payload[1:]).decode())
+    return _serializer.loads(payload[1:].decode())
+
+class SessionStore(ABC):
+    @abstractmethod
+    def load(self, sid):
+        ...
+
+    @abstractmethod
+    def save(self, sid, data: dict, ttl: int):
+        ...
+
+    @abstractmethod
+    def delete(self, sid):
+        ...
+
+    # Remove expired sessions, backends with native expiry don't need it
+    def sweep(self):
+        return 0
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path=SESSION_SQLITE_PATH, sweep_batch=SESSION_SWEEP_BATCH, sweep_interval=SESSION_SWEEP_INTERVAL):
+        self.path = path
+        self.sweep_batch = sweep_batch
+        self.sweep_interval = sweep_interval
+        self.local = threading.local()
+        self.sweep_lock = threading.Lock()
+        self.next_sweep = time.monotonic() + sweep_interval
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    # One connection per thread, WAL lets readers and the writer work at the same time
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self.connection().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return loads(row[0]) if row else None
+
+    def save(self, sid, data, ttl):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, dumps(data), time.time() + ttl),
+        )
+        self.maybe_sweep()
+
+    def delete(self, sid):
+        self.connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def maybe_sweep(self):
+        if time.monotonic() < self.next_sweep or not self.sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self.next_sweep = time.monotonic() + self.sweep_interval
+            self.sweep()
+        finally:
+            self.sweep_lock.release()
+
+    # Delete in small batches so the write lock is never held for long
+    def sweep(self):
+        deleted = 0
+        conn = self.connection()
+        while True:
+            count = conn.execute(
+                "DELETE FROM sessions WHERE rowid IN (SELECT rowid FROM sessions WHERE expires <= ? LIMIT ?)",
+                (time.time(), self.sweep_batch),
+            ).rowcount
+            deleted += count
+            if count < self.sweep_batch:
+                return deleted
+
+class RedisSessionStore(SessionStore):
+    # client: anything with get/set/delete of the redis-py API (redis.Redis, a local stand-in, ...)
+    def __init__(self, client=None, url=SESSION_REDIS_URL, prefix="session:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("SESSION_BACKEND=redis needs the redis package (pip install redis).") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def load(self, sid):
+        payload = self.client.get(self.prefix + sid)
+        return loads(payload) if payload else None
+
+    # Redis expires the key by itself
+    def save(self, sid, data, ttl):
+        self.client.set(self.prefix + sid, dumps(data), ex=max(int(ttl), 1))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+def create_store(backend=SESSION_BACKEND):
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+def new_sid():
+    return secrets.token_urlsafe(32)
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, saved_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.saved_at = saved_at  # when the store copy was last written, None if never
+        self.modified = False
+        self.replaced_sid = None  # deleted from the store when the session is saved
+
+    # At login: a session id known before it (set by someone else, in a shared browser, ...) must not
+    # become an authenticated session
+    def regenerate(self):
+        if self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = new_sid()
+        self.modified = True
+
+# Session data lives in the store, the cookie only holds the signed session id
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    def get_signer(self, app):
+        return Signer(app.secret_key, salt="server-side-session")
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self.get_signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                stored = self.store.load(sid)
+                if stored is not None:
+                    saved_at = stored.pop("_saved_at", None)
+                    return ServerSideSession(stored, sid=sid, saved_at=saved_at)
+        return ServerSideSession(sid=new_sid())
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+
+        # Emptied session (logout): remove it from the store and the browser
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        stale = session.saved_at is None or now - session.saved_at > SESSION_REFRESH_INTERVAL
+        if not session.modified and not stale:
+            return
+
+        ttl = int(app.permanent_session_lifetime.total_seconds()) if session.permanent else 86400
+        self.store.save(session.sid, {**session, "_saved_at": now}, ttl)
+
+        response.set_cookie(
+            name,
+            self.get_signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
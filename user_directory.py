@@ -0,0 +1,66 @@
+# user_directory.py
+from sqlalchemy import or_, select
+from models import Role, User
+from records import UserRecord
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Only the columns the directory shows: no password_hash or bio, and the role name comes from the same query
+def directory_columns():
+    return (
+        User.id, User.first_name, User.last_name, User.email, Role.name.label("role"),
+        User.quote_count, User.active_quote_count,
+    )
+
+def directory_query(db, **filters):
+    return apply_filters(db.query(*directory_columns()), **filters)
+
+# Same query as a select(), for the async routes in asgi.py
+def directory_select(**filters):
+    return apply_filters(select(*directory_columns()), **filters)
+
+def apply_filters(query, search=None, exclude_user_id=None, exclude_roles=("superadmin",)):
+    query = query.join(Role, User.role_id == Role.id)
+    if exclude_user_id is not None:
+        query = query.filter(User.id != exclude_user_id)
+    if exclude_roles:
+        query = query.filter(Role.name.notin_(exclude_roles))
+    if search:
+        pattern = f"%{search.strip()}%"
+        query = query.filter(or_(
+            User.email.ilike(pattern),
+            User.first_name.ilike(pattern),
+            User.last_name.ilike(pattern),
+        ))
+    return query.order_by(User.email)
+
+# Keyset pagination on the unique email, cursor is the last email of the previous page
+def fetch_page(db, cursor=None, limit=DEFAULT_PAGE_SIZE, **filters):
+    limit = clamp_page_size(limit)
+    query = directory_query(db, **filters)
+    if cursor:
+        query = query.filter(User.email > cursor)
+    return build_page(query.limit(limit + 1), limit)
+
+def clamp_page_size(limit):
+    return min(limit, MAX_PAGE_SIZE) if limit and limit > 0 else DEFAULT_PAGE_SIZE
+
+def build_page(rows, limit):
+    records = [UserRecord.from_row(row) for row in rows]
+    next_cursor = None
+    if len(records) > limit:
+        del records[limit:]
+        next_cursor = records[-1].email
+    return records, next_cursor
+
+def row_to_json(row):
+    return {
+        "id": row.id,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "email": row.email,
+        "role": row.role,
+        "quote_count": row.quote_count,
+        "active_quote_count": row.active_quote_count,
+    }
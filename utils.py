@@ -1,32 +1,53 @@
 # utils.py
 import os
 import re
-from passlib.context import CryptContext
+import time
+import passwords
+from functools import wraps
+from database import DB_REPLICA_CHECK_INTERVAL, DB_REPLICA_MAX_LAG, SessionLocal, replica_router
+from models import User
+from permissions import has_permission
+from principals import Principal, principal_cache
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
-from flask_session import Session
-from sqlalchemy.orm import joinedload, sessionmaker, Session as DBSession
+from flask import g, request, jsonify, render_template, session, redirect, url_for
+from sqlalchemy.orm import joinedload, Session as DBSession
 from werkzeug.exceptions import Unauthorized
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "mysecretkey")  # Secret key for sessions
-app.config["SESSION_TYPE"] = "filesystem"
-app.config['SESSION_PERMANENT'] = True  # Session should last even after browser is closed
-Session(app)  # Initialize session management
-
-# Dependency to get the database session 
+# Database session for the current request, created on first use and closed by close_db on teardown
 def get_db():
-    from database import engine
-    # Create a sessionmaker to manage database sessions
-    # SQLAlchemy will not sent auto commit, no saveing to buffer when query, bind session to engin tell session where is the database to connect
-    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
-    try:
-        yield db
-    finally:
-        db.close()
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+def close_db(exception=None):
+    db = g.pop("db", None)
+    if db is not None:
+        if exception is not None:
+            db.rollback()
+        db.close()  # returns the connection to the pool
+
+# Read-your-writes: after a request that wrote, the client reads from the primary until every replica
+# still in use has caught up (a replica is dropped past DB_REPLICA_MAX_LAG, checked every DB_REPLICA_CHECK_INTERVAL)
+READ_PRIMARY_SECONDS = DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL
+
+# Route guard for pages that only read: on GET their SELECTs may go to a read replica (database.py)
+def replica_reads(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if replica_router.urls and request.method in ("GET", "HEAD") and session.get("read_primary_until", 0) < time.time():
+            get_db().info["replica_reads"] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+# after_request: remember in the session that this client just wrote, see READ_PRIMARY_SECONDS
+def remember_writes(response):
+    db = g.get("db")
+    if replica_router.urls and db is not None and db.info.get("wrote"):
+        session["read_primary_until"] = time.time() + READ_PRIMARY_SECONDS
+    return response
 
 # Function to validate email format
 def is_valid_email(email: str):
@@ -37,36 +58,80 @@ def is_valid_password(password: str):
     password_regex = r'^(?=.*[A-Z])(?=.*[!@#$%^&*()_+?|])(?=.{8,})'
     return re.match(password_regex, password) is not None
 
-# Hash the password 
+# Hash the password, see passwords.py for the argon2 settings and the hashing pool
 def hash_password(password: str):
-    pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-    return pwd_context.hash(password)  # hashes and salts the password
+    return passwords.hash_password(password)  # hashes and salts the password
 
 def check_password(plain_password: str, stored_hash: str):
-    pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-    if not pwd_context.verify(plain_password, stored_hash):
-        return False
-    return True
+    return passwords.verify_password(plain_password, stored_hash)
 
+# Returns the logged in user's Principal (id and role), from the cache when possible
 def get_current_user():
-    from models import User
     user_id = session.get("user_id")
     if not user_id:
         return None
 
-    db: Session = next(get_db())
+    # Once per request
+    if g.get("principal") is not None and g.principal.id == user_id:
+        return g.principal
+
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        g.principal = principal
+        return principal
+
+    db: DBSession = get_db()
     user = (
         db.query(User)
         .options(joinedload(User.role))  # Eagerly load the role relationship
         .filter(User.id == user_id)
         .first()
     )
-    db.close()  # Close the session after fetching the user
-    return user
+    if not user:
+        return None
+
+    principal = Principal.from_user(user)
+    # Read from a replica the role may be a change behind, keep it for this request only
+    if db.info.get("replica") is None:
+        principal_cache.put(user_id, principal)
+    g.principal = principal
+    return principal
 
+# O(1): one bit of the role's mask from the in-memory role map, no database query
 def check_permission(user, permission):
-    role = user.role
-    return permission in role.permissions
+    return has_permission(user.role.name, permission)
 
 def handle_error(error_message):
     return render_template("error.html", message=error_message)
+
+# Route guards: @permission_required("ban", "Unauthorized to ban content.")
+# Pages redirect to the login when nobody is logged in, with api=True the answer is JSON 401/403
+def permission_required(permission, message, api=False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = get_current_user()
+            if not user:
+                if api:
+                    return jsonify({"error": "Login required."}), 401
+                return redirect(url_for("login"))
+            if not check_permission(user, permission):
+                if api:
+                    return jsonify({"error": message}), 403
+                return handle_error(message)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not get_current_user():
+            return redirect(url_for("login"))
+        return view(*args, **kwargs)
+    return wrapper
+
+# Permissions of the logged in user for the templates, `'ban' in permissions`
+def inject_permissions():
+    user = get_current_user()
+    return {"permissions": user.role.permissions if user else frozenset()}
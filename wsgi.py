@@ -0,0 +1,5 @@
+# wsgi.py
+# WSGI entry point for gunicorn: `gunicorn wsgi:app`, settings and warm-up hooks in gunicorn.conf.py
+from app import create_app
+
+app = create_app()